@@ -8,18 +8,32 @@ import io
 import json
 import pandas as pd
 import smtplib
-from email.mime.application import MIMEApplication
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
 from datetime import datetime
 import streamlit as st
 from reportlab.lib.pagesizes import A4
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image, PageBreak
 import base64
+import uuid
 import plotly.express as px
 import numpy as np
+import storage
+import charts
+import analytics
+import tracing
+import reports
+import digest
+import sync
+import importer
+import prices
+import forecast
+import pdfstore
+import vehicles
+import duckdb_backend
+import warmer
+import journal
+import tempfile
 
 # ===========================
 # Configurações iniciais / settings
@@ -355,20 +369,23 @@ if not os.path.exists(SETTINGS_PATH):
 if not os.path.exists(CSS_PATH):
     create_default_css()
 
+@st.cache_data(show_spinner=False)
+def _read_settings(path, mtime):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
 def load_settings():
+    # Relido só quando o arquivo muda (mtime), não a cada rerun.
     if os.path.exists(SETTINGS_PATH):
         try:
-            with open(SETTINGS_PATH, "r", encoding="utf-8") as f:
-                return json.load(f)
+            return dict(_read_settings(SETTINGS_PATH, os.path.getmtime(SETTINGS_PATH)))
         except Exception:
             return {}
     return {}
 
 def save_settings(s):
     try:
-        target = SETTINGS_PATH
-        with open(target, "w", encoding="utf-8") as f:
-            json.dump(s, f, indent=2, ensure_ascii=False)
+        storage.write_json_atomic(s, SETTINGS_PATH)
         return True
     except Exception as e:
         st.error(f"Erro ao salvar os dados: {e}")
@@ -391,21 +408,43 @@ USERS = {
 }
 
 USER_PERMISSIONS = {
-    "Antonio Edinaldo": ["requisicoes", "dashboard", "narrativas"],
+    "Antonio Edinaldo": ["requisicoes", "dashboard", "veiculos", "narrativas"],
     "Antonio Alfredo": ["requisicoes"],
     "Rosimere Marques": ["requisicoes"],
     "Irisvan Martins": ["requisicoes"],
-    "ADMINISTRADOR": ["requisicoes", "dashboard", "narrativas", "configuracoes"]
+    "ADMINISTRADOR": ["requisicoes", "dashboard", "veiculos", "narrativas", "configuracoes"]
+}
+
+# Setores (shards dos dados) de cada usuário; None = todos. O administrador pode
+# redistribuí-los em Configurações ("setores_por_usuario" no settings.json).
+USER_SETORES = {
+    "Antonio Edinaldo": None,
+    "Antonio Alfredo": ["Granjas de produção", "Granjas Matrizes", "Incubatório"],
+    "Rosimere Marques": ["Abatedouro", "CD Paraíso"],
+    "Irisvan Martins": ["Fábrica Tocantinópolis", "Fábrica de Araguaína"],
+    "ADMINISTRADOR": None,
 }
 
+def setores_do_usuario(usuario):
+    """Setores que a sessão do usuário carrega e edita (None = todos)."""
+    if usuario == "ADMINISTRADOR":
+        return None
+    configurados = _settings.get("setores_por_usuario", {})
+    return configurados[usuario] if usuario in configurados else USER_SETORES.get(usuario, [])
+
 # ===========================
 # Funções de Estilo
 # ===========================
+@st.cache_data(show_spinner=False)
+def _read_css(css_file_path, mtime):
+    with open(css_file_path, "r", encoding="utf-8") as f:
+        return f.read()
+
 def load_and_inject_css(css_file_path):
-    """Lê um arquivo CSS e injeta os estilos na página do Streamlit."""
+    """Lê um arquivo CSS (em cache) e injeta os estilos na página do Streamlit."""
     if os.path.exists(css_file_path):
-        with open(css_file_path, "r", encoding="utf-8") as f:
-            st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
+        css = _read_css(css_file_path, os.path.getmtime(css_file_path))
+        st.markdown(f'<style>{css}</style>', unsafe_allow_html=True)
     else:
         st.error(f"Arquivo CSS não encontrado: {css_file_path}")
 
@@ -443,51 +482,91 @@ def is_valid_email(email: str) -> bool:
         return False
     return re.match(r"[^@]+@[^@]+\.[^@]+", email) is not None
 
+def _smtp_connect(settings):
+    """Abre e autentica uma conexão SMTP com as configurações salvas."""
+    smtp_server = settings.get("smtp_server")
+    smtp_port = settings.get("smtp_port")
+    with tracing.trace("smtp_handshake"):
+        if smtp_port == 465:
+            server = smtplib.SMTP_SSL(smtp_server, smtp_port)
+        else:
+            server = smtplib.SMTP(smtp_server, smtp_port)
+            if settings.get("smtp_use_tls", True):
+                server.starttls()
+        server.login(settings.get("smtp_user"), settings.get("smtp_password"))
+    return server
+
+@tracing.traced()
 def send_email_with_pdf(to_email: str, subject: str, body: str, pdf_data: bytes, filename: str):
     settings = load_settings()
     smtp_server = settings.get("smtp_server")
     smtp_port = settings.get("smtp_port")
     smtp_user = settings.get("smtp_user")
     smtp_password = settings.get("smtp_password")
-    smtp_use_tls = settings.get("smtp_use_tls", True)
 
     if not all([smtp_server, smtp_port, smtp_user, smtp_password, to_email]):
         st.error("Configurações de SMTP incompletas. Verifique a página 'Configurações'.")
         return False
     
-    msg = MIMEMultipart()
-    msg['From'] = smtp_user
-    msg['To'] = to_email
-    msg['Subject'] = subject
-
-    msg.attach(MIMEText(body, 'html'))
-    part = MIMEApplication(pdf_data, _subtype="pdf")
-    part.add_header('Content-Disposition', 'attachment', filename=filename)
-    msg.attach(part)
+    msg = digest.build_message(smtp_user, to_email, subject, body, pdf_data, filename)
 
     try:
-        if smtp_port == 465:
-            server = smtplib.SMTP_SSL(smtp_server, smtp_port)
-        else:
-            server = smtplib.SMTP(smtp_server, smtp_port)
-            if smtp_use_tls:
-                server.starttls()
-        
-        with server:
-            server.login(smtp_user, smtp_password)
+        server = _smtp_connect(settings)
+        with server, tracing.trace("smtp_envio", bytes=len(pdf_data)):
             server.send_message(msg)
         return True
     except Exception as e:
         st.error(f"Erro ao enviar e-mail: {e}. Verifique as configurações de SMTP e a senha do aplicativo (se for o caso).")
         return False
 
+def _enviar_resumos(force=False):
+    """Envia os resumos por posto vencidos; chamado pela thread de fundo e pelo administrador."""
+    # Lido direto do arquivo: a thread de fundo não tem contexto de sessão do Streamlit.
+    with open(SETTINGS_PATH, "r", encoding="utf-8") as f:
+        settings = json.load(f)
+    if not settings.get("resumo_ativo") and not force:
+        # Resumo desligado: nada novo entra na fila (o formulário só oferece envio imediato)
+        # e o que ficou dela sai no próximo ciclo, sem esperar horário.
+        if not digest.pending(DATA_FILE_PATH):
+            return {}
+        force = True
+    return digest.flush(lambda: _smtp_connect(settings), generate_digest_pdf, settings.get("smtp_user"),
+                        DATA_FILE_PATH, horarios=settings.get("resumo_horarios"), force=force,
+                        on_sent=_guardar_pdf)
+
+def _guardar_pdf(ids, pdf_data, nome):
+    """Cópia do PDF enviado no armazém, vinculada às requisições `ids`."""
+    try:
+        pdfstore.link(ids, pdfstore.put(pdf_data, DATA_FILE_PATH), nome, DATA_FILE_PATH)
+    except Exception:
+        # Falhar ao arquivar a cópia não desfaz um envio que já aconteceu.
+        return None
+
+@st.cache_resource
+def _log_desempenho():
+    """Abre o log de desempenho uma vez por processo (não a cada rerun)."""
+    tracing.configure()
+
+@st.cache_resource
+def _agendador_resumos():
+    return digest.start_scheduler(_enviar_resumos)
+
+@st.cache_resource
+def _aquecedor():
+    """Mantém quentes os caches do dashboard, das narrativas e dos índices (uma thread por processo)."""
+    return warmer.CacheWarmer([
+        ("dashboard", _aquecer_dashboard),
+        ("narrativas", lambda versao: _estatisticas_narrativa(versao, None, None, None)),
+        ("precos", _indice_precos),
+        ("placas", lambda versao: _indice_placas()),
+        ("veiculos", lambda versao: _linhas_do_tempo(versao, None)),
+    ], DATA_FILE_PATH).start()
+
 # ===========================
 # Geração de PDF
 # ===========================
-def generate_request_pdf(payload: dict) -> bytes:
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=36, leftMargin=36, topMargin=36, bottomMargin=36)
-    styles = getSampleStyleSheet()
+def _request_story(payload: dict, styles) -> list:
+    """Elementos do PDF de uma requisição (logo, cabeçalho, dados, assinatura)."""
     story = []
 
     if payload.get("logo_path") and os.path.exists(payload["logo_path"]):
@@ -552,6 +631,27 @@ def generate_request_pdf(payload: dict) -> bytes:
     story.append(Spacer(1, 25))
     story.append(Paragraph("Quilometragem atual: _________________________"))
 
+    return story
+
+@tracing.traced()
+def generate_request_pdf(payload: dict) -> bytes:
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=36, leftMargin=36, topMargin=36, bottomMargin=36)
+    doc.build(_request_story(payload, getSampleStyleSheet()))
+    buffer.seek(0)
+    return buffer.getvalue()
+
+@tracing.traced()
+def generate_digest_pdf(payloads: list) -> bytes:
+    """Um PDF com várias requisições, uma por página, para o resumo do posto."""
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=36, leftMargin=36, topMargin=36, bottomMargin=36)
+    styles = getSampleStyleSheet()
+    story = []
+    for i, payload in enumerate(payloads):
+        if i:
+            story.append(PageBreak())
+        story.extend(_request_story(payload, styles))
     doc.build(story)
     buffer.seek(0)
     return buffer.getvalue()
@@ -559,34 +659,101 @@ def generate_request_pdf(payload: dict) -> bytes:
 # ===========================
 # Funções de persistência de dados
 # ===========================
+@tracing.traced()
 def load_data(filename=DATA_FILE_PATH):
-    """Carrega os dados de um arquivo CSV, se ele existir."""
-    if os.path.exists(filename):
-        try:
-            df = pd.read_csv(filename)
-            df['data'] = pd.to_datetime(df['data'], errors='coerce')
-            df['DataUso'] = pd.to_datetime(df['DataUso'], errors='coerce')
-            df['total_litros'] = pd.to_numeric(df['total_litros'], errors='coerce')
-            df['valor_total'] = pd.to_numeric(df['valor_total'], errors='coerce')
-            df['Odometro'] = pd.to_numeric(df['Odometro'], errors='coerce')
-            df['KmUso'] = pd.to_numeric(df['KmUso'], errors='coerce')
-            df['total_litros'] = df['total_litros'].fillna(0)
-            df['valor_total'] = df['valor_total'].fillna(0)
-            df['Odometro'] = df['Odometro'].fillna(0)
-            df['KmUso'] = df['KmUso'].fillna(0)
-            if 'Cidade' not in df.columns:
-                df['Cidade'] = ""
-            return df
-        except Exception as e:
-            st.error(f"Erro ao carregar os dados: {e}")
-            return pd.DataFrame()
-    return pd.DataFrame()
+    """Carrega a partição quente (meses abertos) só dos setores do usuário logado."""
+    try:
+        return storage.load_hot(filename, _setores_sessao())
+    except Exception as e:
+        st.error(f"Erro ao carregar os dados: {e}")
+        return pd.DataFrame()
+
+def _setores_sessao():
+    return setores_do_usuario(st.session_state.get('current_user'))
+
+def _usuario_sessao():
+    return st.session_state.get('current_user')
 
-def save_data(df, filename=DATA_FILE_PATH):
-    """Salva o DataFrame em um arquivo CSV."""
+def _versions():
+    return st.session_state.df_abastecimentos.set_index('id')['Versao'].to_dict()
+
+def _atualizar_indice_placas(versao_antes, rows=(), excluidos=(), filename=DATA_FILE_PATH):
+    """Aplica as linhas gravadas (com id) e as excluídas ao índice por placa, se ele refletia a versão anterior.
+
+    Senão outro processo gravou no meio: o próximo acesso ao índice aplica o diário de alterações.
+    """
+    indice = _indice_placas_global()
+    if indice.versao == versao_antes:
+        indice.observe_rows(rows)
+        indice.forget(excluidos, storage.data_version(filename))
+
+@tracing.traced()
+def append_data(rows, filename=DATA_FILE_PATH):
+    """Acrescenta requisições sob lock e devolve os ids atribuídos pela sequência."""
+    try:
+        antes = storage.data_version(filename)
+        st.session_state.df_abastecimentos, ids = storage.append_rows(
+            rows, filename, _setores_sessao(), usuario=_usuario_sessao())
+        _atualizar_indice_placas(antes, [{**row, 'id': i} for row, i in zip(rows, ids)], filename=filename)
+        _aquecedor().notify()
+        return ids
+    except Exception as e:
+        st.error(f"Erro ao salvar os dados: {e}")
+        return []
+
+@tracing.traced()
+def update_data(changes, filename=DATA_FILE_PATH):
+    """Atualiza campos ({id: {coluna: valor}}) conferindo a versão que a sessão leu."""
     try:
-        df.to_csv(filename, index=False)
+        antes = storage.data_version(filename)
+        hot = storage.update_rows(changes, _versions(), filename, _setores_sessao(),
+                                  usuario=_usuario_sessao())
+        st.session_state.df_abastecimentos = hot
+        _atualizar_indice_placas(antes, hot[hot['id'].isin(list(changes))].to_dict('records'), filename=filename)
+        _aquecedor().notify()
         return True
+    except storage.ConflictError as e:
+        st.session_state.df_abastecimentos = load_data(filename)
+        st.error(f"{e}. Os dados foram recarregados; refaça a operação.")
+        return False
+    except Exception as e:
+        st.error(f"Erro ao salvar os dados: {e}")
+        return False
+
+@tracing.traced()
+def update_many(ids, values, filename=DATA_FILE_PATH):
+    """Aplica os mesmos valores ({coluna: valor}) a várias requisições numa única gravação."""
+    try:
+        versoes = _versions()
+        antes = storage.data_version(filename)
+        hot = storage.update_where(
+            ids, values, {i: versoes.get(i) for i in ids}, filename, _setores_sessao(), usuario=_usuario_sessao())
+        st.session_state.df_abastecimentos = hot
+        _atualizar_indice_placas(antes, hot[hot['id'].isin(ids)].to_dict('records'), filename=filename)
+        _aquecedor().notify()
+        return True
+    except storage.ConflictError as e:
+        st.session_state.df_abastecimentos = load_data(filename)
+        st.error(f"{e}. Os dados foram recarregados; refaça a operação.")
+        return False
+    except Exception as e:
+        st.error(f"Erro ao salvar os dados: {e}")
+        return False
+
+@tracing.traced()
+def delete_data(ids, filename=DATA_FILE_PATH):
+    """Exclui requisições conferindo a versão que a sessão leu."""
+    try:
+        antes = storage.data_version(filename)
+        st.session_state.df_abastecimentos = storage.delete_rows(
+            ids, _versions(), filename, _setores_sessao(), usuario=_usuario_sessao())
+        _atualizar_indice_placas(antes, excluidos=ids, filename=filename)
+        _aquecedor().notify()
+        return True
+    except storage.ConflictError as e:
+        st.session_state.df_abastecimentos = load_data(filename)
+        st.error(f"{e}. Os dados foram recarregados; refaça a operação.")
+        return False
     except Exception as e:
         st.error(f"Erro ao salvar os dados: {e}")
         return False
@@ -594,6 +761,20 @@ def save_data(df, filename=DATA_FILE_PATH):
 # ===========================
 # Páginas da Aplicação
 # ===========================
+EDITABLE_COLUMNS = ['valor_total', 'Status', 'Odometro', 'DataUso', 'Observacoes']
+
+def _grid_changes(original, edited):
+    """Compara a grade exibida com a editada e devolve só as células alteradas."""
+    changes = {}
+    for col in EDITABLE_COLUMNS:
+        before, after = original[col], edited[col]
+        changed = ~((before == after) | (before.isna() & after.isna()))
+        for row_id, value in zip(edited.loc[changed, 'id'], after[changed]):
+            if col == 'DataUso':
+                value = pd.to_datetime(value, dayfirst=True, errors='coerce')
+            changes.setdefault(int(row_id), {})[col] = value
+    return changes
+
 def pagina_requisicoes():
     if "requisicoes" not in USER_PERMISSIONS.get(st.session_state.get("current_user"), []):
         st.warning("Você não tem permissão para acessar esta página.")
@@ -612,226 +793,495 @@ def pagina_requisicoes():
             st.markdown("<div style='padding-top: 15px;'>", unsafe_allow_html=True)
             if st.button("+ Nova Requisição"):
                 st.session_state.show_new_req_form = True
+                st.session_state.form_key = uuid.uuid4().hex
                 st.rerun()
             st.markdown("</div>", unsafe_allow_html=True)
     
     st.markdown("---")
     
     if st.session_state.get("show_new_req_form", False):
-        st.markdown("### Nova Requisição")
-        
-        POSTOS_LIST = ["R A Mendes", "Toca Da Onça", "Petronorte", "Linhares", "Posto Minas Gerais", "Boa Vista", "Medeiros", "Posto Americano", "Posto Milena", "NR Comercio Comb.", "Auto Posto Netinho", "Posto Oriente", "Posto R.S.F.", "Rede K"]
-        
-        with st.form("form_nova_req", clear_on_submit=False):
-            colA, colB, colC = st.columns(3)
-            with colA:
-                placa = st.text_input("Placa", max_chars=8, help="O hífen será adicionado automaticamente.", autocomplete="off")
-                condutor = st.text_input("Condutor", autocomplete="off")
-                supervisor = st.session_state.get('current_user')
-                st.info(f"{supervisor}")
-                setor = st.selectbox("Setor", ["Abatedouro", "Fábrica Tocantinópolis", "Granjas de produção", "Incubatório", "Granjas Matrizes", "CD Paraíso", "Fábrica de Araguaína"])
-                subsetor = st.selectbox("Subsetor", ["Congelados", "Transporte de funcionários", "Campo", "Pega de frango", "Integração"])
-                email_posto = st.text_input("E-mail do Posto", autocomplete="off")
-            with colB:
-                tipo_posto = st.selectbox("Referente do veículo", ["Próprio", "Terceiro"])
-                litros = st.number_input("Quantidade (L)", min_value=0.0, step=0.1, value=0.0)
-                tanque_cheio = st.checkbox("Tanque cheio")
-                combustivel = st.selectbox("Combustível", ["Gasolina", "Etanol", "Diesel S10", "Diesel S500", "Arla"])
-                posto = st.selectbox("Posto", POSTOS_LIST)
-            with colC:
-                data_req = st.date_input("Data da requisição", value=datetime.today(), disabled=True)
-                cidade = st.text_input("Cidade", autocomplete="off")
-                referente = st.text_area("Observações / Justificativa", height=80)
-
-            col_submit, col_cancel = st.columns([1, 1])
-            with col_submit:
-                enviar = st.form_submit_button("Enviar e-mail de requisição")
-            with col_cancel:
-                cancelar = st.form_submit_button("Cancelar")
-
-            if cancelar:
-                st.session_state.show_new_req_form = False
-                st.rerun()
-            
-            if enviar:
-                required_fields = {
-                    "Placa": placa, "Condutor": condutor, "Email do Posto": email_posto,
-                    "Posto": posto, "Setor": setor, "Subsetor": subsetor,
-                    "Referente do veículo": tipo_posto, "Combustível": combustivel,
-                    "Observações / Justificativa": referente, "Cidade": cidade
+        _form_nova_requisicao()
+    else:
+        _historico_requisicoes()
+        if st.session_state.get('current_user') == "ADMINISTRADOR":
+            if not st.session_state.df_abastecimentos.empty:
+                _acoes_administrador()
+            _historico_alteracoes()
+
+@st.fragment
+def _form_nova_requisicao():
+    """Formulário de nova requisição; interagir com ele só reexecuta este fragmento."""
+    st.markdown("### Nova Requisição")
+
+    resumo_ativo = load_settings().get("resumo_ativo", False)
+    POSTOS_LIST = ["R A Mendes", "Toca Da Onça", "Petronorte", "Linhares", "Posto Minas Gerais", "Boa Vista", "Medeiros", "Posto Americano", "Posto Milena", "NR Comercio Comb.", "Auto Posto Netinho", "Posto Oriente", "Posto R.S.F.", "Rede K"]
+
+    _dica_preco()
+
+    # A placa fica fora do form: ao digitá-la o fragmento reexecuta e os campos
+    # abaixo são pré-preenchidos com o último estado conhecido do veículo nos
+    # setores da sessão (o que outros setores registraram não aparece).
+    placa = st.text_input("Placa", max_chars=8, help="O hífen será adicionado automaticamente.", autocomplete="off")
+    estado = _indice_placas().get(format_placa(placa), _setores_sessao()) if placa else None
+    if estado:
+        ultima = estado["ultima_data"].strftime("%d/%m/%Y") if estado["ultima_data"] is not None else "—"
+        km_txt = f"{estado['odometro']:,.0f} km" if estado["odometro"] else "km não informado"
+        litros_txt = f"{estado['litros_tipicos']:,.1f} L em média" if estado["litros_tipicos"] else "sem litros registrados"
+        st.caption(f"🚗 Último abastecimento em {ultima} no posto {estado['ultimo_posto'] or '—'} · {km_txt} · "
+                   f"{litros_txt} · costuma usar {estado['combustivel'] or '—'}")
+    estado = estado or {}
+
+    with st.form("form_nova_req", clear_on_submit=False):
+        colA, colB, colC = st.columns(3)
+        with colA:
+            condutor = st.text_input("Condutor", value=estado.get("condutor", ""), autocomplete="off")
+            supervisor = st.session_state.get('current_user')
+            st.info(f"{supervisor}")
+            setores = _setores_sessao() or SETORES
+            setor = st.selectbox("Setor", setores, index=_posicao(setores, estado.get("setor")))
+            subsetor = st.selectbox("Subsetor", SUBSETORES, index=_posicao(SUBSETORES, estado.get("subsetor")))
+            email_posto = st.text_input("E-mail do Posto", value=estado.get("email_posto", ""), autocomplete="off")
+        with colB:
+            tipo_posto = st.selectbox("Referente do veículo", ["Próprio", "Terceiro"])
+            litros = st.number_input("Quantidade (L)", min_value=0.0, step=0.1, value=float(estado.get("litros_tipicos") or 0.0))
+            tanque_cheio = st.checkbox("Tanque cheio")
+            combustivel = st.selectbox("Combustível", COMBUSTIVEIS, index=_posicao(COMBUSTIVEIS, estado.get("combustivel")))
+            posto = st.selectbox("Posto", POSTOS_LIST, index=_posicao(POSTOS_LIST, estado.get("posto")))
+            km_atual = st.number_input("Km atual (odômetro)", min_value=0, step=1, value=0,
+                                       help="Opcional. Deve ser maior que o último km registrado para a placa.")
+        with colC:
+            data_req = st.date_input("Data da requisição", value=datetime.today(), disabled=True)
+            cidade = st.text_input("Cidade", value=estado.get("cidade", ""), autocomplete="off")
+            referente = st.text_area("Observações / Justificativa", height=80)
+            if resumo_ativo:
+                urgente = st.checkbox("Urgente (enviar agora)", help="Sem marcar, a requisição vai no resumo do posto do próximo horário.")
+            else:
+                urgente = True
+
+        col_submit, col_cancel = st.columns([1, 1])
+        with col_submit:
+            enviar = st.form_submit_button("Enviar e-mail de requisição")
+        with col_cancel:
+            cancelar = st.form_submit_button("Cancelar")
+
+        if cancelar:
+            st.session_state.show_new_req_form = False
+            st.session_state.pop("form_key", None)
+            st.session_state.pop("form_email_enviado", None)
+            st.rerun()
+
+        if enviar:
+            required_fields = {
+                "Placa": placa, "Condutor": condutor, "Email do Posto": email_posto,
+                "Posto": posto, "Setor": setor, "Subsetor": subsetor,
+                "Referente do veículo": tipo_posto, "Combustível": combustivel,
+                "Observações / Justificativa": referente, "Cidade": cidade
+            }
+
+            if not tanque_cheio:
+                required_fields["Quantidade (L)"] = litros
+
+            missing_fields = [field for field, value in required_fields.items() if not value or value == 0.0]
+
+            erro_km = (_indice_placas().check_odometro(format_placa(placa), km_atual, data_req, _setores_sessao())
+                       if placa else None)
+
+            if missing_fields:
+                st.error(f"Por favor, preencha todos os campos obrigatórios: {', '.join(missing_fields)}")
+            elif email_posto and not is_valid_email(email_posto):
+                st.error("O e-mail do posto não é válido.")
+            elif erro_km:
+                st.error(erro_km)
+            else:
+                # Chave de idempotência do formulário: reruns e cliques duplos
+                # não geram um segundo PDF nem um segundo e-mail.
+                chave = st.session_state.setdefault("form_key", uuid.uuid4().hex)
+                try:
+                    existente = storage.claim_submission(chave, DATA_FILE_PATH)
+                except storage.SubmissionInProgress:
+                    st.info("Esta requisição já está sendo enviada. Aguarde alguns instantes.")
+                    return
+                if existente is not None:
+                    st.info(f"A requisição #{existente} já foi registrada e enviada; nenhum novo e-mail foi gerado.")
+                    st.session_state.show_new_req_form = False
+                    st.session_state.pop("form_key", None)
+                    return
+
+                placa_formatada = format_placa(placa)
+                combustivel_norm = normalize_combustivel(combustivel)
+                payload = {
+                    "empresa": "Frango Americano", "logo_path": LOGO_PATH if LOGO_PATH else None,
+                    "data": data_req.strftime("%Y-%m-%d"), "posto": posto.strip(),
+                    "email_posto": email_posto.strip(), "tipo_posto": tipo_posto,
+                    "placa": placa_formatada, "motorista": condutor.strip(), "supervisor": supervisor.strip(),
+                    "setor": setor.strip(), "subsetor": subsetor.strip(),
+                    "litros": litros if not tanque_cheio else None, "valor_total": None, "km_atual": km_atual or None,
+                    "combustivel": combustivel_norm, "justificativa": referente.strip(),
+                    "solicitante": condutor.strip(), "cidade": cidade.strip()
                 }
-                
-                if not tanque_cheio:
-                    required_fields["Quantidade (L)"] = litros
-
-                missing_fields = [field for field, value in required_fields.items() if not value or value == 0.0]
-                
-                if missing_fields:
-                    st.error(f"Por favor, preencha todos os campos obrigatórios: {', '.join(missing_fields)}")
-                elif email_posto and not is_valid_email(email_posto):
-                    st.error("O e-mail do posto não é válido.")
-                else:
-                    placa_formatada = format_placa(placa)
-                    combustivel_norm = normalize_combustivel(combustivel)
-                    payload = {
-                        "empresa": "Frango Americano", "logo_path": LOGO_PATH if LOGO_PATH else None,
-                        "data": data_req.strftime("%Y-%m-%d"), "posto": posto.strip(),
-                        "email_posto": email_posto.strip(), "tipo_posto": tipo_posto,
-                        "placa": placa_formatada, "motorista": condutor.strip(), "supervisor": supervisor.strip(),
-                        "setor": setor.strip(), "subsetor": subsetor.strip(),
-                        "litros": litros if not tanque_cheio else None, "valor_total": None, "km_atual": None,
-                        "combustivel": combustivel_norm, "justificativa": referente.strip(),
-                        "solicitante": condutor.strip(), "cidade": cidade.strip()
-                    }
-                    
-                    try:
-                        pdf_bytes = generate_request_pdf(payload)
-                        st.session_state["pdf_data"] = pdf_bytes
-                        st.session_state["pdf_filename"] = f"requisicao_{placa_formatada}_{datetime.now().strftime('%Y%m%d%H%M%S')}.pdf"
-                        
-                        if send_email_with_pdf(
-                            to_email=email_posto.strip(),
-                            subject=f"Requisição de Abastecimento - {placa_formatada}",
-                            body="<p>Prezado(a) Posto,</p><p>Segue em anexo a requisição de abastecimento.</p><p>Atenciosamente,</p><p>Equipe Frango Americano</p>",
-                            pdf_data=pdf_bytes,
-                            filename=st.session_state["pdf_filename"]
-                        ):
-                            new_id = st.session_state.df_abastecimentos['id'].max() + 1 if not st.session_state.df_abastecimentos.empty else 1
-                            
-                            new_req = {
-                                "id": int(new_id),
-                                "Placa": placa_formatada, "valor_total": 0.0,
-                                "total_litros": litros if not tanque_cheio else None, "data": data_req.strftime("%Y-%m-%d"),
-                                "Referente": referente.strip(), "Odometro": None,
-                                "Posto": posto.strip(), "Combustivel": normalize_combustivel(combustivel),
-                                "Condutor": condutor.strip(), "Unidade": "", "Setor": setor.strip(),
-                                "Status": "Enviada", "Subsetor": subsetor.strip(),
-                                "Observacoes": referente.strip(), "TanqueCheio": 1 if tanque_cheio else 0,
-                                "DataUso": None, "KmUso": None, "EmailPosto": email_posto.strip(),
-                                "TipoPosto": tipo_posto, "Supervisor": supervisor.strip(),
-                                "Cidade": cidade.strip()
-                            }
-                            
-                            st.session_state.df_abastecimentos = pd.concat([st.session_state.df_abastecimentos, pd.DataFrame([new_req])], ignore_index=True)
-                            
-                            save_data(st.session_state.df_abastecimentos)
 
+                new_req = {
+                    "Placa": placa_formatada, "valor_total": 0.0,
+                    "total_litros": litros if not tanque_cheio else None, "data": data_req.strftime("%Y-%m-%d"),
+                    "Referente": referente.strip(), "Odometro": km_atual or None,
+                    "Posto": posto.strip(), "Combustivel": normalize_combustivel(combustivel),
+                    "Condutor": condutor.strip(), "Unidade": "", "Setor": setor.strip(),
+                    "Status": "Enviada", "Subsetor": subsetor.strip(),
+                    "Observacoes": referente.strip(), "TanqueCheio": 1 if tanque_cheio else 0,
+                    "DataUso": None, "KmUso": None, "EmailPosto": email_posto.strip(),
+                    "TipoPosto": tipo_posto, "Supervisor": supervisor.strip(),
+                    "Cidade": cidade.strip(), "ChaveEnvio": chave
+                }
+
+                if not urgente:
+                    # Modo resumo: grava agora, o e-mail sai junto com as demais do posto.
+                    new_req["Status"] = digest.QUEUED_STATUS
+                    ids = append_data([new_req])
+                    if ids:
+                        digest.enqueue(ids[0], email_posto, payload, DATA_FILE_PATH)
+                        st.success("✅ Requisição salva e adicionada ao resumo do posto.")
+                        st.session_state.show_new_req_form = False
+                        st.session_state.pop("form_key", None)
+                        st.rerun()
+                    else:
+                        storage.release_submission(chave, DATA_FILE_PATH)
+                    return
+
+                # E-mail já enviado numa tentativa anterior cuja gravação falhou:
+                # desta vez só grava, sem mandar outro e-mail ao posto.
+                ja_enviado = st.session_state.get("form_email_enviado") == chave
+                try:
+                    pdf_bytes = generate_request_pdf(payload)
+                    pdf_filename = f"requisicao_{placa_formatada}_{datetime.now().strftime('%Y%m%d%H%M%S')}.pdf"
+
+                    if ja_enviado or send_email_with_pdf(
+                        to_email=email_posto.strip(),
+                        subject=f"Requisição de Abastecimento - {placa_formatada}",
+                        body="<p>Prezado(a) Posto,</p><p>Segue em anexo a requisição de abastecimento.</p><p>Atenciosamente,</p><p>Equipe Frango Americano</p>",
+                        pdf_data=pdf_bytes,
+                        filename=pdf_filename
+                    ):
+                        st.session_state["form_email_enviado"] = chave
+                        ids = append_data([new_req])
+                        if ids:
+                            # A sessão guarda só o id; os bytes ficam no armazém.
+                            _guardar_pdf(ids, pdf_bytes, pdf_filename)
+                            st.session_state["pdf_ref_id"] = ids[0]
                             st.success("✅ Requisição salva e e-mail enviado com sucesso!")
                             st.session_state.show_new_req_form = False
+                            st.session_state.pop("form_key", None)
+                            st.session_state.pop("form_email_enviado", None)
                             st.rerun()
                         else:
-                            st.error("Não foi possível enviar o e-mail. A requisição não foi salva.")
+                            # Libera a chave para a nova tentativa, que não reenviará o e-mail.
+                            storage.release_submission(chave, DATA_FILE_PATH)
+                            st.warning("O e-mail foi enviado ao posto, mas a requisição não foi salva. "
+                                       "Clique em \"Enviar e-mail de requisição\" de novo para tentar salvar; "
+                                       "o e-mail não será reenviado.")
+                    else:
+                        storage.release_submission(chave, DATA_FILE_PATH)
+                        st.error("Não foi possível enviar o e-mail. A requisição não foi salva.")
+
+                except Exception as e:
+                    storage.release_submission(chave, DATA_FILE_PATH)
+                    st.error(f"Erro ao gerar PDF ou enviar e-mail: {e}")
+                    st.info("A requisição não foi salva. Verifique a instalação do reportlab e as configurações de SMTP.")
+
+COMBUSTIVEIS = ["Gasolina", "Etanol", "Diesel S10", "Diesel S500", "Arla"]
+SETORES = ["Abatedouro", "Fábrica Tocantinópolis", "Granjas de produção", "Incubatório", "Granjas Matrizes", "CD Paraíso", "Fábrica de Araguaína"]
+SUBSETORES = ["Congelados", "Transporte de funcionários", "Campo", "Pega de frango", "Integração"]
+
+def _posicao(opcoes, valor):
+    """Índice de `valor` nas opções de um selectbox (0 se ausente)."""
+    return opcoes.index(valor) if valor in opcoes else 0
+
+@st.cache_resource(show_spinner=False)
+def _indice_placas_global():
+    return vehicles.PlateIndex()
+
+def _indice_placas():
+    """Índice por placa do processo: montado uma vez; gravações de outros processos entram pelo diário."""
+    indice = _indice_placas_global()
+    versao = storage.data_version(DATA_FILE_PATH)
+    if indice.versao != versao:
+        if indice.marca is None:
+            with tracing.trace("indice_placas_rebuild"):
+                marca = datetime.now()  # antes da leitura: o que for gravado depois vem do diário
+                indice.rebuild(storage.load_range(filename=DATA_FILE_PATH), versao, marca)
+        else:
+            with tracing.trace("indice_placas_diario"):
+                indice.apply_entries(journal.entries(DATA_FILE_PATH, desde=indice.marca), versao)
+    return indice
+
+def _dica_preco():
+    """Posto mais barato de cada combustível nos últimos 30 dias, lido do índice de preços."""
+    idx = _indice_precos(storage.data_version(DATA_FILE_PATH))
+    dicas = []
+    for comb in COMBUSTIVEIS:
+        ranking = prices.cheapest(idx, comb)
+        if not ranking.empty:
+            melhor = ranking.iloc[0]
+            dicas.append(f"**{comb}:** {melhor['Posto']} (R$ {melhor['preco']:,.3f}/L)")
+    if dicas:
+        st.caption(f"💡 Menor preço médio nos últimos {prices.JANELA_DIAS} dias — " + " · ".join(dicas))
+
+@st.fragment
+def _historico_requisicoes():
+    """Grade do histórico; editar uma célula só reexecuta este fragmento."""
+    st.markdown("### Histórico de Requisições")
+    if st.session_state.df_abastecimentos.empty:
+        st.info("Nenhuma requisição registrada ainda.")
+        return
 
-                    except Exception as e:
-                        st.error(f"Erro ao gerar PDF ou enviar e-mail: {e}")
-                        st.info("A requisição não foi salva. Verifique a instalação do reportlab e as configurações de SMTP.")
-                        st.session_state["pdf_data"] = None
+    df = st.session_state.df_abastecimentos.copy()
 
-    else:
-        st.markdown("### Histórico de Requisições")
-        if st.session_state.df_abastecimentos.empty:
-            st.info("Nenhuma requisição registrada ainda.")
-            return
+    df['DataUso'] = pd.to_datetime(df['DataUso'], errors='coerce')
+    df['valor_total'] = pd.to_numeric(df['valor_total'], errors='coerce')
+    df['total_litros'] = pd.to_numeric(df['total_litros'], errors='coerce')
+    df['Odometro'] = pd.to_numeric(df['Odometro'], errors='coerce')
+    df['data'] = pd.to_datetime(df['data'], errors='coerce').dt.strftime("%Y-%m-%d")
 
-        df = st.session_state.df_abastecimentos.copy()
-        
-        df['DataUso'] = pd.to_datetime(df['DataUso'], errors='coerce')
-        df['valor_total'] = pd.to_numeric(df['valor_total'], errors='coerce')
-        df['total_litros'] = pd.to_numeric(df['total_litros'], errors='coerce')
-        df['Odometro'] = pd.to_numeric(df['Odometro'], errors='coerce')
-        df['data'] = pd.to_datetime(df['data'], errors='coerce').dt.strftime("%Y-%m-%d")
-        
-        df['Quantidade'] = np.where(
-            df['TanqueCheio'].astype(int) == 1,
-            "Tanque cheio",
-            df['total_litros'].astype(str)
-        )
+    df['Quantidade'] = np.where(
+        df['TanqueCheio'].astype(int) == 1,
+        "Tanque cheio",
+        df['total_litros'].astype(str)
+    )
 
-        df['Supervisor'] = df.apply(lambda r: r.get('Supervisor') or "", axis=1)
-        
-        is_admin = st.session_state.get('current_user') == "ADMINISTRADOR"
+    df['Supervisor'] = df.apply(lambda r: r.get('Supervisor') or "", axis=1)
 
-        status_options = {
-            "Enviada": "Enviada", 
-            "Abastecida": "Abastecida", 
-            "Cancelada": "Cancelada"
-        }
-        
-        df_display = df.copy()
-        df_display = df_display.drop(columns=['Referente', 'Unidade', 'TanqueCheio', 'KmUso', 'EmailPosto', 'TipoPosto', 'Supervisor'], errors='ignore')
+    is_admin = st.session_state.get('current_user') == "ADMINISTRADOR"
 
-        df_display['DataUso'] = df_display['DataUso'].dt.strftime("%d/%m/%Y")
-        
-        df_display['Ações'] = ""
-
-        column_config_dict = {
-            "id": st.column_config.NumberColumn("ID", disabled=True, width="small"),
-            "data": st.column_config.DateColumn("Data Req.", format="DD/MM/YYYY", disabled=True, width="small"),
-            "Placa": st.column_config.TextColumn("Placa", disabled=True, width="small"),
-            "Condutor": st.column_config.TextColumn("Condutor", disabled=True),
-            "Supervisor": st.column_config.TextColumn("Supervisor", disabled=True),
-            "Setor": st.column_config.TextColumn("Setor", disabled=True),
-            "Subsetor": st.column_config.TextColumn("Subsetor", disabled=True),
-            "Cidade": st.column_config.TextColumn("Cidade", disabled=True),
-            "total_litros": st.column_config.NumberColumn("Litros", format="%.2f L", disabled=True, width="small"),
-            "valor_total": st.column_config.NumberColumn("Valor", format="R$ %.2f", disabled=not is_admin, width="small"),
-            "Combustivel": st.column_config.TextColumn("Combustível", disabled=True, width="small"),
-            "Posto": st.column_config.TextColumn("Posto", disabled=True, width="small"),
-            "Status": st.column_config.SelectboxColumn("Status", options=list(status_options.keys()), disabled=not is_admin, width="small"),
-            "Odometro": st.column_config.NumberColumn("Km", disabled=not is_admin, width="small"),
-            "DataUso": st.column_config.DateColumn("Data Uso", format="DD/MM/YYYY", disabled=not is_admin, width="small"),
-            "Observacoes": st.column_config.TextColumn("Observações", disabled=not is_admin, width="medium"),
+    status_options = {
+        "Enviada": "Enviada", 
+        "Abastecida": "Abastecida", 
+        "Cancelada": "Cancelada",
+        digest.QUEUED_STATUS: digest.QUEUED_STATUS,
+    }
+
+    df_display = df.copy()
+    df_display = df_display.drop(columns=['Referente', 'Unidade', 'TanqueCheio', 'KmUso', 'EmailPosto', 'TipoPosto', 'Supervisor', 'Versao', 'ChaveEnvio'], errors='ignore')
+
+    df_display['DataUso'] = df_display['DataUso'].dt.strftime("%d/%m/%Y")
+
+    df_display['Ações'] = ""
+
+    column_config_dict = {
+        "id": st.column_config.NumberColumn("ID", disabled=True, width="small"),
+        "data": st.column_config.DateColumn("Data Req.", format="DD/MM/YYYY", disabled=True, width="small"),
+        "Placa": st.column_config.TextColumn("Placa", disabled=True, width="small"),
+        "Condutor": st.column_config.TextColumn("Condutor", disabled=True),
+        "Supervisor": st.column_config.TextColumn("Supervisor", disabled=True),
+        "Setor": st.column_config.TextColumn("Setor", disabled=True),
+        "Subsetor": st.column_config.TextColumn("Subsetor", disabled=True),
+        "Cidade": st.column_config.TextColumn("Cidade", disabled=True),
+        "total_litros": st.column_config.NumberColumn("Litros", format="%.2f L", disabled=True, width="small"),
+        "valor_total": st.column_config.NumberColumn("Valor", format="R$ %.2f", disabled=not is_admin, width="small"),
+        "Combustivel": st.column_config.TextColumn("Combustível", disabled=True, width="small"),
+        "Posto": st.column_config.TextColumn("Posto", disabled=True, width="small"),
+        "Status": st.column_config.SelectboxColumn("Status", options=list(status_options.keys()), disabled=not is_admin, width="small"),
+        "Odometro": st.column_config.NumberColumn("Km", disabled=not is_admin, width="small"),
+        "DataUso": st.column_config.DateColumn("Data Uso", format="DD/MM/YYYY", disabled=not is_admin, width="small"),
+        "Observacoes": st.column_config.TextColumn("Observações", disabled=not is_admin, width="medium"),
+    }
+
+    edited_df = st.data_editor(
+        df_display,
+        column_config=column_config_dict,
+        hide_index=True,
+        use_container_width=True,
+        disabled=(not is_admin)
+    )
+
+    if is_admin:
+        changes = _grid_changes(df_display, edited_df)
+        if changes and update_data(changes):
+            st.toast("✅ Registros atualizados com sucesso!")
+            st.rerun(scope="fragment")
+
+    _pdfs_enviados(set(df['id'].astype(int)))
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _ids_com_pdf(versao):
+    """Ids com PDF no armazém; relidos só quando o armazém muda (pdfstore.store_version)."""
+    return pdfstore.linked_ids(DATA_FILE_PATH)
+
+def _pdfs_enviados(ids_visiveis):
+    """Novo download do PDF exatamente como foi enviado, lido do armazém (sem regerar)."""
+    ids = [i for i in reversed(_ids_com_pdf(pdfstore.store_version(DATA_FILE_PATH))) if i in ids_visiveis]
+    if not ids:
+        return
+    with st.expander("📄 PDFs enviados"):
+        ultimo = st.session_state.get("pdf_ref_id")
+        req_id = st.selectbox("Requisição", ids, index=ids.index(ultimo) if ultimo in ids else 0, key="pdf_enviado_id")
+        ref = pdfstore.reference(req_id, DATA_FILE_PATH)
+        data = pdfstore.get(ref["hash"], DATA_FILE_PATH) if ref else None
+        if data is None:
+            st.info("O PDF desta requisição não está mais disponível no armazém.")
+        else:
+            st.download_button("⬇️ Baixar PDF", data=data, file_name=ref["nome"], mime="application/pdf",
+                               key="pdf_enviado_download")
+
+def _ids_digitados(texto):
+    """IDs digitados no formulário: '3, 7, 10-20' -> ([3, 7], [(10, 20)]); as faixas não são expandidas."""
+    ids, faixas = [], []
+    for parte in texto.split(','):
+        inicio, _, fim = (p.strip() for p in parte.partition('-'))
+        if inicio.isdigit() and fim.isdigit():
+            faixas.append((int(inicio), int(fim)))
+        elif inicio.isdigit() and not fim:
+            ids.append(int(inicio))
+    return ids, faixas
+
+@st.fragment
+def _acoes_administrador():
+    """Exclusão/cancelamento em lote por IDs ou por filtro, com prévia; reexecuta a página toda só após gravar."""
+    st.markdown("---")
+    st.markdown("### Ações de Administrador")
+    st.warning("Estas ações só devem ser executadas por um administrador. "
+               "Elas ficam no histórico de alterações, de onde podem ser desfeitas.")
+
+    df = st.session_state.df_abastecimentos
+    modo = st.radio("Selecionar requisições", ["Por IDs", "Por filtro"], horizontal=True, key="admin_modo")
+    if modo == "Por IDs":
+        digitados, faixas = _ids_digitados(st.text_input("IDs (separados por vírgula; intervalos como 10-20)",
+                                                         autocomplete="off", key="admin_ids"))
+        if not digitados and not faixas:
+            return
+        ids = storage.match_ids(df, ids=digitados, faixas=faixas)
+        fora = set(digitados) - set(ids)
+        if fora:
+            st.caption(f"{len(fora)} ID(s) não estão entre as requisições em aberto e serão ignorados.")
+    else:
+        col_status, col_postos, col_setores = st.columns(3)
+        filtros = {
+            "status": col_status.multiselect("Status", sorted(df['Status'].dropna().unique()), key="admin_status"),
+            "postos": col_postos.multiselect("Posto", sorted(df['Posto'].dropna().unique()), key="admin_postos"),
+            "setores": col_setores.multiselect("Setor", sorted(df['Setor'].dropna().unique()), key="admin_setores"),
         }
+        col_placas, col_dias = st.columns(2)
+        filtros["placas"] = col_placas.multiselect("Placa", sorted(df['Placa'].dropna().unique()), key="admin_placas")
+        dias = col_dias.number_input("Mais antigas que (dias)", min_value=0, value=0, step=1, key="admin_dias",
+                                     help="0 = qualquer data")
+        if not any(filtros.values()) and not dias:
+            st.info("Escolha ao menos um filtro.")
+            return
+        antes_de = pd.Timestamp.today().normalize() - pd.Timedelta(days=dias) if dias else None
+        ids = storage.match_ids(df, antes_de=antes_de, **filtros)
 
-        edited_df = st.data_editor(
-            df_display,
-            column_config=column_config_dict,
-            hide_index=True,
-            use_container_width=True,
-            disabled=(not is_admin)
-        )
+    if not ids:
+        st.info("Nenhuma requisição selecionada.")
+        return
+    st.markdown(f"**{len(ids)} requisição(ões) selecionada(s)**")
+    st.dataframe(
+        df[df['id'].isin(ids)][['id', 'data', 'Placa', 'Posto', 'Setor', 'Status', 'total_litros', 'valor_total']].head(200),
+        hide_index=True, use_container_width=True,
+        column_config={"data": st.column_config.DatetimeColumn("Data", format="DD/MM/YYYY")},
+    )
+    # A confirmação vale só para esta seleção: mudou a seleção, muda a chave e ela volta desmarcada.
+    confirmar = st.checkbox(f"Confirmo a operação em {len(ids)} requisição(ões)",
+                            key=f"admin_confirmar_{hash(tuple(ids))}")
+    col_excluir, col_cancelar = st.columns(2)
+    if col_excluir.button("Excluir selecionadas", disabled=not confirmar, key="admin_excluir"):
+        if delete_data(ids):
+            st.success(f"{len(ids)} requisição(ões) excluída(s).")
+            st.rerun()
+    if col_cancelar.button("Cancelar selecionadas", disabled=not confirmar, key="admin_cancelar"):
+        if update_many(ids, {'Status': 'Cancelada'}):
+            st.success(f"{len(ids)} requisição(ões) cancelada(s).")
+            st.rerun()
 
-        if is_admin:
-            if not edited_df.equals(df_display):
-                st.session_state.df_abastecimentos = edited_df
-                save_data(st.session_state.df_abastecimentos)
-                st.toast("✅ Registros atualizados com sucesso!")
-                st.rerun()
+@st.fragment
+def _historico_alteracoes():
+    """Trilha de auditoria, dados "como estavam em" uma data/hora e restauração (administrador)."""
+    with st.expander("🕘 Histórico de alterações e restauração"):
+        resumo = st.session_state.pop("diario_resumo", None)
+        if resumo:
+            st.success(f"Restauração concluída. Reinseridas: {resumo['reinseridas']} · "
+                       f"alteradas: {resumo['alteradas']} · excluídas: {resumo['excluidas']}")
+            if resumo["ignoradas"]:
+                st.warning(f"IDs já arquivados em meses fechados, não alterados: {resumo['ignoradas']}")
+        col_desde, col_ids = st.columns(2)
+        desde = col_desde.date_input("Alterações desde", value=(pd.Timestamp.today() - pd.Timedelta(days=7)).date(),
+                                     format="DD/MM/YYYY", key="diario_desde")
+        texto_ids = col_ids.text_input("IDs (opcional, separados por vírgula)", key="diario_ids", autocomplete="off")
+        ids = [int(i.strip()) for i in texto_ids.split(',') if i.strip().isdigit()] or None
+
+        trilha = journal.history(DATA_FILE_PATH, desde=pd.Timestamp(desde), ids=ids)
+        if trilha.empty:
+            st.info("Nenhuma alteração registrada no período.")
+        else:
+            st.dataframe(
+                trilha.iloc[::-1].head(500), hide_index=True, use_container_width=True,
+                column_config={
+                    "em": st.column_config.DatetimeColumn("Quando", format="DD/MM/YYYY HH:mm:ss"),
+                    "usuario": st.column_config.TextColumn("Usuário"),
+                    "operacao": st.column_config.TextColumn("Operação"),
+                    "id": st.column_config.NumberColumn("ID", format="%d"),
+                    "colunas": st.column_config.TextColumn("Colunas"),
+                    "detalhe": st.column_config.TextColumn("Detalhe"),
+                },
+            )
+
+        st.markdown("**Dados como estavam em**")
+        col_data, col_hora = st.columns(2)
+        dia = col_data.date_input("Data", value=datetime.now().date(), format="DD/MM/YYYY", key="diario_dia")
+        hora = col_hora.time_input("Hora", value=datetime.now().time().replace(second=0, microsecond=0),
+                                   key="diario_hora")
+        quando = datetime.combine(dia, hora)
+        if st.button("Ver dados nesse instante", key="diario_ver"):
+            passado = journal.as_of(quando, DATA_FILE_PATH, ids=ids)
+            st.dataframe(passado, hide_index=True, use_container_width=True)
+            st.download_button("⬇️ Baixar CSV", data=passado.to_csv(index=False).encode("utf-8"),
+                               file_name=f"abastecimentos_{quando:%Y-%m-%d_%H%M}.csv", mime="text/csv",
+                               key="diario_baixar")
+
+        alvo = f"as requisições {ids}" if ids else "todas as requisições"
+        confirmar = st.checkbox(f"Confirmo restaurar {alvo} para {quando:%d/%m/%Y %H:%M}", key="diario_confirmar")
+        if st.button("Restaurar", disabled=not confirmar, key="diario_restaurar"):
+            try:
+                resumo = journal.restore(quando, DATA_FILE_PATH, ids=ids, usuario=f"{_usuario_sessao()} (restauração)")
+            except storage.ConflictError as e:
+                st.error(f"{e}. Tente novamente.")
+                return
+            # O índice por placa se atualiza pelas entradas que a restauração deixou no diário.
+            _aquecedor().notify()
+            st.session_state.df_abastecimentos = load_data()
+            st.session_state.diario_resumo = resumo
+            st.rerun()
 
-            st.markdown("---")
-            st.markdown("### Ações de Administrador")
-            st.warning("Estas ações são permanentes e só devem ser executadas por um administrador.")
-
-            with st.form("admin_actions_form"):
-                st.markdown("Selecione os IDs das requisições para exclusão:")
-                ids_to_delete = st.text_input("IDs (separados por vírgula)", autocomplete="off")
-                
-                col_actions = st.columns(2)
-                with col_actions[0]:
-                    delete_button = st.form_submit_button("Excluir Selecionados")
-                with col_actions[1]:
-                    cancel_button_admin = st.form_submit_button("Cancelar Selecionados")
-
-                if delete_button:
-                    if ids_to_delete:
-                        ids_list = [int(i.strip()) for i in ids_to_delete.split(',') if i.strip().isdigit()]
-                        st.session_state.df_abastecimentos = st.session_state.df_abastecimentos[~st.session_state.df_abastecimentos['id'].isin(ids_list)].reset_index(drop=True)
-                        save_data(st.session_state.df_abastecimentos)
-                        st.success(f"Requisição(ões) com IDs {ids_list} excluída(s) permanentemente.")
-                        st.rerun()
-                    else:
-                        st.warning("Nenhum ID inserido para exclusão.")
-                
-                if cancel_button_admin:
-                    if ids_to_delete:
-                        ids_list = [int(i.strip()) for i in ids_to_delete.split(',') if i.strip().isdigit()]
-                        st.session_state.df_abastecimentos.loc[st.session_state.df_abastecimentos['id'].isin(ids_list), 'Status'] = 'Cancelada'
-                        save_data(st.session_state.df_abastecimentos)
-                        st.success(f"Requisição(ões) com IDs {ids_list} cancelada(s).")
-                        st.rerun()
-                    else:
-                        st.warning("Nenhum ID inserido para cancelamento.")
 
+DASHBOARD_FILTROS = {
+    "Setor": "Setor", "Subsetor": "Subsetor", "Unidade": "Unidade", "Cidade": "Cidade",
+    "Posto": "Posto", "Combustivel": "Combustível", "TipoPosto": "Referente do veículo",
+}
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+@tracing.traced("dashboard_cubo")
+def _cubo_do_motor(versao, motor):
+    """Cubo de agregados de todo o histórico; recalculado só quando os dados (ou o motor) mudam."""
+    if motor == "duckdb":
+        return duckdb_backend.build_cube(DATA_FILE_PATH)
+    return analytics.build_cube(storage.load_range(filename=DATA_FILE_PATH))
+
+def _cubo(versao):
+    """Cubo do motor configurado agora: trocar o motor em Configurações não reaproveita o cubo do outro."""
+    return _cubo_do_motor(versao, "duckdb" if _motor_sql() else "pandas")
+
+def _motor_sql():
+    """True quando as agregações devem rodar no DuckDB (configurado e instalado)."""
+    return duckdb_backend.DUCKDB_AVAILABLE and _settings.get("motor_analitico") == "duckdb"
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+@tracing.traced("previsao_modelos")
+def _modelos_previsao(versao):
+    """Modelos de previsão de todas as séries de Setor e Placa; reajustados só quando os dados mudam."""
+    return forecast.fit_all(_cubo(versao))
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+@tracing.traced("indice_precos")
+def _indice_precos(versao):
+    """Índice de preço por litro; só segmentos novos e a partição quente são reprocessados."""
+    return prices.refresh_index(DATA_FILE_PATH)
 
 def pagina_dashboard():
     if "dashboard" not in USER_PERMISSIONS.get(st.session_state.get("current_user"), []):
@@ -842,76 +1292,327 @@ def pagina_dashboard():
     if LOGO_PATH and os.path.exists(LOGO_PATH):
         st.image(LOGO_PATH, width=120)
 
-    if st.session_state.df_abastecimentos.empty:
+    versao = storage.data_version(DATA_FILE_PATH)
+    cubo = _cubo(versao)
+    if cubo.empty:
         st.info("Nenhum dado registrado ainda.")
         return
-        
-    df = st.session_state.df_abastecimentos.copy()
-    
-    df.columns = [c.strip() for c in df.columns]
-    df['data'] = pd.to_datetime(df['data'], errors='coerce')
-    df = df.dropna(subset=['data'])
-    
-    df['mes_ano'] = df['data'].dt.to_period('M').astype(str)
-    
-    total_litros = df['total_litros'].sum() if 'total_litros' in df.columns else 0.0
-    total_valor = df['valor_total'].sum() if 'valor_total' in df.columns else 0.0
-    n_veiculos = df["Placa"].nunique() if 'Placa' in df.columns else 0
+
+    meses = [str(m) for m in sorted(cubo['mes'].unique())]
+    with st.expander("Filtros", expanded=False):
+        if len(meses) > 1:
+            inicio, fim = st.select_slider("Período", options=meses, value=(meses[0], meses[-1]))
+        else:
+            inicio = fim = meses[0]
+        filtros = {}
+        cols = st.columns(4)
+        for i, (dimensao, rotulo) in enumerate(DASHBOARD_FILTROS.items()):
+            with cols[i % 4]:
+                filtros[dimensao] = st.multiselect(rotulo, analytics.dimension_values(cubo, dimensao), key=f"filtro_{dimensao}")
+
+    recorte = analytics.slice_cube(cubo, inicio, fim, **filtros)
+    chave = _chave_dashboard(versao, inicio, fim, filtros)
+
+    _indicadores_dashboard(recorte)
+    st.markdown("---")
+    _grafico_consumo_mensal(recorte, chave)
+    _grafico_consumo_placa(recorte, chave)
+    _grafico_consumo_combustivel(recorte, chave)
+    _grafico_precos(versao, filtros.get("Posto"))
+    _previsao_dashboard(versao)
+    st.markdown("---")
+    # Enquanto houver relatório em geração o fragmento se atualiza sozinho.
+    polling = reports.pending()
+    st.fragment(_relatorio_mensal, run_every="2s" if polling else None)(meses, polling)
+
+def _chave_dashboard(versao, inicio, fim, filtros):
+    return (versao, inicio, fim, tuple((d, tuple(v)) for d, v in filtros.items()))
+
+def _aquecer_dashboard(versao):
+    """Cubo, modelos e figuras da visão padrão do dashboard (período inteiro, sem filtros)."""
+    cubo = _cubo(versao)
+    _modelos_previsao(versao)
+    if cubo.empty:
+        return
+    meses = [str(m) for m in sorted(cubo['mes'].unique())]
+    chave = _chave_dashboard(versao, meses[0], meses[-1], {d: [] for d in DASHBOARD_FILTROS})
+    recorte = analytics.slice_cube(cubo, meses[0], meses[-1])
+    _figura_consumo_mensal(chave, recorte)
+    _figura_consumo_placa(chave, recorte)
+    _figura_consumo_combustivel(chave, recorte)
+
+# As figuras ficam em cache pela versão dos dados + filtros: reruns sem gravação
+# nova não refazem os agregados nem a montagem do Plotly. O recorte do cubo
+# (prefixo _) não entra no hash da chave.
+@st.cache_data(show_spinner=False, max_entries=32)
+@tracing.traced("dashboard_figura_consumo_mensal")
+def _figura_consumo_mensal(chave, _cubo):
+    consumo_por_mes = charts.bucket_time_series(analytics.rollup(_cubo, 'mes'), 'mes', 'total_litros', freq='M')
+    return px.bar(consumo_por_mes, x='rotulo', y='total_litros',
+                  labels={'rotulo': 'Mês/Ano', 'total_litros': 'Total de Litros'},
+                  color_discrete_sequence=[_settings.get("highlight_blue", "#1F77B4")])
+
+@st.cache_data(show_spinner=False, max_entries=32)
+@tracing.traced("dashboard_figura_consumo_placa")
+def _figura_consumo_placa(chave, _cubo):
+    consumo_por_placa = analytics.rollup(_cubo[_cubo['Placa'] != ""], 'Placa').nlargest(10, 'total_litros')
+    return px.pie(consumo_por_placa, values='total_litros', names='Placa', 
+                  title='Consumo por Placa', hole=.3,
+                  color_discrete_sequence=px.colors.sequential.Bluyl)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+@tracing.traced("dashboard_figura_consumo_combustivel")
+def _figura_consumo_combustivel(chave, _cubo):
+    consumo_por_comb = analytics.rollup(_cubo, 'Combustivel')
+    return px.bar(consumo_por_comb, x='Combustivel', y='total_litros',
+                  labels={'Combustivel': 'Combustível', 'total_litros': 'Total de Litros'},
+                  color_discrete_sequence=[_settings.get("primary_medium", "#003b63")])
+
+@st.cache_data(show_spinner=False, max_entries=32)
+@tracing.traced("dashboard_figura_precos")
+def _figura_precos(chave, _idx, combustivel, postos):
+    serie = prices.trend(_idx, combustivel, postos=list(postos))
+    fig = charts.line_figure(serie, x='periodo', y='preco', color='Posto', max_points=None, markers=True,
+                             labels={'periodo': 'Período', 'preco': 'R$ por litro'})
+    fig.update_yaxes(tickprefix="R$ ", tickformat=",.3f")
+    return fig
+
+@st.fragment
+def _indicadores_dashboard(cubo):
+    n_veiculos, total_litros, total_valor = analytics.cube_kpis(cubo)
 
     k1, k2, k3 = st.columns(3)
     with k1: st.metric("🚗 Veículos distintos", int(n_veiculos))
     with k2: st.metric("🛢 Total de litros", f"{total_litros:,.2f}")
     with k3: st.metric("💰 Valor total gasto", f"R$ {total_valor:,.2f}")
-    
-    st.markdown("---")
 
+@st.fragment
+def _grafico_consumo_mensal(cubo, chave):
     st.subheader("Consumo de Combustível por Mês")
-    consumo_por_mes = df.groupby('mes_ano')['total_litros'].sum().reset_index()
-    fig1 = px.bar(consumo_por_mes, x='mes_ano', y='total_litros', 
-                  labels={'mes_ano': 'Mês/Ano', 'total_litros': 'Total de Litros'},
-                  color_discrete_sequence=[_settings.get("highlight_blue", "#1F77B4")])
-    st.plotly_chart(fig1, use_container_width=True)
+    st.plotly_chart(_figura_consumo_mensal(chave, cubo), use_container_width=True)
 
+@st.fragment
+def _grafico_consumo_placa(cubo, chave):
     st.subheader("Litros Consumidos por Veículo (Top 10)")
-    consumo_por_placa = df.groupby('Placa')['total_litros'].sum().nlargest(10).reset_index()
-    fig2 = px.pie(consumo_por_placa, values='total_litros', names='Placa', 
-                  title='Consumo por Placa', hole=.3,
-                  color_discrete_sequence=px.colors.sequential.Bluyl)
-    st.plotly_chart(fig2, use_container_width=True)
+    st.plotly_chart(_figura_consumo_placa(chave, cubo), use_container_width=True)
 
+@st.fragment
+def _grafico_consumo_combustivel(cubo, chave):
     st.subheader("Consumo por Tipo de Combustível")
-    consumo_por_comb = df.groupby('Combustivel')['total_litros'].sum().reset_index()
-    fig3 = px.bar(consumo_por_comb, x='Combustivel', y='total_litros',
-                  labels={'Combustivel': 'Combustível', 'total_litros': 'Total de Litros'},
-                  color_discrete_sequence=[_settings.get("primary_medium", "#003b63")])
-    st.plotly_chart(fig3, use_container_width=True)
+    st.plotly_chart(_figura_consumo_combustivel(chave, cubo), use_container_width=True)
+
+@st.fragment
+def _grafico_precos(versao, postos):
+    st.subheader("Preço por Litro por Posto")
+    idx = _indice_precos(versao)
+    if idx.empty:
+        st.info("Nenhum abastecimento com valor lançado ainda.")
+        return
+    disponiveis = [c for c in COMBUSTIVEIS if (idx['Combustivel'] == c).any()] or sorted(idx['Combustivel'].unique())
+    combustivel = st.selectbox("Combustível", disponiveis, key="precos_combustivel")
+    postos = tuple(postos or ())
+    st.plotly_chart(_figura_precos((versao, combustivel, postos), idx, combustivel, postos), use_container_width=True)
+    ranking = prices.cheapest(idx, combustivel)
+    if not ranking.empty:
+        st.dataframe(
+            ranking.rename(columns={'preco': 'R$/L', 'abastecimentos': 'Abastecimentos', 'ultimo': 'Último'}),
+            hide_index=True, use_container_width=True,
+            column_config={"R$/L": st.column_config.NumberColumn(format="R$ %.3f"),
+                           "Último": st.column_config.DateColumn(format="DD/MM/YYYY")},
+        )
 
-def generate_narrative(df):
-    """Gera uma narrativa analítica simulando uma IA."""
+@st.cache_data(show_spinner=False, max_entries=32)
+@tracing.traced("dashboard_figura_previsao")
+def _figura_previsao(chave, _cubo, _modelos, dimensao, valor, medida):
+    serie = forecast.history_and_forecast(_cubo, _modelos, dimensao, valor, medida)
+    rotulo = 'Litros' if medida == 'litros' else 'Valor (R$)'
+    return charts.line_figure(serie, x='mes', y=medida, color='tipo', markers=True,
+                              labels={'mes': 'Mês', medida: rotulo, 'tipo': ''},
+                              color_discrete_sequence=[_settings.get("primary_medium", "#003b63"),
+                                                       _settings.get("highlight_blue", "#1F77B4")])
+
+@st.fragment
+def _previsao_dashboard(versao):
+    st.subheader(f"Previsão para os Próximos {forecast.HORIZONTE} Meses")
+    st.caption("Suavização sazonal sobre o consumo mensal de todo o histórico (o mês corrente, incompleto, não entra no ajuste).")
+    modelos = _modelos_previsao(versao)
+    c1, c2 = st.columns(2)
+    with c1:
+        dimensao = st.radio("Previsão por", ["Setor", "Placa"], horizontal=True, key="previsao_dimensao")
+    with c2:
+        medida = st.radio("Medida", ["litros", "valor"], format_func=str.capitalize, horizontal=True, key="previsao_medida")
+    tabela = forecast.forecast_table(modelos, dimensao)
+    if tabela.empty:
+        st.info("Histórico insuficiente para prever.")
+        return
+    tabela['mes'] = tabela['mes'].dt.strftime('%m/%Y')
+    pivo = tabela.pivot(index=dimensao, columns='mes', values=medida)
+    pivo = pivo[sorted(pivo.columns, key=lambda m: (m[3:], m[:2]))]
+    pivo['Total'] = pivo.sum(axis=1)
+    pivo = pivo.sort_values('Total', ascending=False)
+    if dimensao == "Placa":
+        pivo = pivo.head(10)
+    formato = "%.1f L" if medida == 'litros' else "R$ %.2f"
+    st.dataframe(pivo, use_container_width=True,
+                 column_config={c: st.column_config.NumberColumn(format=formato) for c in pivo.columns})
+    escolhido = st.selectbox(dimensao, list(pivo.index), key="previsao_serie")
+    st.plotly_chart(_figura_previsao((versao, dimensao, escolhido, medida), _cubo(versao), modelos,
+                                     dimensao, escolhido, medida), use_container_width=True)
+
+def _relatorio_mensal(meses, polling):
+    """PDF mensal gerado em segundo plano; a página continua respondendo enquanto isso."""
+    st.subheader("Relatório mensal (PDF)")
+    mes = st.selectbox("Mês", list(reversed(meses)), key="relatorio_mes")
+    status, resultado = reports.report_status(mes, DATA_FILE_PATH)
+    if polling and not reports.pending():
+        # Geração terminou: rerun completo para desligar a atualização periódica.
+        st.rerun()
+    if status == "pronto":
+        st.download_button("⬇️ Baixar relatório", data=resultado, file_name=f"relatorio_abastecimentos_{mes}.pdf",
+                           mime="application/pdf", key="relatorio_download")
+    elif status == "gerando":
+        st.info("Gerando relatório em segundo plano...")
+    else:
+        if status == "erro":
+            st.error(f"Falha ao gerar o relatório: {resultado}")
+        if st.button("Gerar relatório", key="relatorio_gerar"):
+            reports.request_monthly_report(mes, DATA_FILE_PATH, empresa="Frango Americano",
+                                           logo_path=LOGO_PATH if LOGO_PATH else None)
+            st.rerun()
+
+def narrative_text(stats):
+    """Texto das narrativas a partir dos números (calculados em pandas ou em SQL)."""
     narrativas = []
-    
-    total_litros = df['total_litros'].sum() if 'total_litros' in df.columns else 0
-    total_valor = df['valor_total'].sum() if 'valor_total' in df.columns else 0
-    narrativas.append(f"Análise geral: O volume total de combustível consumido foi de **{total_litros:,.2f} litros**, com um custo total de **R$ {total_valor:,.2f}**.")
-    
-    if not df.empty and 'Placa' in df.columns:
-        top_placa = df.groupby('Placa')['total_litros'].sum().idxmax()
-        top_consumo = df.groupby('Placa')['total_litros'].sum().max()
-        narrativas.append(f"Principais veículos: O veículo de placa **{top_placa}** foi o maior consumidor, com um total de **{top_consumo:,.2f} litros**.")
-        
-    if not df.empty and 'data' in df.columns:
-        df_monthly = df.set_index('data').resample('M')['total_litros'].sum()
-        if not df_monthly.empty:
-            pico_mes = df_monthly.idxmax()
-            pico_consumo = df_monthly.max()
-            narrativas.append(f"Tendências de consumo: O pico de consumo ocorreu em **{pico_mes.strftime('%B de %Y')}**, com um total de **{pico_consumo:,.2f} litros**.")
-    
-    if not df.empty and 'total_litros' in df.columns:
-        media_litros = df['total_litros'].mean()
-        narrativas.append(f"Eficiência: A média de litros por requisição é de aproximadamente **{media_litros:,.2f} litros**.")
-        
+    narrativas.append(f"Análise geral: O volume total de combustível consumido foi de **{stats['total_litros']:,.2f} litros**, com um custo total de **R$ {stats['total_valor']:,.2f}**.")
+    if "top_placa" in stats:
+        narrativas.append(f"Principais veículos: O veículo de placa **{stats['top_placa']}** foi o maior consumidor, com um total de **{stats['top_consumo']:,.2f} litros**.")
+    if "pico_mes" in stats:
+        narrativas.append(f"Tendências de consumo: O pico de consumo ocorreu em **{stats['pico_mes'].strftime('%B de %Y')}**, com um total de **{stats['pico_consumo']:,.2f} litros**.")
+    if "media_litros" in stats:
+        narrativas.append(f"Eficiência: A média de litros por requisição é de aproximadamente **{stats['media_litros']:,.2f} litros**.")
     return narrativas
 
+def forecast_narrative(modelos):
+    """Frases de previsão do próximo mês a partir dos modelos ajustados."""
+    narrativas = []
+    setores = forecast.forecast_table(modelos, "Setor", horizonte=1)
+    if setores.empty:
+        return narrativas
+    mes = setores['mes'].iloc[0].strftime('%m/%Y')
+    narrativas.append(f"Previsão: para **{mes}** a estimativa é de **{setores['litros'].sum():,.2f} litros**, "
+                      f"com custo de aproximadamente **R$ {setores['valor'].sum():,.2f}**.")
+    maior = setores.loc[setores['litros'].idxmax()]
+    narrativas.append(f"Setores: o maior consumo previsto é o de **{maior['Setor']}**, "
+                      f"com **{maior['litros']:,.2f} litros** (R$ {maior['valor']:,.2f}).")
+    placas = forecast.forecast_table(modelos, "Placa", horizonte=1)
+    if not placas.empty:
+        top = placas.loc[placas['litros'].idxmax()]
+        narrativas.append(f"Veículos: a placa **{top['Placa']}** deve ser a maior consumidora, "
+                          f"com cerca de **{top['litros']:,.2f} litros**.")
+    return narrativas
+
+@st.cache_data(show_spinner=False, max_entries=16)
+@tracing.traced("narrativa_estatisticas")
+def _estatisticas_narrativa(versao, inicio, fim, setores):
+    """Números das narrativas de um período; recalculados só quando os dados mudam."""
+    if _motor_sql() and setores is None:
+        return duckdb_backend.narrative_stats(DATA_FILE_PATH, inicio, fim)
+    df = storage.load_range(inicio, fim, DATA_FILE_PATH, shards=setores)
+    df['data'] = pd.to_datetime(df['data'], errors='coerce')
+    return analytics.narrative_stats(df.dropna(subset=['data']))
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+@tracing.traced("linhas_do_tempo_rebuild")
+def _linhas_do_tempo(versao, setores):
+    """Índice placa -> linhas do histórico com as linhas do tempo em cache LRU; um por versão dos dados."""
+    return vehicles.PlateTimelines(storage.load_range(filename=DATA_FILE_PATH, shards=setores), versao)
+
+def pagina_veiculos():
+    if "veiculos" not in USER_PERMISSIONS.get(st.session_state.get("current_user"), []):
+        st.warning("Você não tem permissão para acessar esta página.")
+        return
+
+    st.header("🚚 Veículos")
+    setores = _setores_sessao()
+    setores = tuple(setores) if setores is not None else None
+    linhas = _linhas_do_tempo(storage.data_version(DATA_FILE_PATH), setores)
+    placas = linhas.placas()
+    if not placas:
+        st.info("Nenhum abastecimento registrado ainda.")
+        return
+    _detalhe_veiculo(linhas, placas, setores)
+
+@st.fragment
+def _detalhe_veiculo(linhas, placas, setores):
+    """Trocar de placa só reexecuta este fragmento; a linha do tempo vem do cache LRU do índice.
+
+    Os gráficos ficam em cache por (versão, setores, placa): a mesma placa vista
+    por usuários de setores diferentes tem linhas do tempo diferentes.
+    """
+    placa = st.selectbox("Placa", placas, key="veiculo_placa", help="Digite para buscar a placa.")
+    resumo = linhas.summary(placa)
+    linha = linhas.timeline(placa)
+    chave = (linhas.versao, setores, placa)
+
+    k1, k2, k3, k4, k5 = st.columns(5)
+    with k1: st.metric("⛽ Abastecimentos", resumo["requisicoes"])
+    with k2: st.metric("🛢 Litros", f"{resumo['litros']:,.2f}")
+    with k3: st.metric("💰 Valor", f"R$ {resumo['valor']:,.2f}")
+    with k4: st.metric("📏 Km/L", f"{resumo['km_por_litro']:,.2f}" if resumo["km_por_litro"] else "—")
+    with k5: st.metric("💸 R$/km", f"R$ {resumo['custo_km']:,.2f}" if resumo["custo_km"] else "—")
+    periodo = " a ".join(f"{d:%d/%m/%Y}" for d in (resumo["primeira"], resumo["ultima"]) if pd.notna(d))
+    odometro = f"Odômetro: {resumo['odometro']:,.0f} km · " if resumo["odometro"] else ""
+    st.caption(f"{odometro}{resumo['km_rodados']:,.0f} km entre leituras registradas · {periodo}")
+
+    col_litros, col_km = st.columns(2)
+    with col_litros:
+        st.subheader("Abastecimentos")
+        st.plotly_chart(_figura_veiculo_abastecimentos(chave, linha), use_container_width=True)
+    with col_km:
+        st.subheader("Odômetro")
+        st.plotly_chart(_figura_veiculo_odometro(chave, linha), use_container_width=True)
+
+    col_postos, col_ultimos = st.columns(2)
+    with col_postos:
+        st.subheader("Postos utilizados")
+        st.dataframe(
+            linhas.postos(placa), hide_index=True, use_container_width=True,
+            column_config={
+                "Posto": st.column_config.TextColumn("Posto"),
+                "vezes": st.column_config.NumberColumn("Vezes"),
+                "litros": st.column_config.NumberColumn("Litros", format="%.2f"),
+                "valor": st.column_config.NumberColumn("Valor (R$)", format="%.2f"),
+                "preco_medio": st.column_config.NumberColumn("R$/L médio", format="%.3f"),
+            },
+        )
+    with col_ultimos:
+        st.subheader("Histórico")
+        st.dataframe(
+            linha.iloc[::-1], hide_index=True, use_container_width=True,
+            column_config={
+                "data": st.column_config.DatetimeColumn("Data", format="DD/MM/YYYY"),
+                "total_litros": st.column_config.NumberColumn("Litros", format="%.2f"),
+                "valor_total": st.column_config.NumberColumn("Valor (R$)", format="%.2f"),
+                "km": st.column_config.NumberColumn("Odômetro", format="%.0f"),
+                "preco_litro": st.column_config.NumberColumn("R$/L", format="%.3f"),
+                "km_rodados": st.column_config.NumberColumn("Km rodados", format="%.0f"),
+                "km_por_litro": st.column_config.NumberColumn("Km/L", format="%.2f"),
+            },
+        )
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _figura_veiculo_abastecimentos(chave, _linha):
+    return px.bar(_linha, x='data', y='total_litros', color='Combustivel', hover_data=['Posto', 'valor_total'],
+                  labels={'data': 'Data', 'total_litros': 'Litros', 'Combustivel': 'Combustível',
+                          'valor_total': 'Valor (R$)'})
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _figura_veiculo_odometro(chave, _linha):
+    leituras = _linha[_linha['km'] > 0]
+    return px.line(leituras, x='data', y='km', markers=True, hover_data=['km_rodados', 'km_por_litro'],
+                   labels={'data': 'Data', 'km': 'Odômetro (km)', 'km_rodados': 'Km rodados', 'km_por_litro': 'Km/L'},
+                   color_discrete_sequence=[_settings.get("highlight_blue", "#1F77B4")])
+
 def pagina_narrativas():
     if "narrativas" not in USER_PERMISSIONS.get(st.session_state.get("current_user"), []):
         st.warning("Você não tem permissão para acessar esta página.")
@@ -921,21 +1622,37 @@ def pagina_narrativas():
     if LOGO_PATH and os.path.exists(LOGO_PATH):
         st.image(LOGO_PATH, width=120)
 
-    if st.session_state.df_abastecimentos.empty:
+    _narrativas()
+
+@st.fragment
+def _narrativas():
+    """Período + insights; trocar o período só reexecuta este fragmento."""
+    periodo = st.date_input("Período", value=(), help="Deixe em branco para analisar todo o histórico.")
+    inicio = periodo[0] if len(periodo) > 0 else None
+    fim = periodo[1] if len(periodo) > 1 else inicio
+
+    setores = _setores_sessao()
+    try:
+        stats = _estatisticas_narrativa(storage.data_version(DATA_FILE_PATH), inicio, fim,
+                                        tuple(setores) if setores is not None else None)
+    except Exception as e:
+        st.error(f"Erro ao carregar o histórico: {e}")
+        return
+    if not stats["requisicoes"]:
         st.info("Sem dados para gerar narrativas.")
         return
-    
-    df = st.session_state.df_abastecimentos.copy()
-    df['data'] = pd.to_datetime(df['data'], errors='coerce')
-    
-    df_filtered = df.dropna(subset=['data'])
-    
-    narratives = generate_narrative(df_filtered)
+    narratives = narrative_text(stats)
     
     st.markdown("### Insights Analíticos")
     for narrative in narratives:
         st.markdown(f"- {narrative}")
 
+    previsoes = forecast_narrative(_modelos_previsao(storage.data_version(DATA_FILE_PATH)))
+    if previsoes:
+        st.markdown("### Previsões")
+        for narrative in previsoes:
+            st.markdown(f"- {narrative}")
+
 def pagina_configuracoes():
     if "configuracoes" not in USER_PERMISSIONS.get(st.session_state.get("current_user"), []):
         st.warning("Você não tem permissão para acessar esta página.")
@@ -958,6 +1675,18 @@ def pagina_configuracoes():
         )
         smtp_password = st.text_input("SMTP Password (Senha de aplicativo)", value=settings.get("smtp_password", ""), type="password", autocomplete="new-password")
         smtp_use_tls = st.checkbox("Usar TLS (Recomendado para a maioria dos servidores)", value=settings.get("smtp_use_tls", True))
+        st.markdown("**Resumo diário por posto**")
+        resumo_ativo = st.checkbox("Agrupar requisições não urgentes em um resumo por posto", value=settings.get("resumo_ativo", False))
+        resumo_horarios = st.text_input("Horários de envio (HH:MM, separados por vírgula)",
+                                        value=", ".join(settings.get("resumo_horarios", digest.DEFAULT_HORARIOS)))
+        motor_analitico = settings.get("motor_analitico", "pandas")
+        if duckdb_backend.DUCKDB_AVAILABLE:
+            st.markdown("**Motor analítico**")
+            motor_analitico = st.radio(
+                "Dashboard e narrativas calculados com", ["pandas", "duckdb"],
+                index=1 if motor_analitico == "duckdb" else 0, horizontal=True,
+                help="DuckDB agrega em SQL direto sobre os arquivos, sem carregar o histórico na memória.",
+            )
         salvar = st.form_submit_button("Salvar configurações")
         
         if salvar:
@@ -970,18 +1699,187 @@ def pagina_configuracoes():
                     "smtp_user": smtp_user,
                     "smtp_password": smtp_password,
                     "smtp_use_tls": smtp_use_tls,
+                    "resumo_ativo": resumo_ativo,
+                    "resumo_horarios": digest.parse_horarios(resumo_horarios) or digest.DEFAULT_HORARIOS,
+                    "motor_analitico": motor_analitico,
                 }
-                ok = save_settings(new)
+                ok = save_settings({**settings, **new})
                 if ok:
                     st.success("Configurações salvas com sucesso.")
                     _settings.update(new)
+                    na_fila = sum(len(itens) for itens in digest.pending(DATA_FILE_PATH).values())
+                    if not resumo_ativo and na_fila:
+                        st.info(f"Resumo desligado: as {na_fila} requisição(ões) que estavam na fila "
+                                "serão enviadas em instantes.")
                 else:
                     st.error("Erro ao salvar configurações.")
     
+    _painel_setores()
+    _painel_resumos()
+    _painel_sincronizacao()
+    _painel_importacao()
+    _painel_consulta_sql()
+    _painel_desempenho()
+
     if st.button("Voltar para Requisições"):
         st.session_state.view_mode = "requisicoes"
         st.rerun()
 
+def _painel_setores():
+    """Setores (shards) que cada usuário carrega e edita, só para o administrador."""
+    if st.session_state.get('current_user') != "ADMINISTRADOR":
+        return
+    st.markdown("---")
+    st.markdown("### Setores por usuário")
+    st.caption("Cada sessão carrega só os dados dos setores do usuário; todos marcados = acesso a todos os setores.")
+    escolhas = {}
+    for usuario in USERS:
+        if usuario == "ADMINISTRADOR":
+            continue
+        atuais = setores_do_usuario(usuario)
+        escolhas[usuario] = st.multiselect(usuario, SETORES, default=[s for s in (atuais or SETORES) if s in SETORES],
+                                           key=f"setores_{usuario}")
+    if st.button("Salvar setores"):
+        novos = {u: (None if set(sel) == set(SETORES) else sel) for u, sel in escolhas.items()}
+        if save_settings({**load_settings(), "setores_por_usuario": novos}):
+            _settings["setores_por_usuario"] = novos
+            st.success("Setores atualizados; cada sessão recarrega seus dados na próxima interação.")
+
+def _painel_resumos():
+    """Fila do resumo por posto, com envio manual, só para o administrador."""
+    if st.session_state.get('current_user') != "ADMINISTRADOR":
+        return
+    st.markdown("---")
+    st.markdown("### Fila do resumo por posto")
+    fila = digest.pending(DATA_FILE_PATH)
+    if not fila:
+        st.info("Nenhuma requisição aguardando resumo.")
+        return
+    if not load_settings().get("resumo_ativo"):
+        st.caption("O resumo está desligado: estas requisições saem no próximo ciclo do envio automático.")
+    st.dataframe(
+        pd.DataFrame([{"Posto (e-mail)": email, "Requisições": len(itens), "Desde": min(i["em"] for i in itens)}
+                      for email, itens in fila.items()]),
+        hide_index=True, use_container_width=True,
+    )
+    if st.button("Enviar resumos agora"):
+        try:
+            enviados = _enviar_resumos(force=True)
+            st.success(f"Resumo enviado para {len(enviados)} posto(s).")
+        except Exception as e:
+            st.error(f"Erro ao enviar resumos: {e}")
+
+def _painel_sincronizacao():
+    """Troca incremental com o abastecimentos.db, só para o administrador."""
+    if st.session_state.get('current_user') != "ADMINISTRADOR" or not os.path.exists(sync.DB_PATH):
+        return
+    st.markdown("---")
+    st.markdown("### Sincronização com abastecimentos.db")
+    if st.button("Sincronizar agora"):
+        try:
+            resumo = sync.sync(DATA_FILE_PATH, sync.DB_PATH)
+        except Exception as e:
+            st.error(f"Erro na sincronização: {e}")
+            return
+        st.session_state.df_abastecimentos = load_data()
+        _aquecedor().notify()
+        st.success(
+            f"CSV → banco: {resumo['csv_para_db']['inseridos']} nova(s), {resumo['csv_para_db']['alterados']} alterada(s), "
+            f"{resumo['csv_para_db']['excluidos']} excluída(s). Banco → CSV: {resumo['db_para_csv']['inseridos']} nova(s), "
+            f"{resumo['db_para_csv']['alterados']} alterada(s), {resumo['db_para_csv']['excluidos']} excluída(s)."
+        )
+        if resumo["conflitos"]:
+            st.info(f"{resumo['conflitos']} linha(s) alteradas dos dois lados: mantida a versão do aplicativo.")
+
+def _painel_consulta_sql():
+    """Consultas SQL ad hoc sobre todo o histórico (DuckDB), só para o administrador."""
+    if st.session_state.get('current_user') != "ADMINISTRADOR" or not duckdb_backend.DUCKDB_AVAILABLE:
+        return
+    st.markdown("---")
+    st.markdown("### Consulta SQL")
+    st.caption(f"Somente leitura. A tabela `requisicoes` reúne arquivo e partição quente; "
+               f"no máximo {duckdb_backend.MAX_LINHAS_CONSULTA} linhas.")
+    sql = st.text_area("Consulta", value="SELECT Setor, sum(total_litros) AS litros FROM requisicoes GROUP BY Setor ORDER BY litros DESC",
+                       key="consulta_sql")
+    if not st.button("Executar consulta"):
+        return
+    try:
+        resultado = duckdb_backend.query(sql, DATA_FILE_PATH)
+    except Exception as e:
+        st.error(f"Erro na consulta: {e}")
+        return
+    st.dataframe(resultado, hide_index=True, use_container_width=True)
+
+def _painel_importacao():
+    """Importação de planilhas históricas em blocos, só para o administrador."""
+    if st.session_state.get('current_user') != "ADMINISTRADOR":
+        return
+    st.markdown("---")
+    st.markdown("### Importar histórico (CSV/XLSX)")
+    st.caption("Arquivos muito grandes: use `python importer.py arquivo.csv` no servidor.")
+    arquivo = st.file_uploader("Planilha", type=["csv", "xlsx"], key="importacao_arquivo")
+    if arquivo is None or not st.button("Importar"):
+        return
+    sufixo = os.path.splitext(arquivo.name)[1]
+    with tempfile.NamedTemporaryFile(suffix=sufixo, delete=False) as tmp:
+        # Copia em blocos: o arquivo enviado não é materializado de uma vez.
+        for bloco in iter(lambda: arquivo.read(1 << 20), b""):
+            tmp.write(bloco)
+    barra = st.progress(0.0, text="Importando...")
+    try:
+        relatorio = importer.import_file(
+            tmp.name, DATA_FILE_PATH,
+            on_progress=lambda r: barra.progress(r["fracao"], text=f"{r['lidas']} linhas lidas · {r['linhas_por_segundo']:.0f} linhas/s"),
+        )
+    except Exception as e:
+        st.error(f"Erro na importação: {e}")
+        return
+    finally:
+        os.remove(tmp.name)
+    st.session_state.df_abastecimentos = load_data()
+    _aquecedor().notify()
+    st.success(f"{relatorio['inseridas']} linha(s) importada(s), {relatorio['duplicadas']} duplicada(s) ignorada(s), "
+               f"{relatorio['rejeitadas']} rejeitada(s) em {relatorio['segundos']:.1f} s.")
+
+def _painel_desempenho():
+    """Resumo do log de desempenho (p50/p95 por operação), só para o administrador."""
+    if st.session_state.get('current_user') != "ADMINISTRADOR":
+        return
+    st.markdown("---")
+    st.markdown("### Desempenho por operação")
+    resumo = tracing.summarize(tracing.read_events())
+    if resumo.empty:
+        st.info("Nenhuma operação registrada ainda.")
+        return
+    st.dataframe(
+        resumo,
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            "op": st.column_config.TextColumn("Operação"),
+            "chamadas": st.column_config.NumberColumn("Chamadas"),
+            "p50_ms": st.column_config.NumberColumn("p50 (ms)", format="%.1f"),
+            "p95_ms": st.column_config.NumberColumn("p95 (ms)", format="%.1f"),
+            "linhas_media": st.column_config.NumberColumn("Linhas (média)", format="%.0f"),
+            "bytes_media": st.column_config.NumberColumn("Bytes (média)", format="%.0f"),
+        },
+    )
+    st.caption(f"Log: {tracing.TRACE_LOG_PATH}")
+    aquecimento = _aquecedor().status()
+    if aquecimento:
+        st.markdown("**Aquecimento dos caches**")
+        st.dataframe(
+            pd.DataFrame(aquecimento).assign(em=lambda d: pd.to_datetime(d["em"], unit="s")),
+            hide_index=True, use_container_width=True,
+            column_config={
+                "tarefa": st.column_config.TextColumn("Tarefa"),
+                "em": st.column_config.DatetimeColumn("Último", format="DD/MM/YYYY HH:mm:ss"),
+                "segundos": st.column_config.NumberColumn("Duração (s)", format="%.2f"),
+                "erro": st.column_config.TextColumn("Erro"),
+            },
+        )
+
+@st.cache_data(show_spinner=False)
 def _get_base64_image(image_path):
     if os.path.exists(image_path):
         with open(image_path, "rb") as img_file:
@@ -1025,25 +1923,31 @@ def main():
     if "logged_in" not in st.session_state:
         st.session_state.logged_in = False
     
-    if "df_abastecimentos" not in st.session_state:
-        st.session_state.df_abastecimentos = load_data()
-        if st.session_state.df_abastecimentos.empty:
-            initial_data = {
-                "id": [], "Placa": [], "valor_total": [], "total_litros": [], "data": [], "Referente": [],
-                "Odometro": [], "Posto": [], "Combustivel": [], "Condutor": [], "Unidade": [], "Setor": [],
-                "Status": [], "Subsetor": [], "Observacoes": [], "TanqueCheio": [], "DataUso": [],
-                "KmUso": [], "EmailPosto": [], "TipoPosto": [], "Supervisor": [], "Cidade": []
-            }
-            st.session_state.df_abastecimentos = pd.DataFrame(initial_data)
-            save_data(st.session_state.df_abastecimentos)
+    if "dados_arquivados" not in st.session_state:
+        try:
+            storage.freeze_closed_periods(DATA_FILE_PATH)
+        except Exception as e:
+            st.error(f"Erro ao arquivar meses fechados: {e}")
+        st.session_state.dados_arquivados = True
 
     if "show_new_req_form" not in st.session_state:
         st.session_state.show_new_req_form = False
 
+    _log_desempenho()
+    _agendador_resumos()
+    _aquecedor()
+
     if not st.session_state.logged_in:
         login_page()
         return
 
+    # Cada sessão carrega só os shards dos setores do usuário, ao entrar.
+    if st.session_state.get("df_setores") != (st.session_state.current_user, _setores_sessao()):
+        st.session_state.df_abastecimentos = load_data()
+        if st.session_state.df_abastecimentos.empty:
+            st.session_state.df_abastecimentos = storage.empty_frame()
+        st.session_state.df_setores = (st.session_state.current_user, _setores_sessao())
+
     st.sidebar.markdown(f'<div class="sidebar-logo-wrapper"><img src="data:image/png;base64,{_get_base64_image(LOGO_PATH)}" width="150"></div>', unsafe_allow_html=True)
     st.sidebar.title("Menu")
     
@@ -1058,6 +1962,10 @@ def main():
         button_class = "current" if st.session_state.get("view_mode") == "dashboard" else ""
         if st.sidebar.button("📊 Dashboard", key="btn_dash"):
             st.session_state.view_mode = "dashboard"
+    if "veiculos" in allowed_pages:
+        button_class = "current" if st.session_state.get("view_mode") == "veiculos" else ""
+        if st.sidebar.button("🚚 Veículos", key="btn_veic"):
+            st.session_state.view_mode = "veiculos"
     if "narrativas" in allowed_pages:
         button_class = "current" if st.session_state.get("view_mode") == "narrativas" else ""
         if st.sidebar.button("🧠 Narrativas", key="btn_nar"):
@@ -1076,14 +1984,17 @@ def main():
     if "view_mode" not in st.session_state or st.session_state.view_mode not in allowed_pages:
         st.session_state.view_mode = allowed_pages[0] if allowed_pages else "requisicoes"
 
-    if st.session_state.view_mode == "requisicoes":
-        pagina_requisicoes()
-    elif st.session_state.view_mode == "dashboard":
-        pagina_dashboard()
-    elif st.session_state.view_mode == "narrativas":
-        pagina_narrativas()
-    elif st.session_state.view_mode == "configuracoes":
-        pagina_configuracoes()
+    with tracing.trace(f"pagina_{st.session_state.view_mode}"):
+        if st.session_state.view_mode == "requisicoes":
+            pagina_requisicoes()
+        elif st.session_state.view_mode == "dashboard":
+            pagina_dashboard()
+        elif st.session_state.view_mode == "veiculos":
+            pagina_veiculos()
+        elif st.session_state.view_mode == "narrativas":
+            pagina_narrativas()
+        elif st.session_state.view_mode == "configuracoes":
+            pagina_configuracoes()
 
 if __name__ == "__main__":
     main()
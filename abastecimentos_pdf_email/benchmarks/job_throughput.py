@@ -0,0 +1,111 @@
+"""Submission latency and throughput: synchronous index() vs. the job queue.
+
+Concurrent clients POST the form through Flask's test client while the SMTP
+send is replaced by a fixed delay, so the numbers show how long a user waits
+for the response and how many requisitions per second the app completes.
+
+Usage: python benchmarks/job_throughput.py [--clients 8] [--requests 10] [--smtp-delay 0.2] [--workers 4]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))  # app.py uses flat imports
+
+FORM = {
+    'placa': 'ABC1D23', 'justificativa': 'Rota de coleta semanal', 'supervisor': 'Ana Souza',
+    'setor': 'Logística', 'quantidade_litros': '80', 'tipo_combustivel': 'Diesel S10',
+}
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def _run(app_module, clients, per_client, synchronous):
+    client_app = app_module.app
+
+    def submit(_):
+        latencies = []
+        with client_app.test_client() as client:
+            for _ in range(per_client):
+                start = time.perf_counter()
+                response = client.post('/', data=FORM, headers={'Accept': 'application/json'})
+                latencies.append(time.perf_counter() - start)
+                if synchronous:
+                    continue
+                assert response.status_code == 202, response.status_code
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        latencies = [lat for result in pool.map(submit, range(clients)) for lat in result]
+    submitted = time.perf_counter() - start
+    failed = 0
+    if not synchronous:
+        total = clients * per_client
+        # Jobs that end 'failed' are finished too; waiting only for 'done' would spin forever.
+        while True:
+            counts = app_module.queue.counts()
+            if counts.get('done', 0) + counts.get('failed', 0) >= total:
+                failed = counts.get('failed', 0)
+                break
+            time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    return latencies, submitted, elapsed, failed
+
+
+def _report(label, latencies, submitted, elapsed, failed):
+    n = len(latencies)
+    print(f"{label}")
+    print(f"  POST latency  p50 {statistics.median(latencies) * 1000:8.1f} ms   "
+          f"p95 {_percentile(latencies, 0.95) * 1000:8.1f} ms   max {max(latencies) * 1000:8.1f} ms")
+    print(f"  all submitted {submitted:6.2f} s   all processed {elapsed:6.2f} s   "
+          f"throughput {n / elapsed:7.1f} req/s")
+    if failed:
+        print(f"  {failed} job(s) failed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=10, help='submissions per client')
+    parser.add_argument('--smtp-delay', type=float, default=0.2, help='seconds a simulated send takes')
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ['JOBS_DB_PATH'] = os.path.join(workdir, 'jobs.db')
+        os.environ['JOB_WORKERS'] = str(args.workers)
+        import app as app_module
+        app_module.app.config.update(WTF_CSRF_ENABLED=False)
+
+        def fake_send(to_address, subject, body, attachment_path):
+            time.sleep(args.smtp_delay)
+            return True, 'Email sent successfully.'
+        app_module.send_email_with_attachment = fake_send
+
+        def synchronous_enqueue(kind, data):
+            # The old behaviour: do the work inside the request
+            app_module.process_abastecimento(data)
+            return 0
+        queued_enqueue = app_module.enqueue
+
+        total = args.clients * args.requests
+        print(f"{args.clients} clients x {args.requests} submissions = {total}, "
+              f"simulated SMTP {args.smtp_delay * 1000:.0f} ms, {args.workers} workers\n")
+        app_module.enqueue = synchronous_enqueue
+        _report('synchronous (PDF + e-mail in the request)', *_run(app_module, args.clients, args.requests, True))
+        app_module.enqueue = queued_enqueue
+        _report('job queue (POST returns job id)', *_run(app_module, args.clients, args.requests, False))
+        app_module.workers.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""PDF throughput: FPDF line dump vs. WeasyPrint HTML rendering.
+
+Also compares rendering the template with a fresh Jinja environment per call
+(the old behaviour) against the cached, precompiled environment.
+
+Usage: python benchmarks/pdf_throughput.py [--count 50]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from jinja2 import Environment, FileSystemLoader
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src import pdf_generator  # noqa: E402
+
+DATA = {
+    "placa": "ABC1D23", "justificativa": "Rota de coleta semanal", "supervisor": "Ana Souza",
+    "setor": "Logística", "quantidade_litros": 80, "tipo_combustivel": "Diesel S10",
+}
+
+
+def _rate(label, count, func):
+    start = time.perf_counter()
+    for i in range(count):
+        func(i)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {count / elapsed:10.1f} /s   {elapsed / count * 1000:8.2f} ms each")
+
+
+def _uncached_render(_):
+    env = Environment(loader=FileSystemLoader(pdf_generator.TEMPLATES_DIR))
+    return env.get_template('pdf_template.html').render(DATA)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        out = lambda i: os.path.join(workdir, f"{i}.pdf")  # noqa: E731
+        _rate("template render, new Environment", args.count * 10, _uncached_render)
+        pdf_generator.precompile_templates()
+        _rate("template render, cached Environment", args.count * 10, lambda i: pdf_generator.render_pdf_template(DATA))
+        _rate("FPDF generate_pdf", args.count, lambda i: pdf_generator.generate_pdf(DATA, out(i)))
+        if pdf_generator.WEASYPRINT_AVAILABLE:
+            html = pdf_generator.render_pdf_template(DATA)
+            pdf_generator.html_to_pdf(html, out(-1))  # warm-up: fonts and stylesheet loaded once
+            _rate("WeasyPrint html_to_pdf (warm caches)", args.count,
+                  lambda i: pdf_generator.html_to_pdf(pdf_generator.render_pdf_template(DATA), out(i)))
+        else:
+            print("WeasyPrint not available (package or Pango/Cairo missing); HTML path skipped.")
+
+
+if __name__ == "__main__":
+    main()
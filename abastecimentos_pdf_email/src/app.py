@@ -1,36 +1,124 @@
-from flask import Flask, render_template, request, redirect, url_for
+import os
+import shutil
+import tempfile
+import time
+
+from flask import Flask, render_template, request, redirect, url_for, g, Response, jsonify
 from forms import AbastecimentoForm
-from pdf_generator import generate_pdf
-from emailer import send_email
+from pdf_generator import save_pdf_from_template, precompile_templates
+from emailer import send_email_with_attachment
+from utils import format_email_subject, format_pdf_filename
+from metrics import REGISTRY, CONTENT_TYPE
+from jobs import JobQueue, WorkerPool
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your_secret_key'
+precompile_templates()
+
+# Metrics for the hot paths, scraped from /metrics
+REQUEST_SECONDS = REGISTRY.histogram('http_request_duration_seconds', 'Latency of HTTP requests.', ('method', 'endpoint', 'status'))
+REQUESTS_TOTAL = REGISTRY.counter('http_requests_total', 'HTTP requests handled.', ('method', 'endpoint', 'status'))
+PDF_SECONDS = REGISTRY.histogram('pdf_generation_seconds', 'Time spent in pdf_generator.save_pdf_from_template.')
+EMAIL_SECONDS = REGISTRY.histogram('email_send_seconds', 'Time spent in emailer.send_email_with_attachment.', ('result',))
+EMAIL_FAILURES = REGISTRY.counter('email_send_failures_total', 'E-mails that could not be sent.')
+JOBS_ENQUEUED = REGISTRY.counter('jobs_enqueued_total', 'Jobs added to the background queue.', ('kind',))
+JOB_SECONDS = REGISTRY.histogram('job_duration_seconds', 'Time a worker spent on a job.', ('kind',))
+
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request(response):
+    start = g.pop('request_start', None)
+    if start is not None and request.endpoint != 'metrics':
+        labels = dict(method=request.method, endpoint=request.endpoint or 'unknown', status=str(response.status_code))
+        REQUEST_SECONDS.observe(time.perf_counter() - start, **labels)
+        REQUESTS_TOTAL.inc(**labels)
+    return response
+
+
+def process_abastecimento(data):
+    """Background job: render the PDF and e-mail it. Raises so the queue retries on failure."""
+    with JOB_SECONDS.time(kind='abastecimento'):
+        # One directory per job: concurrent jobs for the same plate must not share a file
+        workdir = tempfile.mkdtemp(prefix='abastecimento-')
+        try:
+            pdf_path = os.path.join(workdir, format_pdf_filename(data['placa']))
+            with PDF_SECONDS.time():
+                save_pdf_from_template(data, pdf_path)
+
+            to_address = os.getenv('EMAIL_DESTINO', os.getenv('EMAIL_USER'))
+            start = time.perf_counter()
+            ok, error = send_email_with_attachment(
+                to_address,
+                format_email_subject(data['placa']),
+                'Segue em anexo a requisição de abastecimento.',
+                pdf_path,
+            )
+            EMAIL_SECONDS.observe(time.perf_counter() - start, result='ok' if ok else 'erro')
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        if not ok:
+            EMAIL_FAILURES.inc()
+            raise RuntimeError(error or 'e-mail not sent')
+        return {'email': to_address}
+
+
+queue = JobQueue()
+workers = WorkerPool(queue, {'abastecimento': process_abastecimento}, workers=int(os.getenv('JOB_WORKERS', '4')))
+
+
+def enqueue(kind, data):
+    # Workers start lazily so importing the app (tests, reloader parent) spawns no threads.
+    workers.start()
+    JOBS_ENQUEUED.inc(kind=kind)
+    return queue.enqueue(kind, data)
+
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
     form = AbastecimentoForm()
     if form.validate_on_submit():
         # Collect form data
-        placa = form.placa.data
-        justificativa = form.justificativa.data
-        supervisor = form.supervisor.data
-        setor = form.setor.data
-        quantidade_litros = form.quantidade_litros.data
-        tipo_combustivel = form.tipo_combustivel.data
-        
-        # Generate PDF
-        pdf_path = generate_pdf(placa, justificativa, supervisor, setor, quantidade_litros, tipo_combustivel)
-        
-        # Send email with PDF attachment
-        send_email(pdf_path)
-        
-        return redirect(url_for('success'))
-    
+        data = {
+            'placa': form.placa.data,
+            'justificativa': form.justificativa.data,
+            'supervisor': form.supervisor.data,
+            'setor': form.setor.data,
+            'quantidade_litros': form.quantidade_litros.data,
+            'tipo_combustivel': form.tipo_combustivel.data,
+        }
+
+        # PDF and e-mail run in the worker pool; the user gets the job id right away
+        job_id = enqueue('abastecimento', data)
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify(job_id=job_id, status_url=url_for('job_status', job_id=job_id)), 202
+        return redirect(url_for('success', job=job_id))
+
     return render_template('index.html', form=form)
 
 @app.route('/success')
 def success():
-    return "Abastecimento registrado e e-mail enviado com sucesso!"
+    job_id = request.args.get('job', type=int)
+    if job_id is None:
+        return "Abastecimento registrado com sucesso!"
+    return (f"Abastecimento registrado! O PDF e o e-mail estão sendo processados "
+            f"(acompanhe em {url_for('job_status', job_id=job_id)}).")
+
+@app.route('/jobs/<int:job_id>')
+def job_status(job_id):
+    job = queue.get(job_id)
+    if job is None:
+        return jsonify(error='job not found'), 404
+    return jsonify({k: job[k] for k in ('id', 'kind', 'status', 'attempts', 'result', 'error',
+                                         'created_at', 'started_at', 'finished_at')})
+
+@app.route('/metrics')
+def metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True)
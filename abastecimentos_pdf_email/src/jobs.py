@@ -0,0 +1,190 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+JOBS_DB_PATH = os.getenv('JOBS_DB_PATH', os.path.join(os.path.dirname(__file__), 'jobs.db'))
+MAX_ATTEMPTS = 3
+STALE_AFTER = 300  # seconds a 'running' job may go without finishing before it is retried
+BACKOFF = 30  # seconds before the first retry; doubles on every further attempt
+MAX_BACKOFF = 3600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    next_attempt_at REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS jobs_status_id ON jobs (status, id);
+"""
+
+
+def retry_delay(attempts, backoff=BACKOFF):
+    """Seconds to wait after the `attempts`-th failed attempt (exponential, capped)."""
+    return min(backoff * 2 ** (attempts - 1), MAX_BACKOFF)
+
+
+class JobQueue:
+    """Durable FIFO of jobs stored in SQLite, safe to share between threads and processes."""
+
+    def __init__(self, path=JOBS_DB_PATH, backoff=BACKOFF):
+        self.path = path
+        self.backoff = backoff
+        self._local = threading.local()
+        self.wakeup = threading.Event()
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}
+        if 'next_attempt_at' not in columns:  # queue created before retries had a backoff
+            conn.execute('ALTER TABLE jobs ADD COLUMN next_attempt_at REAL NOT NULL DEFAULT 0')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, kind, payload):
+        cur = self._conn().execute(
+            'INSERT INTO jobs (kind, payload, created_at) VALUES (?, ?, ?)',
+            (kind, json.dumps(payload), time.time()),
+        )
+        self.wakeup.set()
+        return cur.lastrowid
+
+    def claim(self):
+        """Atomically take the oldest due job (or a stale running one); None if there is none.
+
+        A stale job whose worker already used up MAX_ATTEMPTS is marked failed
+        instead of being handed out again.
+        """
+        conn = self._conn()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'worker did not finish', finished_at = ? "
+                "WHERE status = 'running' AND started_at < ? AND attempts >= ?",
+                (now, now - STALE_AFTER, MAX_ATTEMPTS),
+            )
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE (status = 'queued' AND next_attempt_at <= ?) "
+                "OR (status = 'running' AND started_at < ?) ORDER BY id LIMIT 1",
+                (now, now - STALE_AFTER),
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ? WHERE id = ?",
+                    (now, row['id']),
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if row is None:
+            return None
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        job['attempts'] += 1
+        job['started_at'] = now
+        return job
+
+    def _finish(self, job_id, started_at, assignments, params):
+        # With `started_at`, only the worker holding the current claim may write:
+        # one whose job was reclaimed as stale gets False and leaves the row alone.
+        sql = f'UPDATE jobs SET {assignments} WHERE id = ?'
+        params = (*params, job_id)
+        if started_at is not None:
+            sql += " AND status = 'running' AND started_at = ?"
+            params += (started_at,)
+        return self._conn().execute(sql, params).rowcount > 0
+
+    def complete(self, job_id, result=None, started_at=None):
+        """Mark the job done; False if `started_at` no longer matches the current claim."""
+        return self._finish(job_id, started_at, "status = 'done', result = ?, error = NULL, finished_at = ?",
+                            (json.dumps(result), time.time()))
+
+    def fail(self, job_id, error, attempts, started_at=None):
+        """Requeue the job with exponential backoff until MAX_ATTEMPTS, then mark it failed."""
+        now = time.time()
+        status = 'queued' if attempts < MAX_ATTEMPTS else 'failed'
+        updated = self._finish(job_id, started_at, 'status = ?, error = ?, finished_at = ?, next_attempt_at = ?',
+                               (status, str(error), now, now + retry_delay(attempts, self.backoff)))
+        if updated and status == 'queued':
+            self.wakeup.set()
+        return updated
+
+    def get(self, job_id):
+        row = self._conn().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def counts(self):
+        return dict(self._conn().execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+
+
+class WorkerPool:
+    """Threads that pull jobs from a JobQueue and dispatch them to handlers by kind."""
+
+    def __init__(self, queue, handlers, workers=4, poll_interval=0.5):
+        self.queue = queue
+        self.handlers = handlers
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return self
+            self._stop.clear()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self.queue.wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def run_one(self):
+        """Process a single job if one is available; returns True when a job ran."""
+        job = self.queue.claim()
+        if job is None:
+            return False
+        handler = self.handlers.get(job['kind'])
+        try:
+            if handler is None:
+                raise LookupError(f"No handler for job kind {job['kind']!r}")
+            self.queue.complete(job['id'], handler(job['payload']), started_at=job['started_at'])
+        except Exception as e:
+            self.queue.fail(job['id'], e, job['attempts'], started_at=job['started_at'])
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self.run_one():
+                self.queue.wakeup.wait(self.poll_interval)
+                self.queue.wakeup.clear()
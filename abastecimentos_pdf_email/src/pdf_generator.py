@@ -1,7 +1,50 @@
 from fpdf import FPDF
-from jinja2 import Environment, FileSystemLoader
+from functools import lru_cache
+from jinja2 import Environment, FileSystemLoader, select_autoescape
 import os
 
+try:
+    from weasyprint import HTML, CSS
+    try:
+        from weasyprint.text.fonts import FontConfiguration
+    except ImportError:  # WeasyPrint < 53
+        from weasyprint.fonts import FontConfiguration
+    WEASYPRINT_AVAILABLE = True
+except (ImportError, OSError):  # OSError: Pango/Cairo missing on the host
+    WEASYPRINT_AVAILABLE = False
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), 'templates')
+
+# One environment per process: templates are compiled on first use and kept
+# in memory; auto_reload is off so renders never stat the template files.
+_env = Environment(
+    loader=FileSystemLoader(TEMPLATES_DIR),
+    autoescape=select_autoescape(['html']),
+    auto_reload=False,
+)
+
+
+def get_template(name='pdf_template.html'):
+    return _env.get_template(name)
+
+
+def precompile_templates():
+    """Compile every template up front (e.g. at app start-up)."""
+    for name in _env.list_templates(extensions=['html']):
+        _env.get_template(name)
+
+
+@lru_cache(maxsize=None)
+def _font_config():
+    return FontConfiguration()
+
+
+@lru_cache(maxsize=None)
+def _stylesheet(name='pdf_template.css'):
+    # Parsed once; WeasyPrint reuses the parsed rules and the loaded fonts.
+    return CSS(filename=os.path.join(TEMPLATES_DIR, name), font_config=_font_config())
+
+
 def generate_pdf(data, output_path):
     # Create a PDF document
     pdf = FPDF()
@@ -23,19 +66,21 @@ def generate_pdf(data, output_path):
     pdf.output(output_path)
 
 def render_pdf_template(data):
-    # Load the HTML template for the PDF
-    env = Environment(loader=FileSystemLoader(os.path.join(os.path.dirname(__file__), 'templates')))
-    template = env.get_template('pdf_template.html')
-    
-    # Render the template with the provided data
-    return template.render(data)
+    # Render the cached, precompiled template with the provided data
+    return get_template('pdf_template.html').render(data)
+
+def html_to_pdf(html_content, output_path):
+    """Render HTML to PDF with WeasyPrint, reusing the cached stylesheet and fonts."""
+    HTML(string=html_content, base_url=TEMPLATES_DIR).write_pdf(
+        output_path, stylesheets=[_stylesheet()], font_config=_font_config()
+    )
 
 def save_pdf_from_template(data, output_path):
     html_content = render_pdf_template(data)
-    
-    # Convert HTML to PDF (using a library like pdfkit or similar)
-    # This part is a placeholder; you would need to implement the conversion
-    # pdfkit.from_string(html_content, output_path)  # Uncomment when pdfkit is set up
 
-    # For now, just create a simple PDF with the data
-    generate_pdf(data, output_path)  # Fallback to simple PDF generation
+    if WEASYPRINT_AVAILABLE:
+        html_to_pdf(html_content, output_path)
+    else:
+        # WeasyPrint (or its system libraries) not installed: simple FPDF layout
+        generate_pdf(data, output_path)
+    return output_path
@@ -0,0 +1,92 @@
+import threading
+import time
+
+from src import jobs
+from src.jobs import JobQueue, WorkerPool, MAX_ATTEMPTS, BACKOFF, STALE_AFTER
+
+
+def test_enqueue_claim_complete(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.db'))
+    first = queue.enqueue('abastecimento', {'placa': 'ABC1D23'})
+    second = queue.enqueue('abastecimento', {'placa': 'XYZ9876'})
+
+    job = queue.claim()
+    assert job['id'] == first and job['payload'] == {'placa': 'ABC1D23'}
+    assert queue.get(first)['status'] == 'running'
+    queue.complete(first, {'email': 'posto@example.com'})
+
+    assert queue.get(first)['status'] == 'done'
+    assert queue.get(first)['result'] == {'email': 'posto@example.com'}
+    assert queue.claim()['id'] == second
+    assert queue.claim() is None
+
+
+def test_failed_job_is_retried_with_backoff_then_marked_failed(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(jobs.time, 'time', lambda: clock[0])
+    queue = JobQueue(str(tmp_path / 'jobs.db'))
+    calls = []
+
+    def flaky(payload):
+        calls.append(payload)
+        raise RuntimeError('smtp down')
+
+    pool = WorkerPool(queue, {'abastecimento': flaky})
+    job_id = queue.enqueue('abastecimento', {'placa': 'ABC1D23'})
+    for espera in (BACKOFF, 2 * BACKOFF):
+        assert pool.run_one()
+        assert not pool.run_one()  # not due yet: a short outage does not burn the attempts
+        clock[0] += espera
+    assert pool.run_one()
+
+    job = queue.get(job_id)
+    assert len(calls) == MAX_ATTEMPTS
+    assert job['status'] == 'failed' and job['error'] == 'smtp down'
+
+
+def test_stale_reclaims_are_capped_and_superseded_worker_cannot_write(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(jobs.time, 'time', lambda: clock[0])
+    queue = JobQueue(str(tmp_path / 'jobs.db'))
+    job_id = queue.enqueue('abastecimento', {'placa': 'ABC1D23'})
+
+    lento = queue.claim()
+    clock[0] += STALE_AFTER + 1
+    novo = queue.claim()
+    assert novo['id'] == job_id and novo['attempts'] == 2
+    # The first worker finally returns: its claim was superseded, the row is not touched
+    assert not queue.complete(job_id, {'email': 'tarde'}, started_at=lento['started_at'])
+    assert not queue.fail(job_id, 'tarde', lento['attempts'], started_at=lento['started_at'])
+    assert queue.get(job_id)['status'] == 'running'
+
+    for _ in range(MAX_ATTEMPTS - 2):
+        clock[0] += STALE_AFTER + 1
+        assert queue.claim()['id'] == job_id
+    clock[0] += STALE_AFTER + 1
+    assert queue.claim() is None
+    job = queue.get(job_id)
+    assert job['status'] == 'failed' and job['attempts'] == MAX_ATTEMPTS
+
+
+def test_worker_pool_runs_jobs_concurrently(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.db'))
+    running, peak, lock = [0], [0], threading.Lock()
+
+    def slow(payload):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        return payload['n']
+
+    pool = WorkerPool(queue, {'slow': slow}, workers=4, poll_interval=0.01).start()
+    ids = [queue.enqueue('slow', {'n': n}) for n in range(8)]
+    deadline = time.time() + 10
+    while queue.counts().get('done', 0) < len(ids) and time.time() < deadline:
+        time.sleep(0.01)
+    pool.stop()
+
+    assert [queue.get(i)['result'] for i in ids] == list(range(8))
+    assert peak[0] > 1
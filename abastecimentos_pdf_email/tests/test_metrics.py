@@ -0,0 +1,39 @@
+from src.metrics import Registry
+
+
+def test_counter_and_histogram_render():
+    registry = Registry()
+    requests_total = registry.counter('http_requests_total', 'HTTP requests handled.', ('method',))
+    latency = registry.histogram('pdf_generation_seconds', 'PDF time.', buckets=(0.1, 1.0))
+
+    requests_total.inc(method='GET')
+    requests_total.inc(2, method='POST')
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(3)
+
+    text = registry.render()
+    assert '# TYPE http_requests_total counter' in text
+    assert 'http_requests_total{method="GET"} 1' in text
+    assert 'http_requests_total{method="POST"} 2' in text
+    # Buckets are cumulative and always end in +Inf
+    assert 'pdf_generation_seconds_bucket{le="0.1"} 1' in text
+    assert 'pdf_generation_seconds_bucket{le="1.0"} 2' in text
+    assert 'pdf_generation_seconds_bucket{le="+Inf"} 3' in text
+    assert 'pdf_generation_seconds_count 3' in text
+
+
+def test_timer_decorator_and_reregistration():
+    registry = Registry()
+    hist = registry.histogram('email_send_seconds', 'E-mail time.')
+
+    @hist.time()
+    def send():
+        return 'ok'
+
+    assert send() == 'ok'
+    with hist.time():
+        pass
+    assert hist.count() == 2
+    # Registering the same name again returns the existing metric
+    assert registry.histogram('email_send_seconds', 'E-mail time.') is hist
@@ -0,0 +1,23 @@
+import os
+from src import pdf_generator
+
+
+def test_template_is_compiled_once():
+    first = pdf_generator.get_template()
+    assert pdf_generator.get_template() is first
+
+
+def test_render_escapes_html():
+    html = pdf_generator.render_pdf_template({"placa": "ABC1234", "justificativa": "<b>urgente</b>"})
+    assert "ABC1234" in html
+    assert "&lt;b&gt;urgente&lt;/b&gt;" in html
+
+
+def test_save_pdf_from_template(tmp_path):
+    output = str(tmp_path / "abastecimento.pdf")
+    data = {"placa": "ABC1234", "justificativa": "Rota", "supervisor": "Ana", "setor": "Logística",
+            "quantidade_litros": 50, "tipo_combustivel": "Gasolina"}
+
+    assert pdf_generator.save_pdf_from_template(data, output) == output
+    with open(output, "rb") as f:
+        assert f.read(4) == b"%PDF"
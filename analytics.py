@@ -0,0 +1,102 @@
+# =========================================================
+# Agregados analíticos das requisições
+# Cubo pré-calculado por mês x setor x subsetor x unidade x posto x combustível
+# x tipo x cidade x placa: os filtros do dashboard são respondidos sobre o cubo,
+# nunca sobre as linhas brutas.
+# =========================================================
+import pandas as pd
+
+CUBE_DIMENSIONS = ["mes", "Setor", "Subsetor", "Unidade", "Posto", "Combustivel", "TipoPosto", "Cidade"]
+CUBE_MEASURES = ["total_litros", "valor_total", "requisicoes"]
+
+
+def build_cube(df):
+    """Agrega as requisições no grão (dimensões do cubo + Placa).
+
+    A placa fica no grão para que "veículos distintos" e o top de placas
+    também saiam do cubo. Dimensões viram categóricas para filtrar rápido.
+    """
+    columns = CUBE_DIMENSIONS + ["Placa"] + CUBE_MEASURES
+    if df.empty:
+        return pd.DataFrame({c: [] for c in columns})
+    data = pd.to_datetime(df["data"], errors="coerce")
+    base = pd.DataFrame({"mes": data.dt.to_period("M")})
+    for col in CUBE_DIMENSIONS[1:] + ["Placa"]:
+        base[col] = df[col].fillna("").astype(str).str.strip() if col in df.columns else ""
+    base["total_litros"] = pd.to_numeric(df["total_litros"], errors="coerce").fillna(0)
+    base["valor_total"] = pd.to_numeric(df["valor_total"], errors="coerce").fillna(0)
+    base["requisicoes"] = 1
+    base = base[base["mes"].notna()]
+
+    cube = base.groupby(CUBE_DIMENSIONS + ["Placa"], observed=True, sort=False)[CUBE_MEASURES].sum().reset_index()
+    for col in CUBE_DIMENSIONS[1:] + ["Placa"]:
+        cube[col] = cube[col].astype("category")
+    return cube
+
+
+def dimension_values(cube, dimension):
+    """Valores existentes de uma dimensão, para montar os filtros."""
+    if cube.empty:
+        return []
+    return sorted(v for v in cube[dimension].unique() if v != "")
+
+
+def slice_cube(cube, inicio=None, fim=None, **filtros):
+    """Recorta o cubo por intervalo de meses e por listas de valores das dimensões.
+
+    `inicio`/`fim` são períodos mensais (ou textos 'AAAA-MM') inclusivos; filtros
+    vazios ou None não restringem.
+    """
+    if cube.empty:
+        return cube
+    mask = pd.Series(True, index=cube.index)
+    if inicio is not None:
+        mask &= cube["mes"] >= pd.Period(inicio, freq="M")
+    if fim is not None:
+        mask &= cube["mes"] <= pd.Period(fim, freq="M")
+    for dimension, valores in filtros.items():
+        if valores:
+            mask &= cube[dimension].isin(valores)
+    return cube[mask]
+
+
+def cube_kpis(cube):
+    """(veículos distintos, total de litros, valor total) de um recorte do cubo."""
+    if cube.empty:
+        return 0, 0.0, 0.0
+    placas = cube.loc[cube["Placa"] != "", "Placa"]
+    return int(placas.nunique()), float(cube["total_litros"].sum()), float(cube["valor_total"].sum())
+
+
+def rollup(cube, dimension, measure="total_litros"):
+    """Soma de uma medida por uma dimensão do cubo (ex.: por mês, por combustível)."""
+    out = cube.groupby(dimension, observed=True)[measure].sum().reset_index()
+    if dimension == "mes":
+        out = out.sort_values("mes")
+        out["mes"] = out["mes"].dt.start_time
+    return out
+
+
+def narrative_stats(df):
+    """Números usados pelas narrativas: totais, placa que mais consumiu, mês de pico e média.
+
+    Chaves ausentes quando não há dados para calculá-las (mesmo contrato do
+    motor SQL em duckdb_backend.narrative_stats).
+    """
+    stats = {
+        "total_litros": float(df["total_litros"].sum()) if "total_litros" in df.columns else 0.0,
+        "total_valor": float(df["valor_total"].sum()) if "valor_total" in df.columns else 0.0,
+        "requisicoes": int(len(df)),
+    }
+    if df.empty:
+        return stats
+    if "Placa" in df.columns:
+        por_placa = df.groupby("Placa")["total_litros"].sum()
+        stats["top_placa"], stats["top_consumo"] = por_placa.idxmax(), float(por_placa.max())
+    if "data" in df.columns:
+        mensal = df.groupby(pd.to_datetime(df["data"]).dt.to_period("M"))["total_litros"].sum()
+        if not mensal.empty:
+            stats["pico_mes"], stats["pico_consumo"] = mensal.idxmax().to_timestamp(), float(mensal.max())
+    if "total_litros" in df.columns:
+        stats["media_litros"] = float(df["total_litros"].mean())
+    return stats
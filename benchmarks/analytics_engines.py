@@ -0,0 +1,159 @@
+"""Motores analíticos lado a lado: pandas vs. DuckDB.
+
+Gera um histórico sintético de vários meses (segmentos .csv.gz congelados +
+partição quente, numa pasta temporária) e mede, para cada motor, o que o
+dashboard e as narrativas fazem: montar o cubo de todo o histórico e calcular
+os números das narrativas para todo o período e para os últimos 3 meses.
+Cada motor roda num subprocesso próprio, para que o pico de memória (RSS)
+informado seja só dele. Confere também que os dois chegam aos mesmos números.
+
+Uso: python benchmarks/analytics_engines.py [--linhas 200000] [--meses 24] [--repeticoes 4]
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import analytics  # noqa: E402
+import duckdb_backend  # noqa: E402
+import storage  # noqa: E402
+
+
+def _gerar(path, linhas, meses, seed=0):
+    rng = np.random.default_rng(seed)
+    hoje = pd.Timestamp.today().normalize()
+    dias = rng.integers(0, meses * 30, linhas)
+    litros = rng.uniform(10, 200, linhas).round(2)
+    df = pd.DataFrame({
+        "Placa": [f"ABC-{i:04d}" for i in rng.integers(0, 400, linhas)],
+        "data": (hoje - pd.to_timedelta(dias, unit="D")).strftime("%Y-%m-%d"),
+        "total_litros": litros,
+        "valor_total": (litros * rng.uniform(5, 7, linhas)).round(2),
+        "Posto": rng.choice(["R A Mendes", "Petronorte", "Linhares", "Rede K"], linhas),
+        "Combustivel": rng.choice(["Gasolina", "Etanol", "Diesel S10", "Diesel S500"], linhas),
+        "Setor": rng.choice(["Abatedouro", "Incubatório", "CD Paraíso"], linhas),
+        "Cidade": rng.choice(["Araguaína", "Paraíso do Tocantins", "Palmas"], linhas),
+        "Status": "Abastecida",
+    })
+    storage.append_bulk(df.to_dict("records"), path)
+
+
+def _pico_mb():
+    """Pico de RSS do subprocesso (o ru_maxrss no Linux herda o do processo pai no fork)."""
+    try:
+        with open("/proc/self/status") as f:
+            return next(int(linha.split()[1]) for linha in f if linha.startswith("VmHWM:")) / 1024
+    except (OSError, StopIteration):
+        pass
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / 2**20 if sys.platform == "darwin" else pico / 1024
+
+
+def _medir(motor, path, repeticoes):
+    """Executado no subprocesso: tempos por operação, resultados e pico de memória."""
+    inicio_recente = (pd.Timestamp.today() - pd.DateOffset(months=3)).normalize()
+    if motor == "pandas":
+        def cubo():
+            return analytics.build_cube(storage.load_range(filename=path))
+
+        def narrativa(inicio=None):
+            df = storage.load_range(inicio, None, filename=path)
+            return analytics.narrative_stats(df.dropna(subset=["data"]))
+    else:
+        def cubo():
+            return duckdb_backend.build_cube(path)
+
+        def narrativa(inicio=None):
+            return duckdb_backend.narrative_stats(path, inicio)
+
+    operacoes = {
+        "cubo": cubo,
+        "narrativa (tudo)": narrativa,
+        "narrativa (3 meses)": lambda: narrativa(inicio_recente),
+    }
+    tempos, resultados = {}, {}
+    for nome, operacao in operacoes.items():
+        amostras = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            resultado = operacao()
+            amostras.append(time.perf_counter() - inicio)
+        # 1ª execução fria; as seguintes já contam com o cache de segmentos do storage.
+        tempos[nome] = (amostras[0], statistics.median(amostras[1:] or amostras))
+        if nome == "cubo":
+            resultados[nome] = {"linhas": len(resultado), "litros": float(resultado["total_litros"].sum())}
+        else:
+            resultados[nome] = {k: (str(v) if isinstance(v, pd.Timestamp) else v) for k, v in resultado.items()}
+    return {"tempos": tempos, "resultados": resultados, "pico_mb": _pico_mb()}
+
+
+def _rodar(motor, path, repeticoes):
+    saida = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--motor", motor, "--arquivo", path, "--repeticoes", str(repeticoes)],
+        check=True, capture_output=True, text=True,
+    )
+    return json.loads(saida.stdout.splitlines()[-1])
+
+
+def _iguais(a, b):
+    if isinstance(a, float) or isinstance(b, float):
+        return abs(a - b) <= 1e-6 * max(abs(a), abs(b), 1)
+    return a == b
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--linhas", type=int, default=200000)
+    parser.add_argument("--meses", type=int, default=24, help="meses de histórico gerados")
+    parser.add_argument("--repeticoes", type=int, default=4)
+    parser.add_argument("--motor", help=argparse.SUPPRESS)
+    parser.add_argument("--arquivo", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.motor:
+        print(json.dumps(_medir(args.motor, args.arquivo, args.repeticoes)))
+        return
+    if not duckdb_backend.DUCKDB_AVAILABLE:
+        sys.exit("Instale o pacote duckdb para comparar os motores.")
+
+    workdir = tempfile.mkdtemp(prefix="analytics_engines_")
+    try:
+        path = os.path.join(workdir, "abastecimentos.csv")
+        inicio = time.perf_counter()
+        _gerar(path, args.linhas, args.meses)
+        segmentos = sum(len(p) for p in storage.list_partitions(path).values())
+        print(f"{args.linhas} requisições em {args.meses} meses ({segmentos} segmentos + partição quente), "
+              f"geradas em {time.perf_counter() - inicio:.1f} s; 1ª execução e mediana das {args.repeticoes - 1} seguintes\n")
+
+        medicoes = {motor: _rodar(motor, path, args.repeticoes) for motor in ("pandas", "duckdb")}
+        print(f"{'operação':<22} {'execução':<9} {'pandas ms':>10} {'duckdb ms':>10} {'ganho':>7}")
+        for nome, tempos_pandas in medicoes["pandas"]["tempos"].items():
+            for rotulo, t_pandas, t_duckdb in zip(("fria", "seguintes"), tempos_pandas, medicoes["duckdb"]["tempos"][nome]):
+                print(f"{nome:<22} {rotulo:<9} {t_pandas * 1000:>10.1f} {t_duckdb * 1000:>10.1f} {t_pandas / t_duckdb:>6.1f}x")
+        print(f"{'pico de memória (MB)':<32} {medicoes['pandas']['pico_mb']:>10.0f} {medicoes['duckdb']['pico_mb']:>10.0f}")
+
+        diferentes = [
+            f"{nome}.{chave}"
+            for nome, esperado in medicoes["pandas"]["resultados"].items()
+            for chave, valor in esperado.items()
+            if not _iguais(valor, medicoes["duckdb"]["resultados"][nome].get(chave))
+        ]
+        print("\nResultados idênticos nos dois motores." if not diferentes
+              else f"\nDIVERGÊNCIAS: {', '.join(diferentes)}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
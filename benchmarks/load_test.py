@@ -0,0 +1,273 @@
+"""Teste de carga: N sessões simultâneas no mesmo processo do app.
+
+Cada sessão é um streamlit.testing.AppTest próprio (session_state separado,
+caches st.cache_* compartilhados como num servidor real) rodando numa thread e
+repetindo um fluxo realista: login pelo formulário, abrir o dashboard, enviar
+uma requisição e, para o administrador, cancelar requisições pelo painel de
+ações. O e-mail vai para um servidor SMTP local mínimo (nada sai da máquina) e
+os dados são sintéticos, numa cópia temporária do app.
+
+O AppTest não é seguro entre threads (o runtime do Streamlit é global), então
+as execuções do script são serializadas por um lock — o mesmo que o GIL faz
+com reruns limitados por CPU num processo real. A latência informada é a que
+o usuário sentiria (espera na fila + execução); "exec" é só a execução.
+
+Para cada N informa percentis de latência por ação, vazão total e memória do
+processo (RSS atual e pico).
+
+Uso: python benchmarks/load_test.py [--sessoes 1,5,10,20] [--rodadas 3] [--linhas 20000] [--smtp-atraso 0.05]
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+from streamlit.testing.v1 import AppTest
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+from rerun_latency import synthetic_data  # noqa: E402
+
+USUARIOS = [  # (usuário, senha, é administrador)
+    ("ADMINISTRADOR", "ADMADMADM", True),
+    ("Antonio Edinaldo", "edinaldo321", False),
+    ("Rosimere Marques", "rosimere321", False),
+    ("Antonio Alfredo", "alfredo321", False),
+    ("Irisvan Martins", "irisvan321", False),
+]
+
+
+# ===========================
+# Servidor SMTP local
+# ===========================
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """O suficiente do protocolo para smtplib: EHLO, AUTH, MAIL/RCPT/DATA, QUIT."""
+
+    def _reply(self, text):
+        self.wfile.write(text.encode() + b"\r\n")
+
+    def handle(self):
+        self._reply("220 localhost SMTP de teste")
+        em_dados = False
+        for line in self.rfile:
+            if em_dados:
+                if line.rstrip(b"\r\n") == b".":
+                    em_dados = False
+                    time.sleep(self.server.atraso)
+                    with self.server.lock:
+                        self.server.mensagens += 1
+                    self._reply("250 OK")
+                continue
+            comando = line[:4].upper()
+            if comando == b"EHLO":
+                self.wfile.write(b"250-localhost\r\n250-AUTH PLAIN LOGIN\r\n250 SIZE 52428800\r\n")
+            elif comando == b"AUTH":
+                self._reply("235 Autenticado")
+            elif comando == b"DATA":
+                em_dados = True
+                self._reply("354 Envie a mensagem")
+            elif comando == b"QUIT":
+                self._reply("221 Tchau")
+                break
+            else:  # HELO, MAIL, RCPT, RSET, NOOP
+                self._reply("250 OK")
+
+
+class LocalSMTP(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, atraso=0.0):
+        super().__init__(("127.0.0.1", 0), _SMTPHandler)
+        self.atraso = atraso
+        self.mensagens = 0
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+# ===========================
+# Fluxos
+# ===========================
+_RUN_LOCK = threading.Lock()
+_EXECUCAO = threading.local()
+_run_original = AppTest._run  # usado por at.run() e por widget.run()
+
+
+def _run_serializado(self, *args, **kwargs):
+    with _RUN_LOCK:
+        inicio = time.perf_counter()
+        try:
+            return _run_original(self, *args, **kwargs)
+        finally:
+            _EXECUCAO.segundos = getattr(_EXECUCAO, "segundos", 0.0) + time.perf_counter() - inicio
+
+
+def _rss_mb():
+    """RSS atual do processo (Linux: /proc; nos demais, o pico informado pelo SO)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return _pico_mb()
+
+
+def _pico_mb():
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / 2**20 if sys.platform == "darwin" else pico / 1024
+
+
+class Sessao:
+    def __init__(self, app_path, usuario, senha, admin, tempos, execucao, erros):
+        self.at = AppTest.from_file(app_path, default_timeout=300)
+        self.usuario, self.senha, self.admin = usuario, senha, admin
+        self.tempos, self.execucao, self.erros = tempos, execucao, erros
+
+    def _medir(self, acao, passo):
+        _EXECUCAO.segundos = 0.0
+        inicio = time.perf_counter()
+        try:
+            passo()
+            if self.at.exception:
+                raise RuntimeError(self.at.exception[0].message)
+        except Exception as e:
+            self.erros[acao].append(str(e)[:120])
+        finally:
+            self.tempos[acao].append(time.perf_counter() - inicio)
+            self.execucao[acao].append(_EXECUCAO.segundos)
+
+    def login(self):
+        def passo():
+            self.at.run()
+            self.at.text_input[0].set_value(self.usuario)
+            self.at.text_input[1].set_value(self.senha)
+            self.at.button[0].click().run()
+        self._medir("login", passo)
+
+    def dashboard(self):
+        if not self.at.session_state["logged_in"] or self.usuario not in ("ADMINISTRADOR", "Antonio Edinaldo"):
+            return
+        self._medir("dashboard", lambda: self.at.button(key="btn_dash").click().run())
+
+    def enviar_requisicao(self):
+        def abrir():
+            self.at.button(key="btn_req").click().run()
+            next(b for b in self.at.button if b.label == "+ Nova Requisição").click().run()
+        self._medir("abrir_formulario", abrir)
+
+        def enviar():
+            campos = {t.label: t for t in self.at.text_input}
+            campos["Placa"].set_value(f"ABC{random.randint(0, 9)}D{random.randint(10, 99)}")
+            campos["Condutor"].set_value("Motorista de Teste")
+            campos["E-mail do Posto"].set_value("posto@exemplo.com")
+            campos["Cidade"].set_value("Araguaína")
+            self.at.text_area[0].set_value("Rota de entrega")
+            self.at.number_input[0].set_value(round(random.uniform(20, 150), 1))
+            next(b for b in self.at.button if b.label.startswith("Enviar")).click().run()
+            if self.at.error:
+                raise RuntimeError(self.at.error[0].value)
+        self._medir("enviar_requisicao", enviar)
+
+    def editar_admin(self):
+        if not self.admin:
+            return
+
+        def cancelar():
+            ids = self.at.session_state["df_abastecimentos"]["id"].sample(3).astype(int).tolist()
+            self.at.text_input(key="admin_ids").set_value(", ".join(map(str, ids))).run()
+            # A confirmação tem a seleção na chave (admin_confirmar_<hash dos ids>).
+            next(c for c in self.at.checkbox if c.key.startswith("admin_confirmar_")).check().run()
+            self.at.button(key="admin_cancelar").click().run()
+            if self.at.error:
+                # Conflito otimista com outra sessão admin: o app recarrega e pede para refazer.
+                raise RuntimeError(self.at.error[0].value)
+        self._medir("editar_admin", cancelar)
+
+    def executar(self, rodadas):
+        self.login()
+        for _ in range(rodadas):
+            self.dashboard()
+            self.enviar_requisicao()
+            self.editar_admin()
+
+
+def _preparar(workdir, linhas, smtp_port):
+    for name in os.listdir(ROOT):
+        if name.endswith(".py") or name == "Logo_FrangoAmericano_slogan_COLOR.png":
+            shutil.copy(os.path.join(ROOT, name), workdir)
+    with open(os.path.join(workdir, "settings.json"), "w", encoding="utf-8") as f:
+        json.dump({"smtp_server": "127.0.0.1", "smtp_port": smtp_port, "smtp_user": "frota@exemplo.com",
+                   "smtp_password": "x", "smtp_use_tls": False}, f)
+    dados = os.path.join(workdir, "abastecimentos.csv")
+    for extra in os.listdir(workdir):
+        if extra.startswith("abastecimentos.csv.") or extra in ("arquivo", "pdfs", "setores", "auditoria"):
+            caminho = os.path.join(workdir, extra)
+            shutil.rmtree(caminho) if os.path.isdir(caminho) else os.remove(caminho)
+    synthetic_data(linhas).to_csv(dados, index=False)
+    return os.path.join(workdir, "abastecimentos_app2.py")
+
+
+def _rodar(app_path, n, rodadas):
+    tempos, execucao, erros = defaultdict(list), defaultdict(list), defaultdict(list)
+    sessoes = [Sessao(app_path, *USUARIOS[i % len(USUARIOS)], tempos, execucao, erros) for i in range(n)]
+    threads = [threading.Thread(target=s.executar, args=(rodadas,)) for s in sessoes]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return tempos, execucao, erros, time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessoes", default="1,5,10,20", help="níveis de concorrência, separados por vírgula")
+    parser.add_argument("--rodadas", type=int, default=3, help="repetições do fluxo por sessão")
+    parser.add_argument("--linhas", type=int, default=20000)
+    parser.add_argument("--smtp-atraso", type=float, default=0.05, help="segundos que o SMTP local leva por mensagem")
+    args = parser.parse_args()
+
+    AppTest._run = _run_serializado
+    smtp = LocalSMTP(args.smtp_atraso)
+    workdir = tempfile.mkdtemp(prefix="load_test_")
+    try:
+        print(f"{args.linhas} requisições, {args.rodadas} rodadas por sessão, SMTP local na porta {smtp.port}")
+        print(f"RSS inicial {_rss_mb():.0f} MB\n")
+        print(f"{'N':>3} {'ação':<18} {'qtd':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'exec p50':>9} {'erros':>6}")
+        for n in [int(x) for x in args.sessoes.split(",") if x.strip()]:
+            app_path = _preparar(workdir, args.linhas, smtp.port)
+            enviados_antes = smtp.mensagens
+            tempos, execucao, erros, total = _rodar(app_path, n, args.rodadas)
+            for acao, valores in tempos.items():
+                p50, p95, p99 = np.percentile(np.array(valores) * 1000, [50, 95, 99])
+                exec_p50 = np.median(execucao[acao]) * 1000
+                print(f"{n:>3} {acao:<18} {len(valores):>5} {p50:>9.1f} {p95:>9.1f} {p99:>9.1f} {exec_p50:>9.1f} "
+                      f"{len(erros[acao]):>6}")
+            acoes = sum(len(v) for v in tempos.values())
+            print(f"{n:>3} {'total':<18} {acoes:>5} ações em {total:.1f} s = {acoes / total:.1f} ações/s, "
+                  f"{smtp.mensagens - enviados_antes} e-mails; RSS {_rss_mb():.0f} MB (pico {_pico_mb():.0f} MB)")
+            for acao, lista in erros.items():
+                if lista:
+                    print(f"      {acao}: {lista[0]}")
+            print()
+    finally:
+        AppTest._run = _run_original
+        smtp.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
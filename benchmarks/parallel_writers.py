@@ -0,0 +1,74 @@
+"""Vazão de gravação com vários processos no mesmo arquivo.
+
+Cada processo grava requisições uma a uma com storage.append_rows (o caminho
+de "Nova requisição"), disputando o lock de arquivo com os demais, numa pasta
+temporária. Para cada número de processos informa as gravações por segundo
+do processo mais lento e do mais rápido e a vazão total; a razão entre eles
+mostra se algum processo fica esperando o lock muito mais que os outros.
+
+Uso: python benchmarks/parallel_writers.py [--processos 1,2,4,8] [--gravacoes 50]
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import storage  # noqa: E402
+
+
+def _linha(worker, i):
+    row = {c: "" for c in storage.COLUMNS}
+    row.update({"Placa": f"ABC-{worker:02d}{i % 100:02d}", "data": time.strftime("%Y-%m-%d"),
+                "total_litros": 10.0, "valor_total": 50.0, "Odometro": 0, "KmUso": 0,
+                "Status": "Enviada", "Setor": "Abatedouro", "Referente": f"{worker}-{i}"})
+    return row
+
+
+def _gravar(path, worker, count, taxas):
+    start = time.perf_counter()
+    for i in range(count):
+        storage.append_rows([_linha(worker, i)], path)
+    taxas.put(count / (time.perf_counter() - start))
+
+
+def _rodar(workdir, n, gravacoes):
+    os.makedirs(os.path.join(workdir, str(n)))  # cada rodada com seus próprios shards
+    path = os.path.join(workdir, str(n), "abastecimentos.csv")
+    taxas = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=_gravar, args=(path, w, gravacoes, taxas)) for w in range(n)]
+    start = time.perf_counter()
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    total = time.perf_counter() - start
+    por_processo = sorted(taxas.get(timeout=5) for _ in range(n))
+    assert len(storage.load_hot(path)) == n * gravacoes, "gravações perdidas"
+    return por_processo, n * gravacoes / total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processos", default="1,2,4,8", help="números de processos, separados por vírgula")
+    parser.add_argument("--gravacoes", type=int, default=50, help="gravações por processo")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="writers_bench_")
+    try:
+        print(f"{args.gravacoes} gravações por processo (gravações/s)\n")
+        print(f"{'processos':>9} {'mais lento':>11} {'mais rápido':>12} {'razão':>7} {'total':>9}")
+        for n in (int(x) for x in args.processos.split(",")):
+            por_processo, total = _rodar(workdir, n, args.gravacoes)
+            print(f"{n:>9} {por_processo[0]:>11.1f} {por_processo[-1]:>12.1f} "
+                  f"{por_processo[-1] / por_processo[0]:>7.2f} {total:>9.1f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
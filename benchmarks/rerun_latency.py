@@ -0,0 +1,110 @@
+"""Latência de rerun: página inteira vs. fragmento.
+
+Roda o app com dados sintéticos (numa cópia temporária, sem tocar nos dados reais)
+via streamlit.testing.AppTest. Para cada página mede o rerun completo do script e,
+envolvendo st.fragment, o tempo de cada fragmento — que é o que uma interação
+dentro do fragmento (digitar no formulário, editar uma célula, trocar o período)
+passa a reexecutar.
+
+Uso: python benchmarks/rerun_latency.py [--linhas 20000] [--repeticoes 5]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import storage  # noqa: E402
+
+FRAGMENT_TIMES = defaultdict(list)
+_real_fragment = st.fragment
+
+
+def _timed_fragment(func=None, **kwargs):
+    # Mede o corpo de cada fragmento sem alterar o comportamento do decorator.
+    def wrap(f):
+        def timed(*a, **k):
+            start = time.perf_counter()
+            try:
+                return f(*a, **k)
+            finally:
+                FRAGMENT_TIMES[f.__name__].append(time.perf_counter() - start)
+        timed.__name__ = f.__name__
+        timed.__qualname__ = f.__qualname__
+        timed.__module__ = f.__module__
+        return _real_fragment(timed, **kwargs)
+    return wrap(func) if func is not None else wrap
+
+
+def synthetic_data(n, seed=0):
+    rng = np.random.default_rng(seed)
+    today = pd.Timestamp.today().normalize()
+    df = pd.DataFrame({c: "" for c in storage.COLUMNS}, index=range(n))
+    df["id"] = range(1, n + 1)
+    df["Placa"] = [f"ABC-{i:04d}" for i in rng.integers(0, 400, n)]
+    df["data"] = (today - pd.to_timedelta(rng.integers(0, 55, n), unit="D")).strftime("%Y-%m-%d")
+    df["total_litros"] = rng.uniform(10, 200, n).round(2)
+    df["valor_total"] = (df["total_litros"] * rng.uniform(5, 7, n)).round(2)
+    df["Posto"] = rng.choice(["R A Mendes", "Petronorte", "Linhares", "Rede K"], n)
+    df["Combustivel"] = rng.choice(["Gasolina", "Etanol", "Diesel S10", "Diesel S500"], n)
+    df["Setor"] = rng.choice(["Abatedouro", "Incubatório", "CD Paraíso"], n)
+    df["Subsetor"] = rng.choice(["Campo", "Congelados"], n)
+    df["Status"] = rng.choice(["Enviada", "Abastecida"], n)
+    df["Condutor"] = "Motorista"
+    df["Cidade"] = "Araguaína"
+    df["Observacoes"] = "Rota de entrega"
+    df["EmailPosto"] = "posto@exemplo.com"
+    df["TanqueCheio"] = 0
+    df["Odometro"] = rng.integers(1000, 90000, n)
+    df["KmUso"] = 0
+    df["Versao"] = 1
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--linhas", type=int, default=20000)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="rerun_bench_")
+    for name in os.listdir(ROOT):
+        if name.endswith(".py") or name in ("settings.json", "Logo_FrangoAmericano_slogan_COLOR.png"):
+            shutil.copy(os.path.join(ROOT, name), workdir)
+    synthetic_data(args.linhas).to_csv(os.path.join(workdir, "abastecimentos.csv"), index=False)
+
+    st.fragment = _timed_fragment
+    try:
+        print(f"{args.linhas} requisições, {args.repeticoes} repetições (mediana em ms)\n")
+        print(f"{'página':<14} {'rerun completo':>15}   fragmentos")
+        for page in ("requisicoes", "dashboard", "narrativas"):
+            at = AppTest.from_file(os.path.join(workdir, "abastecimentos_app2.py"), default_timeout=120)
+            at.session_state.logged_in = True
+            at.session_state.current_user = "ADMINISTRADOR"
+            at.session_state.view_mode = page
+            at.run()  # aquecimento: caches e primeira carga
+            FRAGMENT_TIMES.clear()
+            full = []
+            for _ in range(args.repeticoes):
+                start = time.perf_counter()
+                at.run()
+                full.append(time.perf_counter() - start)
+            frags = ", ".join(f"{name} {statistics.median(t) * 1000:.1f}" for name, t in FRAGMENT_TIMES.items())
+            print(f"{page:<14} {statistics.median(full) * 1000:>15.1f}   {frags}")
+    finally:
+        st.fragment = _real_fragment
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
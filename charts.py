@@ -0,0 +1,107 @@
+# =========================================================
+# Séries para os gráficos do dashboard
+# Agrupamento temporal no servidor e redução de pontos, para que o JSON
+# enviado ao navegador tenha tamanho limitado qualquer que seja o histórico.
+# =========================================================
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+MAX_POINTS = 400
+WEBGL_THRESHOLD = 1000
+
+# Granularidades tentadas, da mais fina para a mais grossa.
+FREQUENCIES = [("D", "%d/%m/%Y"), ("W", "%d/%m/%Y"), ("M", "%m/%Y"), ("Q", None), ("Y", "%Y")]
+
+
+def choose_frequency(dates, freq=None, max_points=MAX_POINTS):
+    """Granularidade mais fina (a partir de `freq`) com no máximo `max_points` períodos."""
+    dates = pd.to_datetime(pd.Series(dates), errors="coerce").dropna()
+    if dates.empty:
+        return freq or FREQUENCIES[0][0]
+    span_days = (dates.max() - dates.min()).days + 1
+    approx_days = {"D": 1, "W": 7, "M": 30.4, "Q": 91.3, "Y": 365.25}
+    start = 0 if freq is None else [f for f, _ in FREQUENCIES].index(freq)
+    for code, _ in FREQUENCIES[start:]:
+        if span_days / approx_days[code] <= max_points:
+            return code
+    return "Y"
+
+
+def bucket_time_series(df, date_col, value_col, freq=None, max_points=MAX_POINTS, agg="sum"):
+    """Agrega `value_col` por período de `date_col`.
+
+    Com `freq=None` escolhe a granularidade mais fina cujo número de períodos
+    não passa de `max_points`; com uma frequência fixa ela só é engrossada se
+    ultrapassar o limite. Retorna colunas `periodo` (início do período),
+    `rotulo` e `value_col`.
+    """
+    dates = pd.to_datetime(df[date_col], errors="coerce")
+    valid = dates.notna()
+    dates, values = dates[valid], df.loc[valid, value_col]
+    if dates.empty:
+        return pd.DataFrame({"periodo": [], "rotulo": [], value_col: []})
+
+    code = choose_frequency(dates, freq, max_points)
+    label_fmt = dict(FREQUENCIES)[code]
+    periods = dates.dt.to_period(code)
+    out = values.groupby(periods).agg(agg).reset_index()
+    out.columns = ["periodo", value_col]
+    if label_fmt is None:
+        out["rotulo"] = out["periodo"].astype(str)
+    else:
+        out["rotulo"] = out["periodo"].dt.start_time.dt.strftime(label_fmt)
+    out["periodo"] = out["periodo"].dt.start_time
+    return out[["periodo", "rotulo", value_col]]
+
+
+def _minmax_positions(y, max_points):
+    """Posições (ordenadas) dos pontos que downsample_minmax mantém."""
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+    buckets = max(max_points // 2, 1)
+    edges = np.linspace(0, n, buckets + 1).astype(int)
+    starts = edges[:-1]
+    lo = np.minimum.reduceat(y, starts)
+    hi = np.maximum.reduceat(y, starts)
+    # posição do mínimo/máximo dentro de cada bloco, sem laço em Python
+    block = np.repeat(np.arange(buckets), np.diff(edges))
+    is_lo = y == lo[block]
+    is_hi = y == hi[block]
+    pos_lo = np.full(buckets, -1)
+    pos_hi = np.full(buckets, -1)
+    idx = np.arange(n)
+    np.maximum.at(pos_lo, block[is_lo], idx[is_lo])
+    np.maximum.at(pos_hi, block[is_hi], idx[is_hi])
+    return np.unique(np.concatenate([pos_lo, pos_hi]))
+
+
+def downsample_minmax(x, y, max_points=MAX_POINTS):
+    """Reduz uma série a no máximo `max_points` pontos mantendo mínimos e máximos.
+
+    Divide a série em max_points/2 blocos e guarda o menor e o maior valor de
+    cada bloco, preservando picos que uma média esconderia.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=float)
+    keep = _minmax_positions(y, max_points)
+    return x[keep], y[keep]
+
+
+def line_figure(df, x, y, max_points=MAX_POINTS, **kwargs):
+    """px.line com redução de pontos; com `max_points=None` mantém todos e usa WebGL se for longa.
+
+    Com `color`, cada série (traço) é reduzida separadamente a `max_points`
+    pontos; as linhas mantidas vêm do próprio `df`, com todas as colunas
+    (cor, hover, etc.).
+    """
+    if max_points is not None and len(df) > max_points:
+        color = kwargs.get("color")
+        grupos = df.groupby(color, sort=False, dropna=False).indices.values() if color else [np.arange(len(df))]
+        y_values = df[y].to_numpy()
+        keep = np.concatenate([pos[_minmax_positions(y_values[pos], max_points)] for pos in grupos])
+        df = df.iloc[np.sort(keep)]
+    render_mode = "webgl" if len(df) > WEBGL_THRESHOLD else "auto"
+    return px.line(df, x=x, y=y, render_mode=render_mode, **kwargs)
@@ -0,0 +1,179 @@
+# =========================================================
+# Resumo diário por posto
+# Requisições não urgentes entram numa fila por EmailPosto; nos horários
+# configurados cada posto recebe uma única mensagem com um PDF de todas as
+# suas requisições, todas enviadas pela mesma conexão SMTP.
+# =========================================================
+import json
+import os
+import threading
+import time
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+import storage
+import tracing
+
+DEFAULT_HORARIOS = ["07:00", "13:00"]
+QUEUED_STATUS = "Na fila"
+
+
+def queue_path(filename=storage.DATA_FILE_PATH):
+    return f"{filename}.fila.json"
+
+
+def _read_queue(filename):
+    path = queue_path(filename)
+    if not os.path.exists(path):
+        return {"itens": [], "ultimo_envio": None}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def enqueue(req_id, email_posto, payload, filename=storage.DATA_FILE_PATH):
+    """Coloca a requisição `req_id` na fila do posto `email_posto`."""
+    with storage.file_lock(filename):
+        fila = _read_queue(filename)
+        fila["itens"].append({"id": int(req_id), "email": email_posto.strip().lower(), "payload": payload,
+                              "em": datetime.now().isoformat(timespec="seconds")})
+        storage.write_json_atomic(fila, queue_path(filename))
+
+
+def pending(filename=storage.DATA_FILE_PATH):
+    """{email do posto: [itens na fila]}."""
+    grupos = {}
+    for item in _read_queue(filename)["itens"]:
+        grupos.setdefault(item["email"], []).append(item)
+    return grupos
+
+
+def parse_horarios(texto):
+    """'07:00, 13:30' -> ['07:00', '13:30'] (ordenado, entradas inválidas ignoradas)."""
+    horarios = set()
+    for parte in str(texto or "").replace(";", ",").split(","):
+        parte = parte.strip()
+        try:
+            horarios.add(datetime.strptime(parte, "%H:%M").strftime("%H:%M"))
+        except ValueError:
+            continue
+    return sorted(horarios)
+
+
+def last_slot(horarios, now=None):
+    """Último horário de envio já alcançado (hoje ou ontem), ou None sem horários."""
+    now = now or datetime.now()
+    if not horarios:
+        return None
+    for dia in (now.date(), now.date() - timedelta(days=1)):
+        for horario in reversed(horarios):
+            slot = datetime.combine(dia, datetime.strptime(horario, "%H:%M").time())
+            if slot <= now:
+                return slot
+    return None
+
+
+def is_due(horarios, ultimo_envio, now=None):
+    """Há um horário de envio que passou depois do último resumo enviado?"""
+    slot = last_slot(horarios, now)
+    if slot is None:
+        return False
+    return ultimo_envio is None or datetime.fromisoformat(ultimo_envio) < slot
+
+
+def build_message(sender, to_email, subject, body_html, pdf_data, pdf_filename):
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body_html, 'html'))
+    part = MIMEApplication(pdf_data, _subtype="pdf")
+    part.add_header('Content-Disposition', 'attachment', filename=pdf_filename)
+    msg.attach(part)
+    return msg
+
+
+def _mark_sent(ids, filename):
+    """Requisições ainda 'Na fila' passam a 'Enviada'."""
+    hot = storage.load_hot(filename)
+    fila = hot[hot['id'].isin(ids) & (hot['Status'] == QUEUED_STATUS)]
+    if fila.empty:
+        return
+    try:
+        storage.update_rows({int(i): {'Status': 'Enviada'} for i in fila['id']},
+                            dict(zip(fila['id'].astype(int), fila['Versao'])), filename,
+                            usuario="resumo por e-mail")
+    except storage.ConflictError:
+        # Alguém alterou a linha enquanto o resumo saía; a alteração dele prevalece.
+        pass
+
+
+def flush(connect, build_pdf, sender, filename=storage.DATA_FILE_PATH, horarios=None, now=None, force=False,
+          on_sent=None):
+    """Envia um resumo por posto se algum horário venceu (ou se `force`).
+
+    `connect()` devolve um servidor SMTP já autenticado, aberto uma única vez
+    para todos os postos; `build_pdf(payloads)` monta o PDF com várias
+    requisições; `on_sent(ids, pdf, nome)` é chamado após cada envio bem-sucedido.
+    Retorna {email: [ids enviados]}. Itens cujo envio falha continuam na fila
+    para o próximo horário.
+    """
+    now = now or datetime.now()
+    with ExitStack() as stack:
+        try:
+            stack.enter_context(storage.file_lock(f"{queue_path(filename)}.envio", timeout=0))
+        except TimeoutError:
+            return {}  # outro processo já está enviando
+
+        fila = _read_queue(filename)
+        if not force and not is_due(horarios or DEFAULT_HORARIOS, fila.get("ultimo_envio"), now):
+            return {}
+        grupos = pending(filename)
+        enviados = {}
+        if grupos:
+            with tracing.trace("resumo_envio", postos=len(grupos)) as span, connect() as server:
+                for email, itens in grupos.items():
+                    pdf = build_pdf([item["payload"] for item in itens])
+                    nome = f"requisicoes_{now.strftime('%Y%m%d%H%M')}.pdf"
+                    msg = build_message(
+                        sender, email,
+                        f"Requisições de Abastecimento - resumo de {now.strftime('%d/%m/%Y %H:%M')}",
+                        f"<p>Prezado(a) Posto,</p><p>Seguem em anexo {len(itens)} requisição(ões) de abastecimento.</p>"
+                        "<p>Atenciosamente,</p><p>Equipe Frango Americano</p>",
+                        pdf, nome,
+                    )
+                    try:
+                        server.send_message(msg)
+                    except Exception:
+                        continue
+                    enviados[email] = [item["id"] for item in itens]
+                    if on_sent:
+                        on_sent(enviados[email], pdf, nome)
+                span["requisicoes"] = sum(len(ids) for ids in enviados.values())
+
+        enviados_ids = {i for ids in enviados.values() for i in ids}
+        with storage.file_lock(filename):
+            fila = _read_queue(filename)
+            fila["itens"] = [item for item in fila["itens"] if item["id"] not in enviados_ids]
+            fila["ultimo_envio"] = now.isoformat(timespec="seconds")
+            storage.write_json_atomic(fila, queue_path(filename))
+        if enviados_ids:
+            _mark_sent(list(enviados_ids), filename)
+        return enviados
+
+
+def start_scheduler(tick, interval=60):
+    """Thread de fundo que chama `tick()` a cada `interval` segundos."""
+    def _loop():
+        while True:
+            try:
+                tick()
+            except Exception:
+                pass
+            time.sleep(interval)
+
+    thread = threading.Thread(target=_loop, name="resumo-postos", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,208 @@
+# =========================================================
+# Motor analítico opcional (DuckDB)
+# As mesmas agregações do dashboard e das narrativas, mas em SQL direto sobre
+# os arquivos gravados (segmentos .csv.gz + partição quente): o DuckDB lê em
+# colunas, usa várias threads e pode transbordar para disco, então o
+# histórico não precisa caber na memória como um DataFrame.
+# Sem o pacote duckdb instalado, DUCKDB_AVAILABLE fica False e o app segue
+# com o caminho em pandas.
+# =========================================================
+import csv
+import gzip
+import os
+import re
+import tempfile
+import threading
+
+import pandas as pd
+
+import analytics
+import storage
+
+try:
+    import duckdb
+    DUCKDB_AVAILABLE = True
+except ImportError:
+    duckdb = None
+    DUCKDB_AVAILABLE = False
+
+MEMORY_LIMIT = "1GB"
+TIPOS = {
+    "id": "BIGINT", "valor_total": "DOUBLE", "total_litros": "DOUBLE", "Odometro": "DOUBLE",
+    "KmUso": "DOUBLE", "TanqueCheio": "INTEGER", "Versao": "INTEGER", "data": "TIMESTAMP", "DataUso": "TIMESTAMP",
+}
+MAX_LINHAS_CONSULTA = 5000
+
+_local = threading.local()
+
+
+def _connect():
+    """Uma conexão em memória por thread (o Streamlit atende cada sessão numa thread)."""
+    if not DUCKDB_AVAILABLE:
+        raise RuntimeError("Instale o pacote duckdb para usar o motor analítico SQL.")
+    con = getattr(_local, "con", None)
+    if con is None:
+        con = duckdb.connect(config={
+            "memory_limit": MEMORY_LIMIT,
+            "temp_directory": os.path.join(tempfile.gettempdir(), "abastecimentos_duckdb"),
+        })
+        _local.con = con
+    return con
+
+
+def _connect_restrito(arquivos):
+    """Conexão nova que só enxerga `arquivos`, para SQL digitado pelo usuário.
+
+    Sem isso um SELECT com read_text/read_csv leria qualquer arquivo do
+    servidor (settings.json, por exemplo). O acesso externo é desligado,
+    só os arquivos de dados ficam liberados e a configuração é travada para
+    a própria consulta não poder desfazer a restrição.
+    """
+    if not DUCKDB_AVAILABLE:
+        raise RuntimeError("Instale o pacote duckdb para usar o motor analítico SQL.")
+    con = duckdb.connect(config={
+        "memory_limit": MEMORY_LIMIT,
+        "temp_directory": os.path.join(tempfile.gettempdir(), "abastecimentos_duckdb"),
+    })
+    con.execute(f"SET allowed_paths = [{', '.join(_literal(p) for p in arquivos)}]")
+    con.execute("SET enable_external_access = false")
+    con.execute("SET lock_configuration = true")
+    return con
+
+
+def _files(filename, start=None, end=None):
+    """Arquivos a ler (segmentos congelados do intervalo + shards quentes), como storage.load_range."""
+    first = pd.Timestamp(start).to_period("M") if start is not None else None
+    last = pd.Timestamp(end).to_period("M") if end is not None else None
+    files = []
+    for month, paths in storage.list_partitions(filename).items():
+        period = pd.Period(month, freq="M")
+        if (first is None or period >= first) and (last is None or period <= last):
+            files.extend(paths)
+    return files + storage.hot_files(filename)
+
+
+def _header(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8", newline="") as f:
+        return tuple(next(csv.reader(f), ()))
+
+
+def _source(filename, start=None, end=None, arquivos=None):
+    """SQL (subconsulta) com as requisições tipadas de todas as partições, ou None sem arquivos.
+
+    Os cabeçalhos são lidos aqui e passados ao read_csv, que assim não precisa
+    amostrar cada arquivo para descobrir o formato; arquivos com cabeçalhos
+    diferentes (CSVs antigos sem Cidade/Versao) são lidos em grupos e unidos.
+    `arquivos` substitui a lista de _files quando ela já foi obtida.
+    """
+    grupos = {}
+    for path in arquivos if arquivos is not None else _files(filename, start, end):
+        header = _header(path)
+        if header:
+            grupos.setdefault(header, []).append(path)
+    if not grupos:
+        return None
+    partes = []
+    for header, paths in grupos.items():
+        lista = ", ".join(_literal(p) for p in paths)
+        tipos = ", ".join(f"{_literal(c)}: 'VARCHAR'" for c in header)
+        leitura = (f"read_csv([{lista}], header = true, auto_detect = false, delim = ',', quote = '\"', "
+                   f"escape = '\"', columns = {{{tipos}}})")
+        colunas = []
+        for col in storage.COLUMNS:
+            if col not in header:
+                colunas.append(f"NULL::{TIPOS.get(col, 'VARCHAR')} AS \"{col}\"")
+            elif col in TIPOS:
+                colunas.append(f"TRY_CAST(nullif(\"{col}\", '') AS {TIPOS[col]}) AS \"{col}\"")
+            else:
+                colunas.append(f"nullif(\"{col}\", '') AS \"{col}\"")
+        partes.append(f"SELECT {', '.join(colunas)} FROM {leitura}")
+    filtro = []
+    if start is not None:
+        filtro.append(f"data >= TIMESTAMP '{pd.Timestamp(start).normalize()}'")
+    if end is not None:
+        filtro.append(f"data < TIMESTAMP '{pd.Timestamp(end).normalize() + pd.Timedelta(days=1)}'")
+    where = f"WHERE {' AND '.join(filtro)}" if filtro else ""
+    return f"(SELECT * FROM ({' UNION ALL '.join(partes)}) {where})"
+
+
+def _literal(texto):
+    return "'" + texto.replace("'", "''") + "'"
+
+
+def build_cube(filename=storage.DATA_FILE_PATH):
+    """Mesmo resultado de analytics.build_cube(storage.load_range(...)), agregado em SQL."""
+    con = _connect()
+    fonte = _source(filename)
+    if fonte is None:
+        return analytics.build_cube(storage.empty_frame())
+    dims = ", ".join(f"coalesce(trim(\"{c}\"), '') AS \"{c}\"" for c in analytics.CUBE_DIMENSIONS[1:] + ["Placa"])
+    cube = con.execute(f"""
+        SELECT date_trunc('month', data) AS mes, {dims},
+               sum(coalesce(total_litros, 0)) AS total_litros,
+               sum(coalesce(valor_total, 0)) AS valor_total,
+               count(*) AS requisicoes
+        FROM {fonte}
+        WHERE data IS NOT NULL
+        GROUP BY ALL
+    """).df()
+    if cube.empty:
+        return analytics.build_cube(storage.empty_frame())
+    cube["mes"] = pd.to_datetime(cube["mes"]).dt.to_period("M")
+    cube["requisicoes"] = cube["requisicoes"].astype(int)
+    for col in analytics.CUBE_DIMENSIONS[1:] + ["Placa"]:
+        cube[col] = cube[col].astype("category")
+    return cube[analytics.CUBE_DIMENSIONS + ["Placa"] + analytics.CUBE_MEASURES]
+
+
+def narrative_stats(filename=storage.DATA_FILE_PATH, start=None, end=None):
+    """Mesmo dicionário de analytics.narrative_stats, com o filtro de período empurrado para o SQL."""
+    con = _connect()
+    fonte = _source(filename, start, end)
+    stats = {"total_litros": 0.0, "total_valor": 0.0, "requisicoes": 0}
+    if fonte is None:
+        return stats
+    # Só as colunas usadas, materializadas uma vez para as três agregações abaixo.
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE narrativa AS
+        SELECT data, Placa, total_litros, valor_total FROM {fonte} WHERE data IS NOT NULL
+    """)
+    n, litros, valor, media = con.execute("""
+        SELECT count(*), sum(coalesce(total_litros, 0)), sum(coalesce(valor_total, 0)), avg(coalesce(total_litros, 0))
+        FROM narrativa
+    """).fetchone()
+    stats.update(requisicoes=int(n), total_litros=float(litros or 0), total_valor=float(valor or 0))
+    if not n:
+        return stats
+    placa, consumo = con.execute("""
+        SELECT Placa, sum(coalesce(total_litros, 0)) AS s FROM narrativa WHERE Placa IS NOT NULL
+        GROUP BY Placa ORDER BY s DESC, Placa LIMIT 1
+    """).fetchone()
+    mes, pico = con.execute("""
+        SELECT date_trunc('month', data) AS m, sum(coalesce(total_litros, 0)) AS s FROM narrativa
+        GROUP BY m ORDER BY s DESC, m LIMIT 1
+    """).fetchone()
+    stats.update(top_placa=placa, top_consumo=float(consumo), pico_mes=pd.Timestamp(mes),
+                 pico_consumo=float(pico), media_litros=float(media))
+    return stats
+
+
+def query(sql, filename=storage.DATA_FILE_PATH, limit=MAX_LINHAS_CONSULTA):
+    """Consulta ad hoc (somente SELECT/WITH) sobre a visão `requisicoes` de todo o histórico.
+
+    Roda numa conexão própria que só lê os arquivos de dados (_connect_restrito);
+    tentativas de ler outros arquivos levantam duckdb.PermissionException.
+    """
+    if not re.match(r"^\s*(select|with)\b", sql, re.IGNORECASE) or ";" in sql.strip().rstrip(";"):
+        raise ValueError("Apenas uma consulta SELECT (ou WITH ... SELECT) é permitida.")
+    arquivos = _files(filename)
+    fonte = _source(filename, arquivos=arquivos)
+    if fonte is None:
+        fonte = "(SELECT " + ", ".join(f"NULL::{TIPOS.get(c, 'VARCHAR')} AS \"{c}\"" for c in storage.COLUMNS) + " LIMIT 0)"
+    con = _connect_restrito(arquivos)
+    try:
+        con.execute(f"CREATE TEMP VIEW requisicoes AS SELECT * FROM {fonte}")
+        return con.execute(f"SELECT * FROM ({sql.strip().rstrip(';')}) LIMIT {int(limit)}").df()
+    finally:
+        con.close()
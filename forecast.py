@@ -0,0 +1,143 @@
+# =========================================================
+# Previsão de consumo (litros e valor) por Setor e por Placa
+# Holt-Winters aditivo com tendência amortecida sobre as séries mensais do
+# cubo. Todas as séries de uma dimensão são ajustadas juntas: uma matriz
+# séries x meses percorrida mês a mês com numpy, avaliando de uma vez toda a
+# grade de parâmetros e escolhendo o melhor por série.
+# =========================================================
+import itertools
+
+import numpy as np
+import pandas as pd
+
+import analytics
+
+HORIZONTE = 3
+PERIODO_SAZONAL = 12
+AMORTECIMENTO = 0.9
+ALPHAS = (0.1, 0.3, 0.5, 0.8)
+BETAS = (0.0, 0.1, 0.3)
+GAMMAS = (0.0, 0.1, 0.3)
+MEDIDAS = {"litros": "total_litros", "valor": "valor_total"}
+
+
+def monthly_matrix(cube, dimension, measure="total_litros", ate=None):
+    """Séries mensais (linhas = valores da dimensão, colunas = meses) a partir do cubo.
+
+    `ate` é o último mês considerado ('AAAA-MM'); por padrão o mês anterior
+    ao corrente, para não projetar a partir de um mês ainda incompleto.
+    Meses sem consumo entram como zero.
+    """
+    ate = pd.Period(ate, freq="M") if ate is not None else pd.Period(pd.Timestamp.today(), freq="M") - 1
+    if cube.empty:
+        return pd.DataFrame()
+    dados = cube[(cube["mes"] <= ate) & (cube[dimension].astype(str) != "")]
+    if dados.empty:
+        return pd.DataFrame()
+    tabela = dados.groupby([dimension, "mes"], observed=True)[measure].sum().unstack("mes", fill_value=0.0)
+    meses = pd.period_range(tabela.columns.min(), ate, freq="M")
+    tabela = tabela.reindex(columns=meses, fill_value=0.0)
+    tabela.index = tabela.index.astype(str)
+    return tabela.astype(float)
+
+
+def fit(matrix, periodo=PERIODO_SAZONAL, phi=AMORTECIMENTO):
+    """Ajusta todas as séries de `matrix` num único passe vetorizado.
+
+    Retorna o modelo (dict) com o estado final de cada série e os
+    parâmetros escolhidos; `predict` projeta a partir dele sem reajustar.
+    """
+    y = matrix.to_numpy(dtype=float)
+    n_series, n_meses = y.shape if y.size else (0, 0)
+    sazonal = n_meses >= 2 * periodo
+    grade = np.array([p for p in itertools.product(ALPHAS, BETAS, GAMMAS if sazonal else (0.0,))])
+    alpha, beta, gamma = (grade[:, i, None] for i in range(3))  # (G, 1): combina com (G, S)
+
+    # Estado inicial: primeiro ano (com sazonalidade) ou primeiro mês.
+    if sazonal:
+        nivel0 = y[:, :periodo].mean(axis=1)
+        tendencia0 = (y[:, periodo:2 * periodo].mean(axis=1) - nivel0) / periodo
+        estacao0 = y[:, :periodo] - nivel0[:, None]
+    else:
+        nivel0 = y[:, 0] if n_meses else np.zeros(n_series)
+        tendencia0 = np.zeros(n_series)
+        estacao0 = np.zeros((n_series, periodo))
+    g = len(grade)
+    nivel = np.broadcast_to(nivel0, (g, n_series)).copy()
+    tendencia = np.broadcast_to(tendencia0, (g, n_series)).copy()
+    estacao = np.broadcast_to(estacao0, (g, n_series, periodo)).copy()
+    sse = np.zeros((g, n_series))
+
+    for t in range(n_meses):
+        s = estacao[:, :, t % periodo]
+        obs = y[:, t]
+        erro = obs - (nivel + phi * tendencia + s)
+        if t > 0:
+            sse += erro ** 2
+        novo_nivel = alpha * (obs - s) + (1 - alpha) * (nivel + phi * tendencia)
+        tendencia = beta * (novo_nivel - nivel) + (1 - beta) * phi * tendencia
+        estacao[:, :, t % periodo] = gamma * (obs - novo_nivel) + (1 - gamma) * s
+        nivel = novo_nivel
+
+    melhor = sse.argmin(axis=0) if n_series else np.zeros(0, dtype=int)
+    cols = np.arange(n_series)
+    return {
+        "chaves": list(matrix.index), "ultimo_mes": matrix.columns[-1] if n_meses else None,
+        "n_meses": n_meses, "periodo": periodo, "phi": phi,
+        "alpha": grade[melhor, 0], "beta": grade[melhor, 1], "gamma": grade[melhor, 2],
+        "nivel": nivel[melhor, cols], "tendencia": tendencia[melhor, cols], "estacao": estacao[melhor, cols],
+        "rmse": np.sqrt(sse[melhor, cols] / max(n_meses - 1, 1)),
+    }
+
+
+def predict(modelo, horizonte=HORIZONTE):
+    """Projeção dos próximos `horizonte` meses (linhas = chaves, colunas = meses), sem negativos."""
+    if not modelo["chaves"]:
+        return pd.DataFrame()
+    passos = np.arange(1, horizonte + 1)
+    amortecido = np.cumsum(modelo["phi"] ** passos)  # phi + phi² + ... + phi^h
+    n, periodo = modelo["n_meses"], modelo["periodo"]
+    estacao = modelo["estacao"][:, (n + passos - 1) % periodo]
+    valores = modelo["nivel"][:, None] + modelo["tendencia"][:, None] * amortecido[None, :] + estacao
+    meses = pd.period_range(modelo["ultimo_mes"] + 1, periods=horizonte, freq="M")
+    return pd.DataFrame(np.clip(valores, 0, None), index=modelo["chaves"], columns=meses)
+
+
+def fit_all(cube, dimensions=("Setor", "Placa"), ate=None):
+    """Modelos de litros e valor para cada dimensão: {dimensão: {'litros': modelo, 'valor': modelo}}."""
+    return {
+        dimension: {nome: fit(monthly_matrix(cube, dimension, coluna, ate)) for nome, coluna in MEDIDAS.items()}
+        for dimension in dimensions
+    }
+
+
+def forecast_table(modelos, dimension, horizonte=HORIZONTE):
+    """Tabela longa: dimensão, mes, litros, valor — pronta para exibir ou plotar."""
+    partes = []
+    for nome, modelo in modelos[dimension].items():
+        prev = predict(modelo, horizonte)
+        if prev.empty:
+            continue
+        longa = prev.stack().rename(nome)
+        longa.index.names = [dimension, "mes"]
+        partes.append(longa)
+    if not partes:
+        return pd.DataFrame({dimension: [], "mes": [], "litros": [], "valor": []})
+    return pd.concat(partes, axis=1).reset_index()
+
+
+def history_and_forecast(cube, modelos, dimension, chave, measure="litros", horizonte=HORIZONTE):
+    """Histórico mensal de uma série seguido da projeção, com a coluna 'tipo' para colorir o gráfico."""
+    coluna = MEDIDAS[measure]
+    modelo = modelos[dimension][measure]
+    recorte = analytics.slice_cube(cube, fim=modelo["ultimo_mes"], **{dimension: [chave]})
+    historico = analytics.rollup(recorte, "mes", coluna).rename(columns={coluna: measure})
+    historico["tipo"] = "Histórico"
+    prev = predict(modelo, horizonte)
+    if chave not in prev.index:
+        return historico
+    futuro = pd.DataFrame({"mes": prev.columns.to_timestamp(), measure: prev.loc[chave].to_numpy(), "tipo": "Previsão"})
+    if not historico.empty:
+        # O último mês real também abre a linha da previsão, para as duas se ligarem.
+        futuro = pd.concat([historico.tail(1).assign(tipo="Previsão"), futuro], ignore_index=True)
+    return pd.concat([historico, futuro], ignore_index=True)
@@ -0,0 +1,244 @@
+# =========================================================
+# Importação em lote de planilhas históricas (CSV/XLSX)
+# Lê o arquivo em blocos, mapeia as colunas para o esquema das requisições,
+# normaliza e valida Placa/Combustível de forma vetorizada, descarta linhas
+# já existentes por um índice de hashes e grava cada bloco de uma vez.
+# Linhas de meses fechados são acumuladas entre blocos e gravadas juntas
+# (um segmento por mês, não um por bloco); a memória fica limitada ao
+# bloco + o acúmulo (BUFFER_FECHADOS linhas) + 8 bytes por linha existente.
+# =========================================================
+import argparse
+import os
+import time
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+import storage
+import tracing
+
+CHUNK_SIZE = 50_000
+BUFFER_FECHADOS = 4 * CHUNK_SIZE
+
+# cabeçalho da planilha (sem acento, minúsculo) -> coluna do esquema
+COLUMN_ALIASES = {
+    "placa": "Placa", "veiculo": "Placa",
+    "data": "data", "data abastecimento": "data", "data do abastecimento": "data", "data da requisicao": "data",
+    "litros": "total_litros", "quantidade": "total_litros", "quantidade (l)": "total_litros", "total_litros": "total_litros",
+    "valor": "valor_total", "valor total": "valor_total", "valor_total": "valor_total",
+    "km": "Odometro", "odometro": "Odometro", "quilometragem": "Odometro",
+    "posto": "Posto", "combustivel": "Combustivel", "condutor": "Condutor", "motorista": "Condutor",
+    "unidade": "Unidade", "setor": "Setor", "subsetor": "Subsetor", "cidade": "Cidade",
+    "observacoes": "Observacoes", "justificativa": "Observacoes", "referente": "Referente",
+    "status": "Status", "supervisor": "Supervisor", "tipo": "TipoPosto", "referente do veiculo": "TipoPosto",
+}
+REQUIRED = ["Placa", "data"]
+PLACA_VALIDA = r"^[A-Z]{3}-(?:\d[A-Z]\d{2}|\d{4})$"
+
+
+def _strip_accents(text):
+    return "".join(c for c in unicodedata.normalize("NFKD", str(text)) if not unicodedata.combining(c))
+
+
+def map_columns(columns):
+    """{cabeçalho original: coluna do esquema} para os cabeçalhos reconhecidos."""
+    mapping = {}
+    for col in columns:
+        key = _strip_accents(col).strip().lower()
+        if key in COLUMN_ALIASES and COLUMN_ALIASES[key] not in mapping.values():
+            mapping[col] = COLUMN_ALIASES[key]
+    return mapping
+
+
+def normalize_placa(placas):
+    """Versão vetorizada de format_placa: 'abc1d23' -> 'ABC-1D23', 'abc 1234' -> 'ABC-1234'."""
+    s = placas.fillna("").astype(str).str.upper().str.replace(r"[-\s]", "", regex=True)
+    s = s.str.replace(r"^([A-Z]{3})(\d[A-Z]\d+)$", r"\1-\2", regex=True)
+    return s.str.replace(r"^([A-Z]{3})(\d{4,})$", r"\1-\2", regex=True)
+
+
+def normalize_combustivel(valores):
+    """Versão vetorizada de normalize_combustivel."""
+    texto = valores.fillna("").astype(str)
+    baixo = texto.str.lower()
+    escolhas = [
+        (baixo.str.contains("etanol"), "Etanol"),
+        (baixo.str.contains("gasolina"), "Gasolina"),
+        (baixo.str.contains("diesel s10"), "Diesel S10"),
+        (baixo.str.contains("diesel s500"), "Diesel S500"),
+        (baixo.str.contains("arla"), "Arla"),
+    ]
+    return pd.Series(np.select([c for c, _ in escolhas], [v for _, v in escolhas], default=texto.str.strip()),
+                     index=valores.index)
+
+
+def row_hashes(df):
+    """Hash de 64 bits por linha sobre placa, dia, litros, valor e posto."""
+    chave = pd.DataFrame({
+        "Placa": df["Placa"].fillna("").astype(str),
+        "data": pd.to_datetime(df["data"], errors="coerce").dt.normalize(),
+        "total_litros": pd.to_numeric(df["total_litros"], errors="coerce").fillna(0).astype(float).round(2),
+        "valor_total": pd.to_numeric(df["valor_total"], errors="coerce").fillna(0).astype(float).round(2),
+        "Posto": df["Posto"].fillna("").astype(str).str.strip(),
+    })
+    return pd.util.hash_pandas_object(chave, index=False).to_numpy()
+
+
+def existing_hashes(filename=storage.DATA_FILE_PATH):
+    """Índice ordenado dos hashes de todas as linhas já gravadas (quentes e congeladas)."""
+    # Um segmento por vez, para não manter o histórico inteiro em memória.
+    partes = [np.empty(0, dtype=np.uint64)]
+    for paths in storage.list_partitions(filename).values():
+        for path in paths:
+            partes.append(row_hashes(storage.normalize_types(pd.read_csv(path, compression="gzip"))))
+    hot = storage.load_hot(filename)
+    if not hot.empty:
+        partes.append(row_hashes(hot))
+    return np.unique(np.concatenate(partes))
+
+
+def parse_dates(valores):
+    """ISO (AAAA-MM-DD) primeiro; o que sobrar é lido como DD/MM/AAAA."""
+    datas = pd.to_datetime(valores, errors="coerce", format="ISO8601")
+    faltando = datas.isna() & valores.notna()
+    if faltando.any():
+        datas[faltando] = pd.to_datetime(valores[faltando], errors="coerce", dayfirst=True)
+    return datas
+
+
+def parse_numbers(valores):
+    """Aceita '1.234,56' (planilhas em português) além de '1234.56'."""
+    if valores.dtype != object:
+        return pd.to_numeric(valores, errors="coerce")
+    texto = valores.astype(str).str.strip()
+    br = texto.str.contains(",", regex=False)
+    texto = texto.where(~br, texto.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+    return pd.to_numeric(texto, errors="coerce")
+
+
+def prepare_chunk(raw, mapping):
+    """Bloco bruto -> (linhas válidas no esquema, quantidade rejeitada)."""
+    df = raw.rename(columns=mapping)[list(mapping.values())]
+    df = df.reindex(columns=storage.COLUMNS)
+    df["Placa"] = normalize_placa(df["Placa"])
+    df["Combustivel"] = normalize_combustivel(df["Combustivel"])
+    df["data"] = parse_dates(df["data"])
+    for col in ("total_litros", "valor_total", "Odometro"):
+        df[col] = parse_numbers(df[col])
+    df["Status"] = df["Status"].fillna("Abastecida")
+    df["TanqueCheio"] = 0
+    validas = df["Placa"].str.match(PLACA_VALIDA) & df["data"].notna() & (df["total_litros"].fillna(0) >= 0)
+    return df[validas].copy(), int((~validas).sum())
+
+
+def read_chunks(path, chunksize=CHUNK_SIZE):
+    """Itera (bloco, bytes lidos até aqui) sem carregar o arquivo inteiro."""
+    if path.lower().endswith((".xlsx", ".xlsm")):
+        try:
+            import openpyxl
+        except ImportError:
+            raise RuntimeError("Instale o pacote openpyxl para importar planilhas .xlsx.")
+        book = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        rows = book.active.iter_rows(values_only=True)
+        header = [str(h) if h is not None else "" for h in next(rows)]
+        bloco = []
+        for row in rows:
+            bloco.append(row)
+            if len(bloco) >= chunksize:
+                yield pd.DataFrame(bloco, columns=header), None
+                bloco = []
+        if bloco:
+            yield pd.DataFrame(bloco, columns=header), None
+        book.close()
+        return
+
+    with open(path, "r", encoding="utf-8-sig", errors="replace") as f:
+        primeira = f.readline()
+        f.seek(0)
+        sep = ";" if primeira.count(";") > primeira.count(",") else ","
+        for chunk in pd.read_csv(f, sep=sep, dtype=str, chunksize=chunksize):
+            yield chunk, f.tell()
+
+
+def import_file(path, filename=storage.DATA_FILE_PATH, chunksize=CHUNK_SIZE, on_progress=None, today=None):
+    """Importa `path` para o armazenamento e devolve o relatório final.
+
+    `on_progress(relatorio)` é chamado após cada bloco com as contagens
+    parciais, a fração lida do arquivo (quando conhecida) e a vazão.
+    As linhas de meses fechados só contam como inseridas quando o acúmulo
+    é gravado (ao passar de BUFFER_FECHADOS linhas e no fim do arquivo).
+    """
+    total_bytes = os.path.getsize(path)
+    relatorio = {"arquivo": os.path.basename(path), "lidas": 0, "inseridas": 0, "duplicadas": 0,
+                 "rejeitadas": 0, "blocos": 0, "segundos": 0.0, "linhas_por_segundo": 0.0, "fracao": 0.0}
+    inicio = time.perf_counter()
+    corte = storage.hot_cutoff(today)
+    fechados = []
+
+    def gravar_fechados():
+        # Uma única append_bulk para todo o acúmulo: um segmento novo por mês.
+        if fechados:
+            lote = pd.concat(fechados, ignore_index=True)
+            storage.append_bulk(lote, filename, today=today, usuario="importação")
+            relatorio["inseridas"] += len(lote)
+            fechados.clear()
+
+    with tracing.trace("importacao", arquivo=relatorio["arquivo"]) as span:
+        vistos = existing_hashes(filename)
+        mapping = None
+        for raw, posicao in read_chunks(path, chunksize):
+            if mapping is None:
+                mapping = map_columns(raw.columns)
+                faltando = [c for c in REQUIRED if c not in mapping.values()]
+                if faltando:
+                    raise ValueError(f"Colunas obrigatórias ausentes na planilha: {', '.join(faltando)}")
+            relatorio["lidas"] += len(raw)
+            df, rejeitadas = prepare_chunk(raw, mapping)
+            relatorio["rejeitadas"] += rejeitadas
+
+            hashes = row_hashes(df)
+            # repetidas dentro do bloco ou já presentes no índice
+            unicas = ~pd.Series(hashes).duplicated().to_numpy() & ~np.isin(hashes, vistos, assume_unique=False)
+            relatorio["duplicadas"] += int(len(df) - unicas.sum())
+            df = df[unicas]
+            if not df.empty:
+                vistos = np.union1d(vistos, hashes[unicas])
+                fechado = (df["data"] < corte).to_numpy()
+                if fechado.any():
+                    fechados.append(df[fechado])
+                if not fechado.all():
+                    storage.append_bulk(df[~fechado], filename, today=today, usuario="importação")
+                    relatorio["inseridas"] += int((~fechado).sum())
+                if sum(len(f) for f in fechados) >= BUFFER_FECHADOS:
+                    gravar_fechados()
+
+            relatorio["blocos"] += 1
+            relatorio["segundos"] = round(time.perf_counter() - inicio, 3)
+            relatorio["linhas_por_segundo"] = round(relatorio["lidas"] / max(relatorio["segundos"], 1e-9), 1)
+            if posicao is not None and total_bytes:
+                relatorio["fracao"] = min(posicao / total_bytes, 1.0)
+            if on_progress:
+                on_progress(dict(relatorio))
+        gravar_fechados()
+        relatorio["fracao"] = 1.0
+        relatorio["segundos"] = round(time.perf_counter() - inicio, 3)
+        relatorio["linhas_por_segundo"] = round(relatorio["lidas"] / max(relatorio["segundos"], 1e-9), 1)
+        span.update(linhas=relatorio["lidas"], inseridas=relatorio["inseridas"], bytes=total_bytes)
+    return relatorio
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importa planilhas históricas de abastecimento")
+    parser.add_argument("arquivo", help="CSV ou XLSX")
+    parser.add_argument("--csv", default=storage.DATA_FILE_PATH, help="arquivo de dados do aplicativo")
+    parser.add_argument("--bloco", type=int, default=CHUNK_SIZE, help="linhas por bloco")
+    args = parser.parse_args()
+    tracing.configure()
+
+    def _mostrar(r):
+        print(f"{r['fracao']:6.1%}  lidas={r['lidas']}  inseridas={r['inseridas']}  duplicadas={r['duplicadas']}  "
+              f"rejeitadas={r['rejeitadas']}  {r['linhas_por_segundo']:.0f} linhas/s", flush=True)
+
+    final = import_file(args.arquivo, args.csv, args.bloco, on_progress=_mostrar)
+    print(final)
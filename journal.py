@@ -0,0 +1,210 @@
+# =========================================================
+# Diário de alterações: trilha de auditoria, visão "como estava em" e restauração
+# Cada gravação do storage acrescenta uma entrada (quem, quando, quais ids e
+# colunas, valores antes/depois) em auditoria/alteracoes_AAAA-MM.jsonl.gz.
+# O estado numa data passada é reconstruído a partir dos dados atuais,
+# desfazendo só as entradas posteriores: o custo cresce com o que mudou
+# desde então, não com o tamanho do histórico. Pela mesma razão o backup
+# incremental é copiar os arquivos do diário, que só recebem acréscimos.
+# =========================================================
+import argparse
+import gzip
+import json
+import zlib
+
+import pandas as pd
+
+import storage
+
+OPERACOES = {"inclusao": "Inclusão", "alteracao": "Alteração", "exclusao": "Exclusão"}
+
+
+def _instante(quando):
+    """Data/hora no formato das entradas do diário (comparável como texto)."""
+    return pd.Timestamp(quando).isoformat(sep=" ", timespec="microseconds")
+
+
+def entries(filename=storage.DATA_FILE_PATH, desde=None, ate=None):
+    """Entradas do diário em ordem cronológica, com `desde < em <= ate` (None deixa o lado aberto)."""
+    desde = _instante(desde) if desde is not None else None
+    ate = _instante(ate) if ate is not None else None
+    for mes, path in storage.list_journal(filename).items():
+        if (desde is not None and mes < desde[:7]) or (ate is not None and mes > ate[:7]):
+            continue
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for linha in f:
+                    # Cada linha começa com {"em": "<instante>": dá para pular sem decodificar.
+                    if desde is not None and linha.startswith('{"em": "') and linha[8:34] <= desde:
+                        continue
+                    entrada = json.loads(linha)
+                    if (desde is None or entrada["em"] > desde) and (ate is None or entrada["em"] <= ate):
+                        yield entrada
+        except (EOFError, OSError, zlib.error, json.JSONDecodeError):
+            # Gravação interrompida no fim do arquivo: o que veio antes continua válido.
+            continue
+
+
+def history(filename=storage.DATA_FILE_PATH, desde=None, ate=None, ids=None):
+    """Trilha de auditoria em tabela: uma linha por requisição tocada em cada entrada."""
+    ids = {int(i) for i in ids} if ids is not None else None
+    linhas = []
+    for entrada in entries(filename, desde, ate):
+        for row_id, valores in entrada["linhas"].items():
+            if ids is not None and int(row_id) not in ids:
+                continue
+            if entrada["op"] == "alteracao":
+                detalhe = "; ".join(f"{col}: {antes} → {depois}" for col, (antes, depois) in valores.items())
+            else:
+                detalhe = f"{valores.get('Placa')} em {valores.get('data')}"
+            linhas.append({"em": pd.Timestamp(entrada["em"]), "usuario": entrada["usuario"],
+                           "operacao": OPERACOES.get(entrada["op"], entrada["op"]), "id": int(row_id),
+                           "colunas": ", ".join(valores) if entrada["op"] == "alteracao" else "",
+                           "detalhe": detalhe})
+    return pd.DataFrame(linhas, columns=["em", "usuario", "operacao", "id", "colunas", "detalhe"])
+
+
+def _aplicar_reverso(posteriores, ids, atual):
+    """Desfaz `posteriores` (da mais nova para a mais antiga) e devolve o estado anterior
+    de cada id tocado: a linha no formato do diário, ou None se ela ainda não existia."""
+    estado = {}
+    for entrada in reversed(posteriores):
+        for row_id, valores in entrada["linhas"].items():
+            row_id = int(row_id)
+            if ids is not None and row_id not in ids:
+                continue
+            if entrada["op"] == "inclusao":
+                estado[row_id] = None
+            elif entrada["op"] == "exclusao":
+                estado[row_id] = dict(valores)
+            else:
+                linha = estado[row_id] if row_id in estado else atual.get(row_id, {})
+                linha = dict(linha or {})
+                linha.update((col, antes) for col, (antes, _) in valores.items())
+                estado[row_id] = linha
+    return estado
+
+
+def as_of(quando, filename=storage.DATA_FILE_PATH, ids=None):
+    """Requisições como estavam no instante `quando` (uma data sozinha é 00:00 daquele dia).
+
+    Parte dos dados atuais e desfaz, da mais nova para a mais antiga, as
+    entradas do diário posteriores a `quando`. `ids` restringe o resultado.
+    """
+    ids = {int(i) for i in ids} if ids is not None else None
+    atual = storage.load_range(filename=filename)
+    if ids is not None:
+        atual = atual[atual['id'].isin(ids)]
+    posteriores = list(entries(filename, desde=quando))
+    tocados = {int(i) for e in posteriores for i in e["linhas"]}
+    if ids is not None:
+        tocados &= ids
+    base = atual[atual['id'].isin(tocados)]
+    linhas_atuais = {int(r['id']): storage.journal_row(r) for r in base.to_dict('records')}
+    estado = _aplicar_reverso(posteriores, ids, linhas_atuais)
+
+    antigas = [{**linha, "id": row_id} for row_id, linha in estado.items() if linha is not None]
+    df = atual[~atual['id'].isin(estado)]
+    if antigas:
+        antigas = storage.normalize_types(pd.DataFrame(antigas).reindex(columns=storage.COLUMNS))
+        df = pd.concat([df, antigas], ignore_index=True) if not df.empty else antigas
+    return df.sort_values('id').reset_index(drop=True)
+
+
+def _normalizar(linhas):
+    """Linhas do diário com os tipos da leitura do CSV (datas completas, números), para comparar."""
+    if not linhas:
+        return {}
+    df = pd.DataFrame([{**linha, "id": row_id} for row_id, linha in linhas.items()])
+    df = storage.normalize_types(df.reindex(columns=storage.COLUMNS))
+    return {int(r['id']): storage.journal_row(r) for r in df.to_dict('records')}
+
+
+def _iguais(a, b):
+    if a is None or b is None:
+        return a is None and b is None
+    try:
+        return float(a) == float(b)
+    except (TypeError, ValueError):
+        return str(a) == str(b)
+
+
+def _diferencas(antes, depois):
+    """Colunas cujo valor em `antes` difere de `depois` (dicts no formato do diário)."""
+    return {col: valor for col, valor in antes.items() if not _iguais(valor, depois.get(col))}
+
+
+def restore(quando, filename=storage.DATA_FILE_PATH, ids=None, usuario=None):
+    """Volta as requisições (todas ou só `ids`) ao estado do instante `quando`.
+
+    A restauração usa as gravações normais do storage e portanto também entra
+    no diário (pode ser desfeita). Linhas já congeladas em segmentos imutáveis
+    não são alteradas nem excluídas e aparecem em "ignoradas".
+    """
+    ids = {int(i) for i in ids} if ids is not None else None
+    posteriores = list(entries(filename, desde=quando))
+    tocados = {int(i) for e in posteriores for i in e["linhas"]}
+    if ids is not None:
+        tocados &= ids
+    resumo = {"reinseridas": [], "alteradas": [], "excluidas": [], "ignoradas": []}
+    if not tocados:
+        return resumo
+
+    atual = storage.load_range(filename=filename)
+    atual = atual[atual['id'].isin(tocados)]
+    linhas_atuais = {int(r['id']): storage.journal_row(r) for r in atual.to_dict('records')}
+    quentes = set(storage.load_hot(filename)['id'])
+    estado = _aplicar_reverso(posteriores, tocados, linhas_atuais)
+    estado.update(_normalizar({i: linha for i, linha in estado.items() if linha is not None}))
+
+    reinserir, alterar, excluir = [], {}, []
+    for row_id, antiga in estado.items():
+        agora = linhas_atuais.get(row_id)
+        if antiga is None and agora is None:
+            continue
+        if row_id not in quentes and agora is not None:
+            if antiga is None or _diferencas(antiga, agora):
+                resumo["ignoradas"].append(row_id)
+        elif antiga is None:
+            excluir.append(row_id)
+        elif agora is None:
+            reinserir.append({**antiga, "id": row_id})
+        elif _diferencas(antiga, agora):
+            alterar[row_id] = _diferencas(antiga, agora)
+
+    if reinserir:
+        resumo["reinseridas"] = storage.restore_rows(reinserir, filename, usuario=usuario)
+    if alterar:
+        storage.update_rows(alterar, {}, filename, usuario=usuario)
+        resumo["alteradas"] = sorted(alterar)
+    if excluir:
+        storage.delete_rows(excluir, {}, filename, usuario=usuario)
+        resumo["excluidas"] = sorted(excluir)
+    resumo["ignoradas"].sort()
+    return resumo
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Diário de alterações das requisições")
+    parser.add_argument("--csv", default=storage.DATA_FILE_PATH, help="arquivo de dados do aplicativo")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+    p_hist = comandos.add_parser("historico", help="lista a trilha de auditoria")
+    p_hist.add_argument("--desde", help="data/hora inicial (ex.: 2024-06-01 08:00)")
+    p_hist.add_argument("--ids", type=int, nargs="+")
+    p_ver = comandos.add_parser("ver", help="exporta os dados como estavam numa data/hora")
+    p_ver.add_argument("quando")
+    p_ver.add_argument("saida", help="CSV de saída")
+    p_rest = comandos.add_parser("restaurar", help="volta as requisições ao estado de uma data/hora")
+    p_rest.add_argument("quando")
+    p_rest.add_argument("--ids", type=int, nargs="+")
+    p_rest.add_argument("--usuario", default="restauração (linha de comando)")
+    args = parser.parse_args()
+
+    if args.comando == "historico":
+        print(history(args.csv, args.desde, ids=args.ids).to_string(index=False))
+    elif args.comando == "ver":
+        df = as_of(args.quando, args.csv)
+        df.to_csv(args.saida, index=False)
+        print(f"{len(df)} requisições em {args.quando} gravadas em {args.saida}")
+    else:
+        print(restore(args.quando, args.csv, args.ids, args.usuario))
@@ -0,0 +1,134 @@
+# =========================================================
+# Armazém de PDFs enviados
+# Cada PDF é gravado uma única vez, compactado, com o nome igual ao hash
+# SHA-256 do conteúdo (pdfs/<hash>.pdf.gz). O vínculo requisição -> PDF fica
+# em `<arquivo>.pdfs.json`; a sessão guarda só a referência. O espaço é
+# limitado por idade (TTL) e tamanho total, descartando os menos usados
+# junto com os vínculos para eles.
+# =========================================================
+import gzip
+import hashlib
+import json
+import os
+import time
+
+import storage
+
+PDF_DIRNAME = "pdfs"
+MAX_BYTES = 200 * 1024 * 1024
+TTL_SECONDS = 180 * 86400
+
+
+def store_dir(filename=storage.DATA_FILE_PATH):
+    return os.path.join(os.path.dirname(os.path.abspath(filename)), PDF_DIRNAME)
+
+
+def links_path(filename=storage.DATA_FILE_PATH):
+    return f"{filename}.pdfs.json"
+
+
+def _object_path(digest, filename):
+    return os.path.join(store_dir(filename), f"{digest}.pdf.gz")
+
+
+def put(pdf_data, filename=storage.DATA_FILE_PATH):
+    """Grava o PDF (se ainda não existir) e devolve o hash que o identifica."""
+    digest = hashlib.sha256(pdf_data).hexdigest()
+    path = _object_path(digest, filename)
+    if os.path.exists(path):
+        os.utime(path)  # conteúdo idêntico: só renova o uso
+        return digest
+    os.makedirs(store_dir(filename), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(tmp, "wb", compresslevel=6) as f:
+        f.write(pdf_data)
+    os.replace(tmp, path)
+    evict(filename)
+    return digest
+
+
+def get(digest, filename=storage.DATA_FILE_PATH):
+    """Bytes do PDF, ou None se ele já foi descartado."""
+    path = _object_path(digest, filename)
+    try:
+        with gzip.open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    os.utime(path)  # mtime = último uso, usado pelo descarte LRU
+    return data
+
+
+def _read_links(filename):
+    path = links_path(filename)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def link(req_ids, digest, nome, filename=storage.DATA_FILE_PATH):
+    """Associa as requisições `req_ids` ao PDF `digest` (`nome` é o nome do anexo enviado)."""
+    with storage.file_lock(filename):
+        links = _read_links(filename)
+        for req_id in req_ids:
+            links[str(int(req_id))] = {"hash": digest, "nome": nome, "em": time.time()}
+        storage.write_json_atomic(links, links_path(filename))
+
+
+def reference(req_id, filename=storage.DATA_FILE_PATH):
+    """{'hash', 'nome', 'em'} do PDF enviado para a requisição, ou None."""
+    return _read_links(filename).get(str(int(req_id)))
+
+
+def store_version(filename=storage.DATA_FILE_PATH):
+    """Token que muda quando um vínculo é gravado ou um PDF entra/sai do armazém (chave de cache)."""
+    parts = []
+    for path in (links_path(filename), store_dir(filename)):
+        try:
+            parts.append(os.stat(path).st_mtime_ns)
+        except FileNotFoundError:
+            parts.append(None)
+    return tuple(parts)
+
+
+def linked_ids(filename=storage.DATA_FILE_PATH):
+    """Ids das requisições com PDF ainda disponível no armazém."""
+    return sorted(int(i) for i, ref in _read_links(filename).items()
+                  if os.path.exists(_object_path(ref["hash"], filename)))
+
+
+def evict(filename=storage.DATA_FILE_PATH, max_bytes=MAX_BYTES, ttl=TTL_SECONDS, now=None):
+    """Descarta PDFs sem uso há mais de `ttl` e, acima de `max_bytes`, os usados há mais tempo.
+
+    Retorna a lista de hashes removidos. Os vínculos para eles saem na mesma
+    gravação, sob o lock, para o arquivo de vínculos não crescer sem limite.
+    """
+    now = now or time.time()
+    folder = store_dir(filename)
+    if not os.path.isdir(folder):
+        return []
+    with storage.file_lock(filename):
+        objetos = []
+        for entry in os.scandir(folder):
+            if entry.name.endswith(".pdf.gz"):
+                st_ = entry.stat()
+                objetos.append((st_.st_mtime, st_.st_size, entry.path))
+        objetos.sort()  # menos usados primeiro
+        total = sum(size for _, size, _ in objetos)
+        removidos = []
+        for mtime, size, path in objetos:
+            if now - mtime <= ttl and total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            removidos.append(os.path.basename(path)[:-len(".pdf.gz")])
+        if removidos:
+            links = _read_links(filename)
+            mantidos = {i: ref for i, ref in links.items() if ref["hash"] not in removidos}
+            if len(mantidos) != len(links):
+                storage.write_json_atomic(mantidos, links_path(filename))
+    return removidos
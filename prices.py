@@ -0,0 +1,160 @@
+# =========================================================
+# Índice de preço por litro (posto x combustível x dia)
+# Segmentos congelados são imutáveis: cada um é somado ao índice uma única
+# vez e o resultado fica gravado em `<arquivo>.precos.json.gz`, em colunas com
+# dicionário de postos/combustíveis. Só a partição quente (dois meses) é
+# reagregada quando os dados mudam.
+# =========================================================
+import gzip
+import json
+import os
+
+import pandas as pd
+
+import charts
+import storage
+
+INDEX_COLUMNS = ["dia", "Posto", "Combustivel", "valor", "litros", "abastecimentos"]
+JANELA_DIAS = 30
+_EPOCH = pd.Timestamp("1970-01-01")
+
+
+def index_path(filename=storage.DATA_FILE_PATH):
+    return f"{filename}.precos.json.gz"
+
+
+def _read_index(path):
+    if not os.path.exists(path):
+        return {"segmentos": []}
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_index(payload, path):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8") as f:
+        json.dump(payload, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def _empty():
+    return pd.DataFrame({c: [] for c in INDEX_COLUMNS})
+
+
+def daily_prices(df):
+    """Soma valor e litros por dia/posto/combustível das linhas com valor informado.
+
+    Canceladas e linhas sem valor ou sem litros (tanque cheio ainda não
+    lançado) ficam de fora.
+    """
+    if df.empty:
+        return _empty()
+    valor = pd.to_numeric(df["valor_total"], errors="coerce").fillna(0)
+    litros = pd.to_numeric(df["total_litros"], errors="coerce").fillna(0)
+    dia = pd.to_datetime(df["data"], errors="coerce").dt.normalize()
+    ok = (valor > 0) & (litros > 0) & dia.notna() & (df["Status"].fillna("") != "Cancelada")
+    if not ok.any():
+        return _empty()
+    base = pd.DataFrame({
+        "dia": dia[ok], "Posto": df.loc[ok, "Posto"].fillna("").astype(str).str.strip(),
+        "Combustivel": df.loc[ok, "Combustivel"].fillna("").astype(str).str.strip(),
+        "valor": valor[ok], "litros": litros[ok], "abastecimentos": 1,
+    })
+    return base.groupby(["dia", "Posto", "Combustivel"], sort=False)[["valor", "litros", "abastecimentos"]].sum().reset_index()
+
+
+def _merge(frames):
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return _empty()
+    out = pd.concat(frames, ignore_index=True)
+    return out.groupby(["dia", "Posto", "Combustivel"], sort=True)[["valor", "litros", "abastecimentos"]].sum().reset_index()
+
+
+def _encode(idx, segmentos):
+    """Formato colunar compacto: dias como inteiros, postos/combustíveis como códigos."""
+    postos = pd.Categorical(idx["Posto"])
+    combustiveis = pd.Categorical(idx["Combustivel"])
+    return {
+        "segmentos": sorted(segmentos),
+        "postos": list(postos.categories), "combustiveis": list(combustiveis.categories),
+        "dia": ((idx["dia"] - _EPOCH).dt.days).astype(int).tolist(),
+        "posto": postos.codes.tolist(), "combustivel": combustiveis.codes.tolist(),
+        "valor": idx["valor"].round(2).tolist(), "litros": idx["litros"].round(3).tolist(),
+        "abastecimentos": idx["abastecimentos"].astype(int).tolist(),
+    }
+
+
+def _decode(payload):
+    if not payload.get("dia"):
+        return _empty()
+    return pd.DataFrame({
+        "dia": _EPOCH + pd.to_timedelta(payload["dia"], unit="D"),
+        "Posto": pd.Categorical.from_codes(payload["posto"], payload["postos"]).astype(str),
+        "Combustivel": pd.Categorical.from_codes(payload["combustivel"], payload["combustiveis"]).astype(str),
+        "valor": payload["valor"], "litros": payload["litros"], "abastecimentos": payload["abastecimentos"],
+    })
+
+
+def refresh_index(filename=storage.DATA_FILE_PATH):
+    """Soma ao índice gravado os segmentos congelados ainda não vistos e devolve o índice completo.
+
+    Custo proporcional aos segmentos novos + partição quente, não ao histórico.
+    """
+    path = index_path(filename)
+    # Lock dos dados: congelar um mês move linhas da quente para um segmento,
+    # e a lista de segmentos e a partição quente precisam ser lidas juntas.
+    with storage.file_lock(filename):
+        payload = _read_index(path)
+        vistos = set(payload["segmentos"])
+        novos = [p for paths in storage.list_partitions(filename).values() for p in paths
+                 if os.path.basename(p) not in vistos]
+        frio = _decode(payload)
+        if novos:
+            partes = [daily_prices(storage.normalize_types(pd.read_csv(p, compression="gzip"))) for p in novos]
+            frio = _merge([frio] + partes)
+            _write_index(_encode(frio, vistos | {os.path.basename(p) for p in novos}), path)
+        quente = storage.load_hot(filename)
+    return _merge([frio, daily_prices(quente)])
+
+
+def cheapest(idx, combustivel, dias=JANELA_DIAS, hoje=None):
+    """Postos ordenados pelo preço médio por litro (ponderado por volume) nos últimos `dias`.
+
+    Colunas: Posto, preco, abastecimentos, ultimo (dia do último abastecimento com valor).
+    """
+    hoje = pd.Timestamp(hoje).normalize() if hoje is not None else pd.Timestamp.today().normalize()
+    janela = idx[(idx["Combustivel"] == combustivel) & (idx["dia"] > hoje - pd.Timedelta(days=dias))
+                 & (idx["dia"] <= hoje)]
+    if janela.empty:
+        return pd.DataFrame({"Posto": [], "preco": [], "abastecimentos": [], "ultimo": []})
+    out = janela.groupby("Posto").agg(valor=("valor", "sum"), litros=("litros", "sum"),
+                                      abastecimentos=("abastecimentos", "sum"), ultimo=("dia", "max"))
+    out["preco"] = out["valor"] / out["litros"]
+    return out.reset_index().sort_values("preco")[["Posto", "preco", "abastecimentos", "ultimo"]]
+
+
+def trend(idx, combustivel, postos=None, freq=None, max_points=charts.MAX_POINTS):
+    """Preço médio por litro por período e posto, pronto para charts.line_figure(color='Posto').
+
+    A granularidade segue charts.bucket_time_series, decidida uma vez para
+    todos os postos para que as linhas fiquem alinhadas.
+    """
+    recorte = idx[idx["Combustivel"] == combustivel]
+    if postos:
+        recorte = recorte[recorte["Posto"].isin(postos)]
+    if recorte.empty:
+        return pd.DataFrame({"periodo": [], "rotulo": [], "Posto": [], "preco": []})
+    # Escolhe a frequência sobre o recorte inteiro e a aplica a cada posto.
+    freq = charts.choose_frequency(recorte["dia"], freq, max_points)
+    partes = []
+    for posto, grupo in recorte.groupby("Posto"):
+        valor = charts.bucket_time_series(grupo, "dia", "valor", freq=freq, max_points=max_points)
+        litros = charts.bucket_time_series(grupo, "dia", "litros", freq=freq, max_points=max_points)
+        serie = valor.merge(litros[["periodo", "litros"]], on="periodo")
+        serie = serie[serie["litros"] > 0]
+        serie["preco"] = serie["valor"] / serie["litros"]
+        serie["Posto"] = posto
+        partes.append(serie[["periodo", "rotulo", "Posto", "preco"]])
+    return pd.concat(partes, ignore_index=True).sort_values(["periodo", "Posto"])
+
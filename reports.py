@@ -0,0 +1,219 @@
+# =========================================================
+# Relatório mensal da frota (PDF)
+# Montado fora da thread da interface: o pedido vai para um worker em
+# segundo plano e o PDF pronto fica em cache por mês até os dados mudarem.
+# =========================================================
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+from reportlab.graphics.charts.barcharts import HorizontalBarChart, VerticalBarChart
+from reportlab.graphics.shapes import Drawing, String
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.platypus import Image, LongTable, PageBreak, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+import storage
+import tracing
+
+TOP_PLACAS = 10
+PRIMARY = colors.HexColor("#003b63")
+HIGHLIGHT = colors.HexColor("#1F77B4")
+
+DETALHE_COLUNAS = [
+    ("id", "ID"), ("data", "Data"), ("Placa", "Placa"), ("Condutor", "Condutor"),
+    ("Posto", "Posto"), ("Combustivel", "Combustível"), ("total_litros", "Litros"), ("valor_total", "Valor (R$)"),
+]
+DETALHE_LARGURAS = [30, 52, 52, 95, 95, 60, 45, 60]
+
+_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), PRIMARY),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 0), (-1, -1), 7.5),
+    ('INNERGRID', (0, 0), (-1, -1), 0.25, colors.grey),
+    ('BOX', (0, 0), (-1, -1), 0.5, colors.black),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor("#f0f2f6")]),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+])
+
+
+def _moeda(valor):
+    return f"R$ {valor:,.2f}"
+
+
+def _bar_chart(rotulos, valores, titulo, horizontal=False, width=480, height=200):
+    """Gráfico estático (reportlab.graphics), desenhado uma vez e embutido no PDF."""
+    drawing = Drawing(width, height)
+    chart = HorizontalBarChart() if horizontal else VerticalBarChart()
+    chart.x, chart.y = (90, 20) if horizontal else (45, 35)
+    chart.width = width - chart.x - 15
+    chart.height = height - chart.y - 30
+    chart.data = [list(valores) or [0]]
+    chart.bars[0].fillColor = HIGHLIGHT
+    chart.valueAxis.valueMin = 0
+    chart.valueAxis.labels.fontSize = 7
+    chart.categoryAxis.categoryNames = [str(r) for r in rotulos] or [""]
+    chart.categoryAxis.labels.fontSize = 7
+    if not horizontal:
+        chart.categoryAxis.labels.angle = 30
+        chart.categoryAxis.labels.boxAnchor = 'ne'
+    drawing.add(chart)
+    drawing.add(String(width / 2, height - 12, titulo, textAnchor='middle', fontName='Helvetica-Bold', fontSize=10))
+    return drawing
+
+
+def _detalhe_setor(grupo):
+    linhas = [[rotulo for _, rotulo in DETALHE_COLUNAS]]
+    grupo = grupo.sort_values("data")
+    datas = pd.to_datetime(grupo["data"], errors="coerce").dt.strftime("%d/%m/%Y").fillna("")
+    for (_, row), data in zip(grupo.iterrows(), datas):
+        linhas.append([
+            str(row.get("id", "")), data, str(row.get("Placa", "")), str(row.get("Condutor", ""))[:22],
+            str(row.get("Posto", ""))[:22], str(row.get("Combustivel", "")),
+            f"{float(row.get('total_litros', 0) or 0):,.1f}", f"{float(row.get('valor_total', 0) or 0):,.2f}",
+        ])
+    # LongTable + repeatRows: tabelas longas quebram em várias páginas repetindo o cabeçalho.
+    tabela = LongTable(linhas, colWidths=DETALHE_LARGURAS, repeatRows=1)
+    tabela.setStyle(_TABLE_STYLE)
+    return tabela
+
+
+def build_monthly_report(df, mes, empresa="Frango Americano", logo_path=None):
+    """Gera o PDF do mês `mes` ('AAAA-MM') a partir das requisições de `df`."""
+    periodo = pd.Period(mes, freq="M")
+    datas = pd.to_datetime(df["data"], errors="coerce")
+    df = df[datas.dt.to_period("M") == periodo].copy()
+    df["total_litros"] = pd.to_numeric(df["total_litros"], errors="coerce").fillna(0)
+    df["valor_total"] = pd.to_numeric(df["valor_total"], errors="coerce").fillna(0)
+    df["Setor"] = df["Setor"].fillna("").astype(str).replace("", "Sem setor")
+
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=36, leftMargin=36, topMargin=36, bottomMargin=36,
+                            title=f"Relatório de abastecimentos {periodo.strftime('%m/%Y')}")
+    styles = getSampleStyleSheet()
+    story = []
+
+    if logo_path and os.path.exists(logo_path):
+        try:
+            story.append(Image(logo_path, width=110, height=50))
+            story.append(Spacer(1, 8))
+        except Exception:
+            pass
+
+    header_style = ParagraphStyle('HeaderStyle', parent=styles['Title'], alignment=0, fontSize=14)
+    story.append(Paragraph(f"<b>{empresa}</b> — Relatório mensal de abastecimentos {periodo.strftime('%m/%Y')}", header_style))
+    story.append(Paragraph(f"Gerado em {datetime.now().strftime('%d/%m/%Y %H:%M')}", styles['Normal']))
+    story.append(Spacer(1, 12))
+
+    if df.empty:
+        story.append(Paragraph("Nenhuma requisição registrada no mês.", styles['Normal']))
+        doc.build(story)
+        return buffer.getvalue()
+
+    # Indicadores
+    placas = df.loc[df["Placa"].fillna("") != "", "Placa"]
+    kpis = [
+        ["Requisições", str(len(df))],
+        ["Veículos distintos", str(placas.nunique())],
+        ["Total de litros", f"{df['total_litros'].sum():,.2f}"],
+        ["Valor total", _moeda(df['valor_total'].sum())],
+    ]
+    tabela = Table(kpis, colWidths=[160, 330])
+    tabela.setStyle(TableStyle([
+        ('INNERGRID', (0, 0), (-1, -1), 0.25, colors.grey),
+        ('BOX', (0, 0), (-1, -1), 0.5, colors.black),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+    ]))
+    story.append(tabela)
+    story.append(Spacer(1, 16))
+
+    # Gráficos
+    por_setor = df.groupby("Setor")["total_litros"].sum().sort_values(ascending=False)
+    story.append(_bar_chart(por_setor.index, por_setor.values, "Litros por setor"))
+    story.append(Spacer(1, 12))
+    por_dia = df.groupby(pd.to_datetime(df["data"]).dt.day)["total_litros"].sum()
+    story.append(_bar_chart(por_dia.index, por_dia.values, "Litros por dia do mês"))
+
+    # Top placas
+    top = df[df["Placa"].fillna("") != ""].groupby("Placa").agg(
+        requisicoes=("Placa", "size"), litros=("total_litros", "sum"), valor=("valor_total", "sum"),
+    ).nlargest(TOP_PLACAS, "litros")
+    story.append(PageBreak())
+    story.append(Paragraph(f"Top {TOP_PLACAS} placas por consumo", styles['Heading2']))
+    story.append(_bar_chart(top.index[::-1], top["litros"].values[::-1], "Litros por placa", horizontal=True, height=230))
+    linhas = [["Placa", "Requisições", "Litros", "Valor"]] + [
+        [placa, str(r.requisicoes), f"{r.litros:,.1f}", _moeda(r.valor)] for placa, r in top.iterrows()
+    ]
+    tabela = Table(linhas, colWidths=[120, 90, 110, 120])
+    tabela.setStyle(_TABLE_STYLE)
+    story.append(Spacer(1, 8))
+    story.append(tabela)
+
+    # Detalhe por setor
+    for setor, grupo in df.groupby("Setor", sort=True):
+        story.append(PageBreak())
+        story.append(Paragraph(
+            f"Setor: {setor} — {len(grupo)} requisições, {grupo['total_litros'].sum():,.1f} L, "
+            f"{_moeda(grupo['valor_total'].sum())}", styles['Heading2']))
+        story.append(_detalhe_setor(grupo))
+
+    doc.build(story)
+    return buffer.getvalue()
+
+
+# ===========================
+# Geração em segundo plano
+# ===========================
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="relatorio")
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+@tracing.traced("relatorio_mensal")
+def _gerar(mes, filename, empresa, logo_path):
+    periodo = pd.Period(mes, freq="M")
+    df = storage.load_range(periodo.start_time, periodo.end_time, filename)
+    return build_monthly_report(df, mes, empresa=empresa, logo_path=logo_path)
+
+
+def request_monthly_report(mes, filename=storage.DATA_FILE_PATH, empresa="Frango Americano", logo_path=None):
+    """Enfileira (ou reaproveita) o relatório do mês para a versão atual dos dados.
+
+    Retorna o Future; pedidos repetidos com os mesmos dados devolvem o mesmo
+    Future, já concluído quando o relatório estiver em cache.
+    """
+    chave = (mes, storage.data_version(filename))
+    with _jobs_lock:
+        future = _jobs.get(chave)
+        if future is None or (future.done() and future.exception() is not None):
+            # Versões antigas do mesmo mês deixam de valer.
+            for antiga in [k for k in _jobs if k[0] == mes and k != chave]:
+                del _jobs[antiga]
+            future = _executor.submit(_gerar, mes, filename, empresa, logo_path)
+            _jobs[chave] = future
+    return future
+
+
+def report_status(mes, filename=storage.DATA_FILE_PATH):
+    """('pronto', bytes) | ('gerando', None) | ('erro', mensagem) | ('ausente', None)."""
+    with _jobs_lock:
+        future = _jobs.get((mes, storage.data_version(filename)))
+    if future is None:
+        return "ausente", None
+    if not future.done():
+        return "gerando", None
+    if future.exception() is not None:
+        return "erro", str(future.exception())
+    return "pronto", future.result()
+
+
+def pending():
+    """Há algum relatório ainda sendo gerado?"""
+    with _jobs_lock:
+        return any(not f.done() for f in _jobs.values())
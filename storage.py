@@ -0,0 +1,672 @@
+# =========================================================
+# Armazenamento das requisições de abastecimento
+# Partição quente: setores/abastecimentos_<setor>.csv (mês corrente e anterior),
+# um shard por Setor, única gravável; cada sessão lê só os shards do usuário.
+# Partições frias: arquivo/abastecimentos_AAAA-MM.csv.gz, compactadas e imutáveis.
+# Toda gravação passa por um lock de arquivo (vários processos do Streamlit)
+# e deixa as linhas alteradas no diário auditoria/alteracoes_AAAA-MM.jsonl.gz.
+# =========================================================
+import datetime
+import os
+import glob
+import gzip
+import json
+import re
+import stat
+import time
+import unicodedata
+from contextlib import contextmanager
+from functools import lru_cache
+
+import pandas as pd
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_FILE_PATH = os.path.join(PROJECT_DIR, "abastecimentos.csv")
+ARCHIVE_DIRNAME = "arquivo"
+SHARD_DIRNAME = "setores"
+JOURNAL_DIRNAME = "auditoria"
+SHARD_COLUMN = "Setor"
+SEM_SETOR = "sem-setor"
+HOT_MONTHS = 2
+
+COLUMNS = [
+    "id", "Placa", "valor_total", "total_litros", "data", "Referente",
+    "Odometro", "Posto", "Combustivel", "Condutor", "Unidade", "Setor",
+    "Status", "Subsetor", "Observacoes", "TanqueCheio", "DataUso",
+    "KmUso", "EmailPosto", "TipoPosto", "Supervisor", "Cidade", "Versao",
+    "ChaveEnvio",
+]
+LOCK_TIMEOUT = 30.0
+CLAIM_TIMEOUT = 600  # segundos até um envio pendente poder ser retomado
+KEY_RETENTION = 86400  # chaves de idempotência guardadas por um dia
+JOURNAL_IGNORED = ("id", "Versao")  # Versao é controle de concorrência, não conteúdo
+
+
+class SubmissionInProgress(Exception):
+    """A mesma submissão (chave de idempotência) já está sendo processada."""
+
+
+class ConflictError(Exception):
+    """Registro alterado por outra sessão desde que foi lido."""
+
+    def __init__(self, ids):
+        self.ids = sorted(ids)
+        super().__init__(f"Requisição(ões) alterada(s) por outro usuário: {self.ids}")
+
+
+if os.name == "nt":
+    import msvcrt
+
+    def _lock_nb(fh):
+        fh.seek(0)
+        msvcrt.locking(fh.fileno(), msvcrt.LK_NBLCK, 1)
+
+    def _unlock(fh):
+        fh.seek(0)
+        msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _lock_nb(fh):
+        fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _unlock(fh):
+        fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+
+@contextmanager
+def file_lock(path, timeout=LOCK_TIMEOUT):
+    """Lock exclusivo entre processos, guardado em `<path>.lock`."""
+    deadline = time.monotonic() + timeout
+    with open(f"{path}.lock", "a+") as fh:
+        while True:
+            try:
+                _lock_nb(fh)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Não foi possível obter o lock de {path}")
+                time.sleep(0.005)
+        try:
+            yield
+        finally:
+            _unlock(fh)
+
+
+def empty_frame():
+    """DataFrame vazio com o esquema das requisições."""
+    return pd.DataFrame({c: [] for c in COLUMNS})
+
+
+def normalize_types(df):
+    """Converte as colunas de data e numéricas lidas do CSV."""
+    df['data'] = pd.to_datetime(df['data'], errors='coerce')
+    df['DataUso'] = pd.to_datetime(df['DataUso'], errors='coerce')
+    for col in ('total_litros', 'valor_total', 'Odometro', 'KmUso'):
+        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+    if 'Cidade' not in df.columns:
+        df['Cidade'] = ""
+    if 'Versao' not in df.columns:
+        df['Versao'] = 0
+    df['Versao'] = pd.to_numeric(df['Versao'], errors='coerce').fillna(0).astype(int)
+    return df
+
+
+def archive_dir(filename=DATA_FILE_PATH):
+    return os.path.join(os.path.dirname(os.path.abspath(filename)), ARCHIVE_DIRNAME)
+
+
+def hot_cutoff(today=None):
+    """Primeiro dia do período ainda aberto (mês anterior ao corrente)."""
+    today = pd.Timestamp(today) if today is not None else pd.Timestamp.today()
+    return (today.to_period('M') - (HOT_MONTHS - 1)).to_timestamp()
+
+
+def list_partitions(filename=DATA_FILE_PATH):
+    """Mapeia 'AAAA-MM' -> lista de segmentos congelados daquele mês."""
+    partitions = {}
+    pattern = os.path.join(archive_dir(filename), "abastecimentos_*.csv.gz")
+    for path in sorted(glob.glob(pattern)):
+        month = os.path.basename(path)[len("abastecimentos_"):][:7]
+        partitions.setdefault(month, []).append(path)
+    return partitions
+
+
+def shard_dir(filename=DATA_FILE_PATH):
+    return os.path.join(os.path.dirname(os.path.abspath(filename)), SHARD_DIRNAME)
+
+
+def shard_key(setor):
+    """Nome do shard de um Setor: 'Granjas de produção' -> 'granjas-de-producao'."""
+    texto = "" if setor is None or (isinstance(setor, float) and pd.isna(setor)) else str(setor)
+    texto = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode().lower()
+    return re.sub(r"[^a-z0-9]+", "-", texto).strip("-") or SEM_SETOR
+
+
+def _shard_key_column(setores):
+    """shard_key de uma coluna inteira, calculado uma vez por Setor distinto."""
+    codes, unicos = pd.factorize(setores.fillna("").astype(str), sort=False)
+    chaves = pd.Series([shard_key(u) for u in unicos] + [SEM_SETOR], dtype=object)
+    return pd.Series(chaves.to_numpy()[codes], index=setores.index)
+
+
+def shard_path(key, filename=DATA_FILE_PATH):
+    return os.path.join(shard_dir(filename), f"abastecimentos_{key}.csv")
+
+
+def list_shards(filename=DATA_FILE_PATH):
+    """Mapeia o nome do shard -> arquivo da partição quente daquele setor."""
+    pattern = os.path.join(shard_dir(filename), "abastecimentos_*.csv")
+    return {os.path.basename(p)[len("abastecimentos_"):-len(".csv")]: p for p in sorted(glob.glob(pattern))}
+
+
+def _shard_keys(shards):
+    return None if shards is None else {shard_key(s) for s in shards}
+
+
+def hot_files(filename=DATA_FILE_PATH, shards=None):
+    """Arquivos da partição quente: os shards pedidos (None = todos) e o CSV único legado, se ainda existir."""
+    keys = _shard_keys(shards)
+    files = [filename] if os.path.exists(filename) else []
+    files += [p for key, p in list_shards(filename).items() if keys is None or key in keys]
+    return files
+
+
+def data_version(filename=DATA_FILE_PATH):
+    """Token que muda a cada gravação (partição quente ou novos segmentos congelados).
+
+    Barato: só consulta metadados de arquivo. Usado como chave de cache
+    de agregados e figuras.
+    """
+    parts = []
+    for path in hot_files(filename):
+        st_ = os.stat(path)
+        parts.append(f"{os.path.basename(path)}:{st_.st_mtime_ns}:{st_.st_size}")
+    parts.extend(os.path.basename(p) for paths in list_partitions(filename).values() for p in paths)
+    return "|".join(parts)
+
+
+def _write_csv_atomic(df, path, **kwargs):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    df.to_csv(tmp, index=False, **kwargs)
+    os.replace(tmp, path)
+
+
+def write_json_atomic(obj, path):
+    """Grava um JSON sob lock, sem deixar o arquivo pela metade."""
+    with file_lock(path):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(obj, f, indent=2, ensure_ascii=False)
+        os.replace(tmp, path)
+
+
+def journal_dir(filename=DATA_FILE_PATH):
+    return os.path.join(os.path.dirname(os.path.abspath(filename)), JOURNAL_DIRNAME)
+
+
+def list_journal(filename=DATA_FILE_PATH):
+    """Mapeia 'AAAA-MM' -> arquivo do diário de alterações daquele mês."""
+    pattern = os.path.join(journal_dir(filename), "alteracoes_*.jsonl.gz")
+    return {os.path.basename(p)[len("alteracoes_"):][:7]: p for p in sorted(glob.glob(pattern))}
+
+
+def journal_value(value):
+    """Valor de célula como fica no diário: vazio/NaN vira None, datas viram texto ISO."""
+    if value is None or (isinstance(value, str) and value == ""):
+        return None
+    if isinstance(value, (pd.Timestamp, datetime.date)):
+        return None if pd.isna(value) else pd.Timestamp(value).isoformat(sep=" ")
+    if pd.isna(value):
+        return None
+    return value.item() if hasattr(value, "item") else value
+
+
+def journal_row(row):
+    """Linha no formato do diário (sem id/Versao)."""
+    return {c: journal_value(v) for c, v in row.items() if c in COLUMNS and c not in JOURNAL_IGNORED}
+
+
+def _journal(filename, op, linhas, usuario):
+    """Acrescenta uma entrada ao diário de alterações (chamar sob o lock, depois de gravar).
+
+    `linhas` mapeia id -> linha completa (inclusão/exclusão) ou {coluna: [antes, depois]}
+    (alteração). A entrada vira um membro gzip acrescentado ao arquivo do mês:
+    o custo é proporcional ao que mudou, não ao tamanho do histórico.
+    """
+    if not linhas:
+        return
+    em = datetime.datetime.now().isoformat(sep=" ", timespec="microseconds")
+    entry = {"em": em, "usuario": usuario, "op": op, "linhas": {str(i): v for i, v in linhas.items()}}
+    folder = journal_dir(filename)
+    os.makedirs(folder, exist_ok=True)
+    with gzip.open(os.path.join(folder, f"alteracoes_{em[:7]}.jsonl.gz"), "at", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def _filter_shards(df, keys):
+    if keys is None or df.empty:
+        return df
+    return df[_shard_key_column(df[SHARD_COLUMN]).isin(keys)] if SHARD_COLUMN in df.columns else df.iloc[0:0]
+
+
+def load_hot(filename=DATA_FILE_PATH, shards=None):
+    """Lê a partição quente (gravável): só os shards dos setores em `shards`, ou todos com None."""
+    keys = _shard_keys(shards)
+    frames = []
+    for path in hot_files(filename, shards):
+        df = pd.read_csv(path)
+        frames.append(_filter_shards(df, keys) if path == filename else df)
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return normalize_types(empty_frame())
+    if len(frames) == 1:
+        return normalize_types(frames[0].reset_index(drop=True))
+    return normalize_types(pd.concat(frames, ignore_index=True).sort_values('id', kind='stable', ignore_index=True))
+
+
+def _write_shards(df, keys, filename):
+    """Regrava os shards `keys` com as linhas de `df` que pertencem a cada um (shard vazio é removido)."""
+    destino = _shard_key_column(df[SHARD_COLUMN]) if not df.empty else pd.Series(dtype=object)
+    os.makedirs(shard_dir(filename), exist_ok=True)
+    for key in keys:
+        linhas = df[destino == key] if not df.empty else df
+        path = shard_path(key, filename)
+        if linhas.empty:
+            if os.path.exists(path):
+                os.remove(path)
+        else:
+            _write_csv_atomic(linhas.sort_values('id', kind='stable'), path)
+
+
+def _migrate_legacy(filename):
+    """Move as linhas do CSV único antigo para os shards por setor (chamar sob o lock).
+
+    O arquivo fica só com o cabeçalho: continua existindo para quem o procura,
+    mas os dados passam a morar em setores/.
+    """
+    if not os.path.exists(filename):
+        return
+    legado = normalize_types(pd.read_csv(filename))
+    if legado.empty:
+        return
+    if SHARD_COLUMN not in legado.columns:
+        legado[SHARD_COLUMN] = ""
+    keys = set(_shard_key_column(legado[SHARD_COLUMN]))
+    atuais = [normalize_types(pd.read_csv(p)) for k, p in list_shards(filename).items() if k in keys]
+    _write_shards(pd.concat(atuais + [legado], ignore_index=True), keys, filename)
+    _write_csv_atomic(empty_frame(), filename)
+
+
+def _rewrite_hot(filename, shards, change):
+    """Aplica `change(hot) -> (novo, ids tocados)` aos shards `shards` (None = todos) sob o lock já obtido.
+
+    Só os shards que contêm ou passam a conter linhas tocadas são regravados
+    (uma linha cujo Setor mudou troca de shard). Retorna `novo` restrito a `shards`.
+    """
+    _migrate_legacy(filename)
+    hot = load_hot(filename, shards)
+    origem = dict(zip(hot['id'], _shard_key_column(hot[SHARD_COLUMN]))) if not hot.empty else {}
+    novo, tocados = change(hot)
+    if SHARD_COLUMN not in novo.columns:
+        novo[SHARD_COLUMN] = ""
+    destino = dict(zip(novo['id'], _shard_key_column(novo[SHARD_COLUMN]))) if not novo.empty else {}
+    keys = {origem[i] for i in tocados if i in origem} | {destino[i] for i in tocados if i in destino}
+    existentes = list_shards(filename)
+    lidos = set(existentes) if shards is None else _shard_keys(shards)
+    fora = [normalize_types(pd.read_csv(existentes[k])) for k in keys - lidos if k in existentes]
+    _write_shards(pd.concat([novo] + fora, ignore_index=True) if fora else novo, keys, filename)
+    return _filter_shards(novo, _shard_keys(shards))
+
+
+def save_hot(df, filename=DATA_FILE_PATH):
+    """Grava a partição quente inteira de forma atômica (arquivos temporários + rename), um arquivo por shard.
+
+    Substituição em bloco (testes, manutenção): não é registrada no diário.
+    """
+    with file_lock(filename):
+        if os.path.exists(filename):
+            _write_csv_atomic(empty_frame(), filename)
+        df = df.copy()
+        if SHARD_COLUMN not in df.columns:
+            df[SHARD_COLUMN] = ""
+        keys = set(_shard_key_column(df[SHARD_COLUMN])) | set(list_shards(filename))
+        _write_shards(df, keys, filename)
+
+
+def _read_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _dump_json(obj, path):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+
+def _allocate_ids(n, filename):
+    """Reserva `n` ids na sequência gravada em `<arquivo>.seq` (chamar sob o lock).
+
+    A sequência é única para todos os shards: ids nunca se repetem entre setores.
+    """
+    seq_path = f"{filename}.seq"
+    last = _read_json(seq_path, None)
+    if last is None:
+        # Primeira vez: parte do maior id existente em qualquer partição.
+        hot = load_hot(filename)
+        ids = [hot['id'].max() if not hot.empty else 0]
+        ids += [_read_partition(p)['id'].max() for paths in list_partitions(filename).values() for p in paths]
+        last = int(pd.Series(ids).fillna(0).max())
+    _dump_json(last + n, seq_path)
+    return list(range(last + 1, last + n + 1))
+
+
+def claim_submission(key, filename=DATA_FILE_PATH):
+    """Registra o início de uma submissão identificada por `key`.
+
+    Retorna o id da requisição se essa chave já foi gravada (nada deve ser reenviado),
+    None se a submissão foi reservada agora, ou levanta SubmissionInProgress se outra
+    execução ainda está processando a mesma chave.
+    """
+    keys_path = f"{filename}.chaves.json"
+    now = time.time()
+    with file_lock(filename):
+        keys = _read_json(keys_path, {})
+        entry = keys.get(key)
+        if entry is not None:
+            if entry["id"] is not None:
+                return entry["id"]
+            if now - entry["em"] < CLAIM_TIMEOUT:
+                raise SubmissionInProgress(key)
+        keys = {k: v for k, v in keys.items() if now - v["em"] < KEY_RETENTION}
+        keys[key] = {"id": None, "em": now}
+        _dump_json(keys, keys_path)
+    return None
+
+
+def release_submission(key, filename=DATA_FILE_PATH):
+    """Libera uma chave reservada cuja submissão falhou, permitindo nova tentativa."""
+    keys_path = f"{filename}.chaves.json"
+    with file_lock(filename):
+        keys = _read_json(keys_path, {})
+        if key in keys and keys[key]["id"] is None:
+            del keys[key]
+            _dump_json(keys, keys_path)
+
+
+def append_rows(rows, filename=DATA_FILE_PATH, shards=None, usuario=None):
+    """Acrescenta requisições relendo o shard do setor de cada uma sob lock.
+
+    Os ids vêm da sequência atômica do armazenamento e, quando a linha traz
+    `ChaveEnvio`, a chave passa a apontar para o id gravado. Como os arquivos são
+    relidos dentro do lock, gravações simultâneas de outras sessões nunca são
+    sobrescritas. Retorna a partição quente dos setores em `shards` (None = todos)
+    já atualizada e os ids atribuídos. `usuario` vai para o diário de alterações.
+    """
+    new = pd.DataFrame(rows)
+    new['Versao'] = 1
+    with file_lock(filename):
+        ids = _allocate_ids(len(new), filename)
+        new['id'] = ids
+        if SHARD_COLUMN not in new.columns:
+            new[SHARD_COLUMN] = ""
+        # A sessão só relê os próprios shards; os das linhas novas entram na regravação.
+        leitura = None if shards is None else set(shards) | set(new[SHARD_COLUMN].fillna(""))
+        hot = _rewrite_hot(filename, leitura, lambda hot: (
+            pd.concat([hot, normalize_types(new)], ignore_index=True) if not hot.empty else normalize_types(new), ids))
+        hot = _filter_shards(hot, _shard_keys(shards)).reset_index(drop=True)
+        _journal(filename, "inclusao", {i: journal_row(r) for i, r in zip(ids, new.to_dict('records'))}, usuario)
+        if 'ChaveEnvio' in new.columns and new['ChaveEnvio'].notna().any():
+            keys_path = f"{filename}.chaves.json"
+            keys = _read_json(keys_path, {})
+            for key, row_id in zip(new['ChaveEnvio'], ids):
+                if isinstance(key, str) and key:
+                    keys[key] = {"id": row_id, "em": time.time()}
+            _dump_json(keys, keys_path)
+    return hot, ids
+
+
+def _check_versions(hot, expected):
+    """Levanta ConflictError com os ids ausentes ou cuja versão difere da esperada (None = qualquer)."""
+    if not expected:
+        return
+    esperadas = pd.to_numeric(pd.Series(list(expected.values()), index=list(expected), dtype=object), errors='coerce')
+    atuais = hot.set_index('id')['Versao'].reindex(esperadas.index)
+    stale = atuais.isna() | (esperadas.notna() & (atuais != esperadas))
+    if stale.any():
+        raise ConflictError(esperadas.index[stale.to_numpy()].tolist())
+
+
+def match_ids(df, status=None, postos=None, setores=None, placas=None, antes_de=None, ids=None, faixas=None):
+    """Ids das linhas de `df` que atendem a todos os filtros informados (None/vazio = sem filtro).
+
+    `status`, `postos`, `setores` e `placas` são listas de valores aceitos;
+    `antes_de` seleciona as requisições com data anterior a ela. `ids` e
+    `faixas` (pares (inicio, fim) inclusivos, nunca expandidos) selecionam
+    juntos: vale a linha cujo id está em `ids` ou em alguma faixa.
+    """
+    if df.empty:
+        return []
+    mask = pd.Series(True, index=df.index)
+    for col, valores in (("Status", status), ("Posto", postos), (SHARD_COLUMN, setores), ("Placa", placas)):
+        if valores:
+            mask &= df[col].isin(valores)
+    if antes_de is not None:
+        mask &= pd.to_datetime(df['data'], errors='coerce') < pd.Timestamp(antes_de)
+    if ids is not None or faixas is not None:
+        escolhidos = df['id'].isin(ids or [])
+        for inicio, fim in faixas or []:
+            escolhidos |= df['id'].between(inicio, fim)
+        mask &= escolhidos
+    return df.loc[mask, 'id'].astype(int).tolist()
+
+
+def update_rows(changes, expected, filename=DATA_FILE_PATH, shards=None, usuario=None):
+    """Aplica `{id: {coluna: valor}}` se as versões lidas (`expected`) ainda forem as atuais.
+
+    Levanta ConflictError quando outra sessão alterou alguma das linhas antes,
+    ou quando a linha não está nos shards `shards` que a sessão pode editar.
+    Só as células que de fato mudaram vão para o diário, com o valor anterior.
+    """
+    diffs = {}
+
+    def change(hot):
+        _check_versions(hot, {i: expected.get(i) for i in changes})
+        pos = pd.Series(hot.index, index=hot['id'])
+        for row_id, values in changes.items():
+            idx = pos[row_id]
+            for col, value in values.items():
+                antes = journal_value(hot.at[idx, col]) if col in hot.columns else None
+                hot.at[idx, col] = value
+                depois = journal_value(hot.at[idx, col])
+                if antes != depois and col not in JOURNAL_IGNORED:
+                    diffs.setdefault(row_id, {})[col] = [antes, depois]
+            hot.at[idx, 'Versao'] = hot.at[idx, 'Versao'] + 1
+        return hot, list(changes)
+
+    with file_lock(filename):
+        hot = _rewrite_hot(filename, shards, change)
+        _journal(filename, "alteracao", diffs, usuario)
+        return hot
+
+
+def update_where(ids, values, expected, filename=DATA_FILE_PATH, shards=None, usuario=None):
+    """Aplica os mesmos `values` ({coluna: valor}) a todas as linhas `ids` numa única gravação.
+
+    Versão em lote de update_rows (ações do administrador): as linhas são
+    localizadas pelo índice de ids e alteradas com atribuições vetorizadas,
+    sob um só lock, com uma só regravação dos shards e uma só entrada no diário.
+    Se alguma versão em `expected` não for mais a atual, nada é gravado.
+    """
+    ids = [int(i) for i in ids]
+    diffs = {}
+
+    def change(hot):
+        _check_versions(hot, {i: expected.get(i) for i in ids})
+        linhas = hot.index[pd.Index(hot['id']).get_indexer(ids)]
+        for col, value in values.items():
+            antes = hot.loc[linhas, col].map(journal_value) if col in hot.columns else [None] * len(ids)
+            hot.loc[linhas, col] = value
+            depois = journal_value(value)
+            if col not in JOURNAL_IGNORED:
+                for row_id, valor in zip(ids, antes):
+                    if valor != depois:
+                        diffs.setdefault(row_id, {})[col] = [valor, depois]
+        hot.loc[linhas, 'Versao'] += 1
+        return hot, ids
+
+    with file_lock(filename):
+        hot = _rewrite_hot(filename, shards, change)
+        _journal(filename, "alteracao", diffs, usuario)
+        return hot
+
+
+def delete_rows(ids, expected, filename=DATA_FILE_PATH, shards=None, usuario=None):
+    """Exclui as linhas com verificação otimista de versão, como em update_rows.
+
+    As linhas excluídas ficam inteiras no diário e podem ser restauradas (journal.py).
+    """
+    excluidas = {}
+
+    def change(hot):
+        existing = set(hot['id'])
+        present = [i for i in ids if i in existing]
+        _check_versions(hot, {i: expected[i] for i in present if i in expected})
+        removed = hot['id'].isin(present)
+        excluidas.update((int(r['id']), journal_row(r)) for r in hot[removed].to_dict('records'))
+        return hot[~removed].reset_index(drop=True), present
+
+    with file_lock(filename):
+        hot = _rewrite_hot(filename, shards, change)
+        _journal(filename, "exclusao", excluidas, usuario)
+        return hot
+
+
+def restore_rows(rows, filename=DATA_FILE_PATH, usuario=None):
+    """Reinsere linhas (excluídas) com os ids originais; ids já presentes na partição quente são ignorados.
+
+    Usada pela restauração do diário: as linhas voltam para a partição quente
+    (e para um segmento congelado no próximo congelamento, se o mês já fechou).
+    Retorna os ids reinseridos.
+    """
+    new = normalize_types(pd.DataFrame(rows).reindex(columns=COLUMNS))
+    new['Versao'] = 1
+    reinseridos = []
+
+    def change(hot):
+        novos = new[~new['id'].isin(set(hot['id']))] if not hot.empty else new
+        reinseridos.extend(int(i) for i in novos['id'])
+        return (pd.concat([hot, novos], ignore_index=True) if not hot.empty else novos), reinseridos
+
+    with file_lock(filename):
+        _rewrite_hot(filename, None, change)
+        novos = new[new['id'].isin(reinseridos)]
+        _journal(filename, "inclusao", {int(r['id']): journal_row(r) for r in novos.to_dict('records')}, usuario)
+    return reinseridos
+
+
+@lru_cache(maxsize=256)
+def _read_partition(path):
+    # Segmentos congelados nunca mudam depois de escritos: o caminho basta como chave.
+    return normalize_types(pd.read_csv(path, compression="gzip"))
+
+
+def freeze_closed_periods(filename=DATA_FILE_PATH, today=None):
+    """Move os meses fechados da partição quente para segmentos compactados imutáveis.
+
+    Retorna a lista de segmentos criados. Se um mês já tiver sido congelado,
+    as linhas novas daquele mês vão para um segmento adicional.
+    """
+    with file_lock(filename):
+        return _freeze_locked(filename, today)
+
+
+def _freeze_locked(filename, today):
+    hot = load_hot(filename)
+    if hot.empty:
+        return []
+    closed = hot['data'].notna() & (hot['data'] < hot_cutoff(today))
+    if not closed.any():
+        return []
+
+    created = _write_segments(hot[closed], filename)
+    fechados = hot.loc[closed, 'id'].tolist()
+    _rewrite_hot(filename, None, lambda hot: (hot[~hot['id'].isin(fechados)].reset_index(drop=True), fechados))
+    return created
+
+
+def _write_segments(rows, filename):
+    """Grava `rows` (meses fechados) como novos segmentos somente leitura, um por mês."""
+    folder = archive_dir(filename)
+    os.makedirs(folder, exist_ok=True)
+    existing = list_partitions(filename)
+    created = []
+    months = rows['data'].dt.to_period('M').astype(str)
+    for month, group in rows.groupby(months):
+        segment = len(existing.get(month, []))
+        name = f"abastecimentos_{month}.csv.gz" if segment == 0 else f"abastecimentos_{month}.{segment}.csv.gz"
+        path = os.path.join(folder, name)
+        _write_csv_atomic(group, path, compression="gzip")
+        os.chmod(path, stat.S_IREAD | stat.S_IRGRP | stat.S_IROTH)
+        created.append(path)
+    return created
+
+
+def append_bulk(rows, filename=DATA_FILE_PATH, today=None, usuario=None):
+    """Inserção em lote (importação): meses fechados vão direto para segmentos novos,
+    sem passar pela partição quente; o resto é acrescentado a ela. Retorna os ids."""
+    new = normalize_types(pd.DataFrame(rows).reindex(columns=COLUMNS))
+    new['Versao'] = 1
+    with file_lock(filename):
+        new['id'] = _allocate_ids(len(new), filename)
+        closed = new['data'].notna() & (new['data'] < hot_cutoff(today))
+        if closed.any():
+            _write_segments(new[closed], filename)
+        if not closed.all():
+            opened = new[~closed]
+            # Só os shards dos setores importados são lidos e regravados.
+            _rewrite_hot(filename, set(opened[SHARD_COLUMN].fillna("")), lambda hot: (
+                pd.concat([hot, opened], ignore_index=True) if not hot.empty else opened, opened['id'].tolist()))
+        _journal(filename, "inclusao", {int(r['id']): journal_row(r) for r in new.to_dict('records')}, usuario)
+    return new['id'].tolist()
+
+
+def load_range(start=None, end=None, filename=DATA_FILE_PATH, hot=None, shards=None):
+    """Consulta transparente sobre todas as partições, podando pelo intervalo de datas.
+
+    `start`/`end` são inclusivos; None deixa o lado aberto. `hot` permite reaproveitar
+    a partição quente já carregada na sessão. `shards` restringe aos setores da
+    sessão (os segmentos congelados são por mês e filtrados depois de lidos).
+    """
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+    first_month = start.to_period('M') if start is not None else None
+    last_month = end.to_period('M') if end is not None else None
+
+    frames = []
+    for month, paths in list_partitions(filename).items():
+        period = pd.Period(month, freq='M')
+        if first_month is not None and period < first_month:
+            continue
+        if last_month is not None and period > last_month:
+            continue
+        frames.extend(_filter_shards(_read_partition(p), _shard_keys(shards)) for p in paths)
+    frames.append(load_hot(filename, shards) if hot is None else hot)
+
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return empty_frame()
+    df = pd.concat(frames, ignore_index=True)
+    data = pd.to_datetime(df['data'], errors='coerce')
+    mask = pd.Series(True, index=df.index)
+    if start is not None:
+        mask &= data >= start.normalize()
+    if end is not None:
+        mask &= data < end.normalize() + pd.Timedelta(days=1)
+    if start is not None or end is not None:
+        df = df[mask].reset_index(drop=True)
+    return df
@@ -0,0 +1,355 @@
+# =========================================================
+# Sincronização incremental CSV <-> SQLite
+# O CSV particionado (storage) e o abastecimentos.db antigo (tabelas
+# `abastecimentos` e `requisicoes`) trocam só as linhas alteradas desde a
+# última sincronização:
+#   - no banco, gatilhos registram cada insert/update/delete em sync_alteracoes;
+#   - no CSV, o diário de alterações (journal) diz quais ids mudaram desde a
+#     marca da última sincronização e a coluna Versao é o carimbo de cada id;
+#     o histórico inteiro só é lido na primeira sincronização;
+#   - sync_vinculos liga cada id do CSV à (tabela, id) correspondente no banco.
+# Em conflito (mesma linha alterada dos dois lados) o CSV prevalece.
+# As gravações no CSV não entram na transação do banco: cada linha que vem do
+# banco leva em ChaveEnvio a chave "sync:<tabela>:<id>" e, se a transação for
+# desfeita depois do append, a próxima sincronização a revincula pela chave
+# em vez de inseri-la de novo dos dois lados.
+# =========================================================
+import argparse
+import datetime
+import os
+import sqlite3
+
+import pandas as pd
+
+import journal
+import storage
+import tracing
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "abastecimentos.db")
+
+# coluna do banco -> coluna do CSV, por tabela
+TABLE_MAPS = {
+    "abastecimentos": {
+        "placa": "Placa", "valor_total": "valor_total", "data": "data", "referente": "Referente",
+        "odometro": "Odometro", "posto": "Posto", "combustivel": "Combustivel", "condutor": "Condutor",
+        "unidade": "Unidade", "setor": "Setor", "total_litros": "total_litros", "Status": "Status",
+        "Subsetor": "Subsetor", "Observacoes": "Observacoes", "TanqueCheio": "TanqueCheio",
+        "DataUso": "DataUso", "KmUso": "KmUso", "EmailPosto": "EmailPosto", "TipoPosto": "TipoPosto",
+        "Supervisor": "Supervisor",
+    },
+    "requisicoes": {
+        "condutor": "Condutor", "placa": "Placa", "setor": "Setor", "data": "data",
+        "justificativa": "Observacoes", "litros": "total_litros", "km_inicial": "Odometro",
+        "posto": "Posto", "email_destino": "EmailPosto",
+    },
+}
+# Linhas novas do CSV vão para esta tabela.
+DEFAULT_TABLE = "abastecimentos"
+# Colunas NOT NULL do esquema antigo.
+NOT_NULL_DEFAULTS = {"abastecimentos": {"placa": "", "valor_total": 0.0, "data": "", "referente": ""}}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sync_vinculos (
+    csv_id INTEGER PRIMARY KEY,
+    tabela TEXT NOT NULL,
+    db_id INTEGER NOT NULL,
+    versao_csv INTEGER NOT NULL,
+    UNIQUE (tabela, db_id)
+);
+CREATE TABLE IF NOT EXISTS sync_alteracoes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    tabela TEXT NOT NULL,
+    db_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sync_estado (
+    chave TEXT PRIMARY KEY,
+    valor TEXT
+);
+"""
+
+
+def _ensure_schema(conn):
+    """Cria as tabelas de controle e os gatilhos. Na primeira vez, todo o conteúdo
+    atual do banco entra no log como alteração pendente (única carga completa)."""
+    # executescript faria COMMIT implícito; cada comando vai separado, dentro da transação.
+    for comando in filter(str.strip, _SCHEMA.split(";")):
+        conn.execute(comando)
+    for tabela in TABLE_MAPS:
+        for evento, ref in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            conn.execute(
+                f"CREATE TRIGGER IF NOT EXISTS sync_{tabela}_{evento.lower()} AFTER {evento} ON {tabela} "
+                f"BEGIN INSERT INTO sync_alteracoes (tabela, db_id) VALUES ('{tabela}', {ref}.id); END"
+            )
+        semeada = conn.execute("SELECT 1 FROM sync_estado WHERE chave = ?", (f"semeada_{tabela}",)).fetchone()
+        if not semeada:
+            conn.execute(f"INSERT INTO sync_alteracoes (tabela, db_id) SELECT '{tabela}', id FROM {tabela}")
+            conn.execute("INSERT INTO sync_estado (chave, valor) VALUES (?, '1')", (f"semeada_{tabela}",))
+
+
+def _last_seq(conn):
+    row = conn.execute("SELECT valor FROM sync_estado WHERE chave = 'ultimo_seq'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def _csv_mark(conn):
+    row = conn.execute("SELECT valor FROM sync_estado WHERE chave = 'marca_csv'").fetchone()
+    return row[0] if row else None
+
+
+def _csv_rows(filename, entradas, hot):
+    """Linhas do CSV que podem ter mudado desde a marca, sem ler o histórico inteiro.
+
+    A partição quente vem inteira: é pequena e é onde alterações e exclusões
+    acontecem. Dos segmentos congelados só interessam as inclusões do diário
+    que já não estão nela (importadas direto em meses fechados, ou congeladas
+    desde então), lidas só nos meses delas.
+    """
+    # Fora da partição quente e sem exclusão no diário: só pode estar num segmento congelado.
+    conhecidos = set(hot["id"]) | {int(i) for e in entradas if e["op"] == "exclusao" for i in e["linhas"]}
+    meses = set()
+    for entrada in entradas:
+        if entrada["op"] != "inclusao":
+            continue
+        for row_id, valores in entrada["linhas"].items():
+            if int(row_id) not in conhecidos and valores.get("data"):
+                meses.add(pd.Timestamp(valores["data"]).to_period("M"))
+    frames = [hot] + [storage.load_range(m.start_time, m.end_time, filename, hot=storage.empty_frame())
+                      for m in sorted(meses)]
+    frames = [f for f in frames if not f.empty]
+    return pd.concat(frames, ignore_index=True) if frames else storage.empty_frame()
+
+
+def _relink(conn, atual):
+    """Vincula linhas do CSV gravadas por uma sincronização desfeita (chave sem vínculo)."""
+    vinculados = {int(c) for (c,) in conn.execute("SELECT csv_id FROM sync_vinculos")}
+    origens = {(t, d) for t, d in conn.execute("SELECT tabela, db_id FROM sync_vinculos")}
+    novos = []
+    for csv_id, chave in atual["ChaveEnvio"].dropna().items():
+        origem = _origem(chave)
+        if origem is None or int(csv_id) in vinculados or origem in origens:
+            continue
+        # versao_csv = 1 (a do append): edições feitas depois no CSV ainda vão para o banco.
+        novos.append((int(csv_id), origem[0], origem[1], 1))
+        origens.add(origem)
+    conn.executemany("INSERT INTO sync_vinculos (csv_id, tabela, db_id, versao_csv) VALUES (?, ?, ?, ?)", novos)
+
+
+def _update_csv(alterar, versoes, filename, resumo):
+    """update_rows do lote; linhas alteradas no CSV enquanto isso ficam de fora (o CSV prevalece).
+
+    Retorna {csv_id: nova Versao} das linhas gravadas.
+    """
+    while alterar:
+        try:
+            hot = storage.update_rows(alterar, versoes, filename, usuario="sincronização")
+        except storage.ConflictError as e:
+            for csv_id in e.ids:
+                alterar.pop(csv_id, None)
+            resumo["conflitos"] += len(e.ids)
+            continue
+        return hot.set_index("id").loc[list(alterar), "Versao"].to_dict()
+    return {}
+
+
+def _db_changes(conn, desde):
+    """{tabela: [db_id alterados]} a partir do log, sem repetir ids."""
+    mudancas = {}
+    for tabela, db_id in conn.execute(
+        "SELECT tabela, db_id FROM sync_alteracoes WHERE seq > ? GROUP BY tabela, db_id", (desde,)
+    ):
+        mudancas.setdefault(tabela, []).append(db_id)
+    return mudancas
+
+
+def _fetch(conn, tabela, ids):
+    if not ids:
+        return pd.DataFrame(columns=["id"] + list(TABLE_MAPS[tabela]))
+    frames = []
+    # SQLite limita o número de parâmetros por consulta.
+    for i in range(0, len(ids), 900):
+        lote = ids[i:i + 900]
+        marks = ",".join("?" * len(lote))
+        frames.append(pd.read_sql_query(
+            f"SELECT id, {', '.join(TABLE_MAPS[tabela])} FROM {tabela} WHERE id IN ({marks})", conn, params=lote))
+    return pd.concat(frames, ignore_index=True)
+
+
+def _chave(tabela, db_id):
+    return f"sync:{tabela}:{int(db_id)}"
+
+
+def _origem(chave):
+    """'sync:<tabela>:<id>' -> (tabela, id), ou None para outras chaves."""
+    partes = str(chave).split(":")
+    if len(partes) == 3 and partes[0] == "sync" and partes[1] in TABLE_MAPS and partes[2].isdigit():
+        return partes[1], int(partes[2])
+    return None
+
+
+def _to_csv_rows(tabela, db_rows):
+    """Linhas do banco -> DataFrame no esquema do CSV."""
+    out = pd.DataFrame({c: [""] * len(db_rows) for c in storage.COLUMNS})
+    for db_col, csv_col in TABLE_MAPS[tabela].items():
+        out[csv_col] = db_rows[db_col].to_numpy()
+    out["ChaveEnvio"] = [_chave(tabela, i) for i in db_rows["id"]]
+    if tabela == "requisicoes":
+        out["Status"] = "Enviada"
+    out["Versao"] = 1
+    return storage.normalize_types(out)
+
+
+def _to_db_values(tabela, csv_row):
+    """Linha do CSV -> {coluna do banco: valor}, com None no lugar de vazios/NaN."""
+    values = {}
+    for db_col, csv_col in TABLE_MAPS[tabela].items():
+        value = csv_row.get(csv_col)
+        if isinstance(value, pd.Timestamp):
+            value = str(value)
+        elif value is not None and not isinstance(value, str) and pd.isna(value):
+            value = None
+        elif hasattr(value, "item"):
+            value = value.item()
+        if value is None and db_col in NOT_NULL_DEFAULTS.get(tabela, {}):
+            value = NOT_NULL_DEFAULTS[tabela][db_col]
+        values[db_col] = value
+    return values
+
+
+def sync(filename=storage.DATA_FILE_PATH, db_path=DB_PATH):
+    """Executa uma sincronização incremental nos dois sentidos.
+
+    Tudo do lado do banco acontece em uma única transação (BEGIN IMMEDIATE),
+    desfeita se a gravação no CSV falhar; o que já tiver sido gravado no CSV é
+    reconciliado na próxima execução (linhas inseridas pela chave, alteradas e
+    excluídas pela Versao e pelo diário). Retorna um resumo com as contagens.
+    """
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    resumo = {"db_para_csv": {"inseridos": 0, "alterados": 0, "excluidos": 0},
+              "csv_para_db": {"inseridos": 0, "alterados": 0, "excluidos": 0},
+              "conflitos": 0, "ignorados": 0}
+    try:
+        with tracing.trace("sincronizacao") as span:
+            conn.execute("BEGIN IMMEDIATE")
+            _ensure_schema(conn)
+            desde = _last_seq(conn)
+
+            # ---- delta do CSV: ids novos, Versao acima da vinculada, ids vinculados que sumiram.
+            # A marca é tomada antes de ler: o storage grava o diário depois dos dados,
+            # então tudo até ela já está visível; o que vier depois fica para a próxima
+            # vez (reprocessar é inofensivo, a Versao decide o que mudou).
+            marca = _csv_mark(conn)
+            nova_marca = datetime.datetime.now().isoformat(sep=" ", timespec="microseconds")
+            hot = storage.load_hot(filename)
+            hot_ids = set(hot["id"])
+            if marca is None:
+                # Primeira sincronização: carga completa, uma única vez.
+                csv, tocados = storage.load_range(None, None, filename, hot=hot), None
+            else:
+                entradas = list(journal.entries(filename, desde=marca))
+                csv = _csv_rows(filename, entradas, hot)
+                tocados = pd.Index({int(i) for e in entradas for i in e["linhas"]}, dtype="int64")
+            atual = csv.set_index("id")
+            _relink(conn, atual)
+            vinculos = pd.read_sql_query("SELECT csv_id, tabela, db_id, versao_csv FROM sync_vinculos", conn)
+            por_db = {(t, d): c for c, t, d in zip(vinculos["csv_id"], vinculos["tabela"], vinculos["db_id"])}
+            vinc = vinculos.set_index("csv_id")
+            novos_csv = atual.index.difference(vinc.index)
+            comuns = atual.index.intersection(vinc.index)
+            alterados_csv = comuns[atual.loc[comuns, "Versao"].to_numpy() > vinc.loc[comuns, "versao_csv"].to_numpy()]
+            # Só a partição quente (e as inclusões recentes) foi lida: sumiço só conta para ids do diário.
+            sumidos = vinc.index if tocados is None else vinc.index.intersection(tocados)
+            excluidos_csv = sumidos.difference(atual.index)
+            tocados_csv = set(alterados_csv) | set(excluidos_csv)
+
+            # ---- delta do banco, a partir do log dos gatilhos
+            inserir_csv, novos_origem, alterar_csv, excluir_csv = [], [], {}, []
+            for tabela, ids in _db_changes(conn, desde).items():
+                linhas = _fetch(conn, tabela, ids)
+                convertidas = _to_csv_rows(tabela, linhas)
+                convertidas.index = linhas["id"].to_numpy()
+                campos = list(TABLE_MAPS[tabela].values())
+                novos = []
+                for db_id in ids:
+                    csv_id = por_db.get((tabela, db_id))
+                    if csv_id is not None and csv_id in tocados_csv:
+                        resumo["conflitos"] += 1  # o CSV prevalece
+                    elif db_id in convertidas.index:
+                        if csv_id is None:
+                            novos.append(db_id)
+                        elif csv_id in hot_ids:
+                            alterar_csv[int(csv_id)] = convertidas.loc[db_id, campos].to_dict()
+                        else:
+                            resumo["ignorados"] += 1  # mês congelado: somente leitura
+                    elif csv_id is not None:
+                        if csv_id in hot_ids:
+                            excluir_csv.append(int(csv_id))
+                        else:
+                            resumo["ignorados"] += 1
+                if novos:
+                    inserir_csv.append(convertidas.loc[novos])
+                    novos_origem += [(tabela, int(d)) for d in novos]
+
+            # ---- aplica CSV -> banco (primeiro: se o CSV falhar depois, o ROLLBACK desfaz isto)
+            novos_vinculos = []
+            cols = list(TABLE_MAPS[DEFAULT_TABLE])
+            for csv_id in novos_csv:
+                values = _to_db_values(DEFAULT_TABLE, atual.loc[csv_id])
+                cur = conn.execute(f"INSERT INTO {DEFAULT_TABLE} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+                                   [values[c] for c in cols])
+                novos_vinculos.append((int(csv_id), DEFAULT_TABLE, cur.lastrowid, int(atual.loc[csv_id, "Versao"])))
+            resumo["csv_para_db"]["inseridos"] = len(novos_csv)
+            for csv_id in alterados_csv:
+                tabela, db_id = vinc.loc[csv_id, "tabela"], int(vinc.loc[csv_id, "db_id"])
+                values = _to_db_values(tabela, atual.loc[csv_id])
+                conn.execute(f"UPDATE {tabela} SET {', '.join(f'{c} = ?' for c in values)} WHERE id = ?",
+                             [*values.values(), db_id])
+                conn.execute("UPDATE sync_vinculos SET versao_csv = ? WHERE csv_id = ?",
+                             (int(atual.loc[csv_id, "Versao"]), int(csv_id)))
+            resumo["csv_para_db"]["alterados"] = len(alterados_csv)
+            for csv_id in excluidos_csv:
+                conn.execute(f"DELETE FROM {vinc.loc[csv_id, 'tabela']} WHERE id = ?", (int(vinc.loc[csv_id, "db_id"]),))
+                conn.execute("DELETE FROM sync_vinculos WHERE csv_id = ?", (int(csv_id),))
+            resumo["csv_para_db"]["excluidos"] = len(excluidos_csv)
+
+            # ---- aplica banco -> CSV
+            if inserir_csv:
+                _, ids = storage.append_rows(pd.concat(inserir_csv, ignore_index=True), filename,
+                                                usuario="sincronização")
+                novos_vinculos += [(int(i), t, d, 1) for i, (t, d) in zip(ids, novos_origem)]
+                resumo["db_para_csv"]["inseridos"] = len(ids)
+            if alterar_csv:
+                versoes = atual.loc[list(alterar_csv), "Versao"].to_dict()
+                novas = _update_csv(alterar_csv, versoes, filename, resumo)
+                conn.executemany("UPDATE sync_vinculos SET versao_csv = ? WHERE csv_id = ?",
+                                 [(int(v), int(i)) for i, v in novas.items()])
+                resumo["db_para_csv"]["alterados"] = len(novas)
+            if excluir_csv:
+                storage.delete_rows(excluir_csv, {}, filename, usuario="sincronização")
+                conn.executemany("DELETE FROM sync_vinculos WHERE csv_id = ?", [(i,) for i in excluir_csv])
+                resumo["db_para_csv"]["excluidos"] = len(excluir_csv)
+            conn.executemany("INSERT INTO sync_vinculos (csv_id, tabela, db_id, versao_csv) VALUES (?, ?, ?, ?)",
+                             novos_vinculos)
+
+            # As gravações acima também passaram pelos gatilhos: o log inteiro já está consumido.
+            ultimo = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM sync_alteracoes").fetchone()[0]
+            conn.execute("DELETE FROM sync_alteracoes WHERE seq <= ?", (ultimo,))
+            conn.execute("INSERT OR REPLACE INTO sync_estado (chave, valor) VALUES ('ultimo_seq', ?)", (str(ultimo),))
+            conn.execute("INSERT OR REPLACE INTO sync_estado (chave, valor) VALUES ('marca_csv', ?)", (nova_marca,))
+            conn.execute("COMMIT")
+            span.update({k: sum(v.values()) if isinstance(v, dict) else v for k, v in resumo.items()})
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    return resumo
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sincroniza abastecimentos.csv com abastecimentos.db")
+    parser.add_argument("--csv", default=storage.DATA_FILE_PATH)
+    parser.add_argument("--db", default=DB_PATH)
+    args = parser.parse_args()
+    tracing.configure()
+    print(sync(args.csv, args.db))
@@ -0,0 +1,42 @@
+import pandas as pd
+import analytics
+
+
+def _df():
+    return pd.DataFrame({
+        "data": ["2024-01-05", "2024-01-20", "2024-02-01", "2024-02-03"],
+        "Placa": ["AAA-1111", "AAA-1111", "BBB-2222", "CCC-3333"],
+        "Setor": ["Abatedouro", "Abatedouro", "Incubatório", "Abatedouro"],
+        "Subsetor": ["Campo"] * 4, "Unidade": [""] * 4,
+        "Posto": ["Rede K", "Rede K", "Linhares", "Rede K"],
+        "Combustivel": ["Diesel S10", "Diesel S10", "Gasolina", "Diesel S10"],
+        "TipoPosto": ["Próprio"] * 4, "Cidade": ["Araguaína"] * 4,
+        "total_litros": [10.0, 20.0, 5.0, 40.0], "valor_total": [60.0, 120.0, 30.0, 240.0],
+    })
+
+
+def test_cube_aggregates_same_cell():
+    cube = analytics.build_cube(_df())
+
+    # As duas requisições de janeiro da mesma placa viram uma célula
+    assert len(cube) == 3
+    assert cube["requisicoes"].sum() == 4
+
+
+def test_slice_cube_matches_raw_filter():
+    df = _df()
+    cube = analytics.build_cube(df)
+
+    recorte = analytics.slice_cube(cube, "2024-02", "2024-02", Setor=["Abatedouro"])
+    veiculos, litros, valor = analytics.cube_kpis(recorte)
+
+    assert (veiculos, litros, valor) == (1, 40.0, 240.0)
+    assert analytics.cube_kpis(analytics.slice_cube(cube)) == (3, 75.0, 450.0)
+
+
+def test_rollup_by_month():
+    cube = analytics.build_cube(_df())
+
+    mensal = analytics.rollup(cube, "mes")
+
+    assert list(mensal["total_litros"]) == [30.0, 45.0]
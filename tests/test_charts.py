@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import charts
+
+
+def test_bucket_time_series_respects_point_budget():
+    df = pd.DataFrame({"data": pd.date_range("2015-01-01", periods=3000), "total_litros": 1.0})
+
+    out = charts.bucket_time_series(df, "data", "total_litros", max_points=200)
+
+    assert len(out) <= 200
+    assert out["total_litros"].sum() == 3000
+
+
+def test_bucket_time_series_keeps_requested_frequency():
+    df = pd.DataFrame({"data": ["2024-01-05", "2024-01-20", "2024-02-01"], "total_litros": [10, 5, 7]})
+
+    out = charts.bucket_time_series(df, "data", "total_litros", freq="M")
+
+    assert list(out["rotulo"]) == ["01/2024", "02/2024"]
+    assert list(out["total_litros"]) == [15, 7]
+
+
+def test_downsample_minmax_keeps_peaks():
+    x = np.arange(50000)
+    y = np.zeros(50000)
+    y[12345] = 99.0
+    y[40000] = -5.0
+
+    xs, ys = charts.downsample_minmax(x, y, max_points=100)
+
+    assert len(xs) <= 100
+    assert 12345 in xs and 40000 in xs
+
+
+def test_line_figure_downsamples_each_color_group():
+    n = 2000
+    df = pd.DataFrame({
+        "mes": np.tile(np.arange(n // 2), 2),
+        "valor": np.r_[np.sin(np.arange(n // 2) / 10), np.cos(np.arange(n // 2) / 10) + 5],
+        "tipo": ["Real"] * (n // 2) + ["Previsto"] * (n // 2),
+        "detalhe": [f"linha {i}" for i in range(n)],
+    })
+    df.loc[700, "valor"] = 50.0  # pico de uma das séries
+
+    fig = charts.line_figure(df, x="mes", y="valor", color="tipo", hover_data=["detalhe"], max_points=100)
+
+    assert {trace.name for trace in fig.data} == {"Real", "Previsto"}
+    for trace in fig.data:
+        assert 0 < len(trace.y) <= 100
+    real = next(trace for trace in fig.data if trace.name == "Real")
+    assert 50.0 in real.y
+    assert max(next(t for t in fig.data if t.name == "Previsto").y) < 7
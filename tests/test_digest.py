@@ -0,0 +1,72 @@
+from datetime import datetime
+import pandas as pd
+import storage
+import digest
+
+
+class FakeSMTP:
+    def __init__(self):
+        self.sent = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def send_message(self, msg):
+        self.sent.append(msg["To"])
+
+
+def _queue(path, emails):
+    rows = []
+    for i, email in enumerate(emails, start=1):
+        row = {c: "" for c in storage.COLUMNS}
+        row.update({"Placa": f"ABC-{1000 + i}", "data": "2024-03-01", "Status": digest.QUEUED_STATUS,
+                    "EmailPosto": email, "total_litros": 10.0, "valor_total": 0.0})
+        rows.append(row)
+    _, ids = storage.append_rows(pd.DataFrame(rows, columns=storage.COLUMNS), path)
+    for req_id, email in zip(ids, emails):
+        digest.enqueue(req_id, email, {"placa": f"ID {req_id}"}, path)
+    return ids
+
+
+def test_is_due_by_slot():
+    horarios = ["07:00", "13:00"]
+
+    assert digest.is_due(horarios, None, datetime(2024, 3, 1, 8, 0))
+    assert not digest.is_due(horarios, "2024-03-01T07:05:00", datetime(2024, 3, 1, 12, 59))
+    assert digest.is_due(horarios, "2024-03-01T07:05:00", datetime(2024, 3, 1, 13, 0))
+    # Antes do primeiro horário do dia vale o último de ontem
+    assert digest.is_due(horarios, "2024-02-29T07:00:00", datetime(2024, 3, 1, 6, 0))
+    assert digest.parse_horarios("13:00; 7:00, xx") == ["07:00", "13:00"]
+
+
+def test_flush_one_connection_one_message_per_posto(tmp_path):
+    path = str(tmp_path / "abastecimentos.csv")
+    ids = _queue(path, ["a@posto.com", "a@posto.com", "b@posto.com"])
+    conexoes, lotes = [], []
+    server = FakeSMTP()
+
+    def connect():
+        conexoes.append(1)
+        return server
+
+    def build_pdf(payloads):
+        lotes.append(len(payloads))
+        return b"%PDF"
+
+    arquivados = []
+    enviados = digest.flush(connect, build_pdf, "frota@empresa.com", path, horarios=["07:00"],
+                            now=datetime(2024, 3, 1, 8, 0), on_sent=lambda i, pdf, nome: arquivados.append(i))
+
+    assert len(conexoes) == 1
+    assert sorted(map(len, arquivados)) == [1, 2]
+    assert sorted(server.sent) == ["a@posto.com", "b@posto.com"]
+    assert sorted(lotes) == [1, 2]
+    assert sorted(i for v in enviados.values() for i in v) == sorted(ids)
+    assert digest.pending(path) == {}
+    assert set(storage.load_hot(path)["Status"]) == {"Enviada"}
+    # Mesmo horário não dispara de novo
+    assert digest.flush(connect, build_pdf, "frota@empresa.com", path, horarios=["07:00"],
+                        now=datetime(2024, 3, 1, 9, 0)) == {}
@@ -0,0 +1,68 @@
+import pandas as pd
+import pytest
+
+import analytics
+import storage
+
+pytest.importorskip("duckdb")
+import duckdb_backend  # noqa: E402
+
+
+def _row(data, placa, setor, litros, valor):
+    return {"Placa": placa, "data": data, "Setor": setor, "Posto": "Rede K", "Combustivel": "Diesel S10",
+            "total_litros": litros, "valor_total": valor, "Status": "Abastecida"}
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / "abastecimentos.csv")
+    storage.append_bulk([
+        _row("2024-01-10", "AAA-1111", "Logística", 100, 600),
+        _row("2024-01-20", "BBB-2222", "Logística", 40, 240),
+        _row("2024-02-03", "AAA-1111", "Frigorífico", 30, None),   # valor ainda não lançado
+        _row("2024-03-15", "CCC-3333", "", 150, 900),
+        _row("2024-06-01", "BBB-2222", "Logística", 20, 130),      # partição quente
+    ], path, today="2024-06-15")
+    return path
+
+
+def _sorted(cube):
+    cube = cube.astype({c: str for c in analytics.CUBE_DIMENSIONS[1:] + ["Placa"]})
+    return cube.sort_values(["mes", "Placa", "Setor"]).reset_index(drop=True)
+
+
+def test_cube_matches_pandas(path):
+    esperado = analytics.build_cube(storage.load_range(filename=path))
+    obtido = duckdb_backend.build_cube(path)
+    assert list(obtido.columns) == list(esperado.columns)
+    pd.testing.assert_frame_equal(_sorted(obtido), _sorted(esperado), check_dtype=False)
+
+
+@pytest.mark.parametrize("inicio, fim", [(None, None), ("2024-01-15", "2024-03-31"), ("2025-01-01", None)])
+def test_narrative_stats_match_pandas(path, inicio, fim):
+    df = storage.load_range(inicio, fim, filename=path)
+    esperado = analytics.narrative_stats(df.dropna(subset=["data"]))
+    obtido = duckdb_backend.narrative_stats(path, inicio, fim)
+    assert obtido.keys() == esperado.keys()
+    for chave, valor in esperado.items():
+        assert obtido[chave] == (pytest.approx(valor) if isinstance(valor, float) else valor), chave
+
+
+def test_query_is_read_only(path):
+    resultado = duckdb_backend.query("SELECT Placa, sum(total_litros) AS litros FROM requisicoes GROUP BY Placa ORDER BY Placa", path)
+    assert resultado["litros"].tolist() == [130, 60, 150]
+    with pytest.raises(ValueError):
+        duckdb_backend.query("DELETE FROM requisicoes", path)
+    with pytest.raises(ValueError):
+        duckdb_backend.query("SELECT 1; DROP TABLE requisicoes", path)
+
+
+def test_query_cannot_read_other_files(path, tmp_path):
+    segredo = tmp_path / "settings.json"
+    segredo.write_text('{"senha": "123"}', encoding="utf-8")
+    for sql in (f"SELECT * FROM read_text('{segredo}')", f"SELECT * FROM read_csv('{segredo}')",
+                "SELECT * FROM read_csv('/etc/passwd')"):
+        with pytest.raises(duckdb_backend.duckdb.Error):
+            duckdb_backend.query(sql, path)
+    # A restrição vale só para a consulta: o cubo continua lendo os dados normalmente.
+    assert not duckdb_backend.build_cube(path).empty
@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+import analytics
+import forecast
+
+
+def _sazonal(meses, escala):
+    return escala * (100 + 30 * np.sin(2 * np.pi * np.arange(len(meses)) / 12))
+
+
+def test_batched_fit_follows_seasonality_per_series():
+    meses = pd.period_range("2021-01", "2023-12", freq="M")
+    matriz = pd.DataFrame([_sazonal(meses, 1.0), _sazonal(meses, 3.0), np.full(len(meses), 50.0)],
+                          index=["Abatedouro", "Incubatório", "Campo"], columns=meses)
+
+    prev = forecast.predict(forecast.fit(matriz), horizonte=3)
+
+    assert list(prev.columns.astype(str)) == ["2024-01", "2024-02", "2024-03"]
+    esperado = _sazonal(pd.period_range("2024-01", periods=3, freq="M"), 1.0)  # mesma fase de 2021
+    assert np.allclose(prev.loc["Abatedouro"], esperado, rtol=0.05)
+    assert np.allclose(prev.loc["Incubatório"], 3 * esperado, rtol=0.05)
+    assert np.allclose(prev.loc["Campo"], 50.0, rtol=0.01)
+
+
+def test_fit_all_from_cube_excludes_open_month():
+    df = pd.DataFrame({
+        "data": ["2024-01-10", "2024-02-10", "2024-03-10", "2024-04-02"],
+        "Placa": ["AAA-1111"] * 4, "Setor": ["Abatedouro"] * 4,
+        "total_litros": [100.0, 110.0, 120.0, 5.0], "valor_total": [600.0, 660.0, 720.0, 30.0],
+    })
+    modelos = forecast.fit_all(analytics.build_cube(df), ate="2024-03")
+
+    tabela = forecast.forecast_table(modelos, "Setor")
+    assert list(tabela["mes"].astype(str)) == ["2024-04", "2024-05", "2024-06"]
+    assert (tabela["litros"] > 100).all() and (tabela["valor"] > 600).all()
+
+    serie = forecast.history_and_forecast(analytics.build_cube(df), modelos, "Placa", "AAA-1111")
+    assert list(serie["tipo"]) == ["Histórico"] * 3 + ["Previsão"] * 4
@@ -0,0 +1,57 @@
+import pandas as pd
+import storage
+import importer
+
+
+def test_vectorized_normalization():
+    placas = pd.Series(["abc1d23", "ABC 1234", "xyz-9a87", None])
+    combustiveis = pd.Series(["diesel S10 aditivado", "GASOLINA comum", "Etanol", "GNV "])
+
+    assert list(importer.normalize_placa(placas)) == ["ABC-1D23", "ABC-1234", "XYZ-9A87", ""]
+    assert list(importer.normalize_combustivel(combustiveis)) == ["Diesel S10", "Gasolina", "Etanol", "GNV"]
+    assert list(importer.parse_numbers(pd.Series(["1.234,50", "64.2", None]))[:2]) == [1234.5, 64.2]
+
+
+def test_import_in_chunks_skips_duplicates_and_invalid(tmp_path):
+    path = str(tmp_path / "abastecimentos.csv")
+    planilha = tmp_path / "historico.csv"
+    pd.DataFrame({
+        "Placa": ["abc1d23", "abc1d23", "inválida", "bcd2345", "cde3f45"],
+        "Data": ["05/01/2023", "05/01/2023", "06/01/2023", "10/02/2023", "2023-03-01"],
+        "Litros": ["40,5", "40,5", "10", "20", "30"],
+        "Valor Total": ["200", "200", "50", "100", "150"],
+        "Combustível": ["diesel s10"] * 5,
+        "Posto": ["Rede K"] * 5,
+    }).to_csv(planilha, sep=";", index=False)
+    progresso = []
+
+    relatorio = importer.import_file(str(planilha), path, chunksize=2, on_progress=progresso.append,
+                                     today="2024-06-15")
+
+    assert (relatorio["lidas"], relatorio["inseridas"], relatorio["duplicadas"], relatorio["rejeitadas"]) == (5, 3, 1, 1)
+    assert len(progresso) == 3 and progresso[-1]["fracao"] == 1.0
+    # Meses fechados vão direto para segmentos congelados
+    assert sorted(storage.list_partitions(path)) == ["2023-01", "2023-02", "2023-03"]
+    gravadas = storage.load_range(None, None, path)
+    assert sorted(gravadas["Placa"]) == ["ABC-1D23", "BCD-2345", "CDE-3F45"]
+
+    # Reimportar o mesmo arquivo não duplica nada
+    assert importer.import_file(str(planilha), path, today="2024-06-15")["inseridas"] == 0
+
+
+def test_closed_months_become_one_segment_each(tmp_path):
+    path = str(tmp_path / "abastecimentos.csv")
+    planilha = tmp_path / "historico.csv"
+    pd.DataFrame({
+        "Placa": [f"ABC-{1000 + i}" for i in range(9)],
+        "Data": ["2023-01-05", "2023-02-05", "2023-01-06", "2023-02-06", "2023-01-07", "2023-02-07",
+                 "2024-06-01", "2024-06-02", "2023-01-08"],
+        "Litros": ["10"] * 9,
+    }).to_csv(planilha, index=False)
+
+    relatorio = importer.import_file(str(planilha), path, chunksize=2, today="2024-06-15")
+
+    assert relatorio["inseridas"] == 9
+    # Cinco blocos, mas um único segmento por mês fechado
+    assert {mes: len(p) for mes, p in storage.list_partitions(path).items()} == {"2023-01": 1, "2023-02": 1}
+    assert len(storage.load_hot(path)) == 2
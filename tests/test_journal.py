@@ -0,0 +1,53 @@
+import os
+
+import pandas as pd
+
+import journal
+import storage
+
+
+def _rows(n):
+    rows = []
+    for i in range(n):
+        row = {c: "" for c in storage.COLUMNS if c not in ("id", "Versao")}
+        row.update({"Placa": f"ABC-{1000 + i}", "data": "2024-06-01", "total_litros": 10.0, "valor_total": 50.0,
+                    "Odometro": 0, "KmUso": 0, "Setor": "Abatedouro", "Status": "Enviada"})
+        rows.append(row)
+    return rows
+
+
+def test_point_in_time_and_restore(tmp_path):
+    path = str(tmp_path / "abastecimentos.csv")
+    storage.append_rows(_rows(3), path, usuario="Rosimere")
+    antes = pd.Timestamp.now()
+    storage.update_rows({1: {"Status": "Abastecida", "valor_total": 55.0}}, {}, path, usuario="ADMINISTRADOR")
+    storage.delete_rows([2], {}, path, usuario="ADMINISTRADOR")
+
+    passado = journal.as_of(antes, path)
+    assert list(passado["id"]) == [1, 2, 3]
+    assert passado.loc[0, "Status"] == "Enviada" and passado.loc[0, "valor_total"] == 50.0
+    assert list(journal.as_of(antes, path, ids=[2])["Placa"]) == ["ABC-1001"]
+
+    trilha = journal.history(path, desde=antes)
+    assert list(trilha["operacao"]) == ["Alteração", "Exclusão"]
+    assert trilha.loc[0, "colunas"] == "Status, valor_total"
+    assert set(trilha["usuario"]) == {"ADMINISTRADOR"}
+
+    resumo = journal.restore(antes, path, usuario="ADMINISTRADOR")
+    assert resumo["reinseridas"] == [2] and resumo["alteradas"] == [1]
+    atual = storage.load_hot(path)
+    assert list(atual["id"]) == [1, 2, 3]
+    assert atual.loc[0, "Status"] == "Enviada"
+    # A própria restauração fica no diário
+    assert list(journal.history(path, desde=antes)["operacao"])[-2:] == ["Inclusão", "Alteração"]
+
+
+def test_journal_grows_with_change_not_with_size(tmp_path):
+    path = str(tmp_path / "abastecimentos.csv")
+    storage.append_rows(_rows(2000), path)
+    tamanho = sum(os.path.getsize(p) for p in storage.list_journal(path).values())
+
+    storage.update_rows({1500: {"Status": "Cancelada"}}, {}, path)
+
+    crescimento = sum(os.path.getsize(p) for p in storage.list_journal(path).values()) - tamanho
+    assert 0 < crescimento < 300
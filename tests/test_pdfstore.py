@@ -0,0 +1,56 @@
+import os
+import time
+
+import pdfstore
+
+
+def test_put_is_content_addressed_and_linked(tmp_path):
+    path = str(tmp_path / "abastecimentos.csv")
+    pdf = b"%PDF-1.4 " + b"conteudo repetido " * 200
+
+    digest = pdfstore.put(pdf, path)
+    assert pdfstore.put(pdf, path) == digest  # mesmo conteúdo, mesmo objeto
+    assert len(os.listdir(pdfstore.store_dir(path))) == 1
+    assert os.path.getsize(os.path.join(pdfstore.store_dir(path), f"{digest}.pdf.gz")) < len(pdf)
+
+    pdfstore.link([7, 8], digest, "requisicoes.pdf", path)
+    assert pdfstore.reference(8, path)["nome"] == "requisicoes.pdf"
+    assert pdfstore.get(pdfstore.reference(7, path)["hash"], path) == pdf
+    assert pdfstore.linked_ids(path) == [7, 8]
+
+    versao = pdfstore.store_version(path)
+    assert pdfstore.store_version(path) == versao
+    pdfstore.link([9], digest, "outra.pdf", path)
+    assert pdfstore.store_version(path) != versao
+    versao = pdfstore.store_version(path)
+    pdfstore.evict(path, max_bytes=0)
+    assert pdfstore.store_version(path) != versao and pdfstore.linked_ids(path) == []
+
+
+def test_evict_by_ttl_then_least_recently_used(tmp_path):
+    path = str(tmp_path / "abastecimentos.csv")
+    antigo, medio, novo = (pdfstore.put(os.urandom(1000), path) for _ in range(3))
+    agora = time.time()
+    for digest, idade in ((antigo, 400), (medio, 200), (novo, 100)):
+        arquivo = os.path.join(pdfstore.store_dir(path), f"{digest}.pdf.gz")
+        os.utime(arquivo, (agora - idade, agora - idade))
+
+    assert pdfstore.evict(path, ttl=300, now=agora) == [antigo]
+    pdfstore.get(medio, path)  # uso recente: o menos usado passa a ser `novo`
+    assert pdfstore.evict(path, max_bytes=1500, now=agora) == [novo]
+    assert pdfstore.get(novo, path) is None and pdfstore.get(medio, path) is not None
+
+
+def test_evict_prunes_links_to_removed_pdfs(tmp_path):
+    path = str(tmp_path / "abastecimentos.csv")
+    antigo, novo = pdfstore.put(os.urandom(1000), path), pdfstore.put(os.urandom(1000), path)
+    pdfstore.link([1, 2], antigo, "antigo.pdf", path)
+    pdfstore.link([3], novo, "novo.pdf", path)
+    agora = time.time()
+    arquivo = os.path.join(pdfstore.store_dir(path), f"{antigo}.pdf.gz")
+    os.utime(arquivo, (agora - 400, agora - 400))
+
+    assert pdfstore.evict(path, ttl=300, now=agora) == [antigo]
+    assert pdfstore.reference(1, path) is None and pdfstore.reference(2, path) is None
+    assert pdfstore.reference(3, path)["hash"] == novo
+    assert pdfstore.linked_ids(path) == [3]
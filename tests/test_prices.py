@@ -0,0 +1,51 @@
+import pandas as pd
+import prices
+import storage
+
+
+def _rows(data, posto, litros, valor, combustivel="Diesel S10", status="Abastecida"):
+    return {"Placa": "AAA-1111", "data": data, "Posto": posto, "Combustivel": combustivel,
+            "total_litros": litros, "valor_total": valor, "Status": status}
+
+
+def test_index_folds_frozen_segments_once(tmp_path):
+    path = str(tmp_path / "abastecimentos.csv")
+    storage.append_bulk([
+        _rows("2024-01-10", "Rede K", 100, 600),
+        _rows("2024-01-10", "Rede K", 50, 310),
+        _rows("2024-01-11", "Linhares", 40, 232),
+        _rows("2024-01-12", "Linhares", 10, 0),          # valor ainda não lançado
+        _rows("2024-01-12", "Linhares", 10, 60, status="Cancelada"),
+        _rows("2024-06-01", "Rede K", 20, 130),          # mês aberto: partição quente
+    ], path, today="2024-06-15")
+
+    idx = prices.refresh_index(path)
+    rede_k = idx[(idx["Posto"] == "Rede K") & (idx["dia"] == pd.Timestamp("2024-01-10"))].iloc[0]
+    assert (rede_k["valor"], rede_k["litros"], rede_k["abastecimentos"]) == (910, 150, 2)
+    assert len(idx) == 3
+
+    # Segmento novo: entra no índice sem reprocessar os já somados
+    storage.append_bulk([_rows("2024-02-05", "Linhares", 10, 57)], path, today="2024-06-15")
+    idx = prices.refresh_index(path)
+    assert len(idx) == 4
+    assert prices._read_index(prices.index_path(path))["segmentos"] == [
+        "abastecimentos_2024-01.csv.gz", "abastecimentos_2024-02.csv.gz"]
+    assert idx["abastecimentos"].sum() == 5
+
+
+def test_cheapest_and_trend():
+    idx = prices.daily_prices(pd.DataFrame([
+        _rows("2024-03-01", "Rede K", 100, 600),
+        _rows("2024-03-20", "Rede K", 100, 620),
+        _rows("2024-03-21", "Linhares", 50, 290),
+        _rows("2024-03-21", "Linhares", 30, 200, combustivel="Gasolina"),
+        _rows("2023-12-01", "Petronorte", 10, 10),       # fora da janela
+    ]))
+
+    ranking = prices.cheapest(idx, "Diesel S10", dias=30, hoje="2024-03-25")
+    assert list(ranking["Posto"]) == ["Linhares", "Rede K"]
+    assert round(ranking.iloc[1]["preco"], 2) == 6.10
+
+    serie = prices.trend(idx, "Diesel S10", freq="M")
+    marco = serie[serie["periodo"] == pd.Timestamp("2024-03-01")].set_index("Posto")["preco"]
+    assert round(marco["Rede K"], 2) == 6.10 and round(marco["Linhares"], 2) == 5.80
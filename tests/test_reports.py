@@ -0,0 +1,57 @@
+import base64
+import re
+import zlib
+
+import pandas as pd
+import storage
+import reports
+
+
+def _rows(n, setores=("Abatedouro", "Incubatório")):
+    rows = []
+    for i in range(1, n + 1):
+        row = {c: "" for c in storage.COLUMNS}
+        row.update({"id": i, "Placa": f"ABC-{1000 + i % 15}", "data": f"2024-03-{1 + i % 28:02d}",
+                    "Setor": setores[i % len(setores)], "Condutor": "Fulano de Tal", "Posto": "Rede K",
+                    "Combustivel": "Diesel S10", "total_litros": 10.0, "valor_total": 60.0})
+        rows.append(row)
+    return pd.DataFrame(rows, columns=storage.COLUMNS)
+
+
+def _texto_pdf(pdf):
+    """Conteúdo das páginas (o reportlab grava os streams em ASCII85 + Flate)."""
+    partes = []
+    for stream in re.findall(rb"stream\r?\n(.*?)~>\s*endstream", pdf, re.S):
+        try:
+            partes.append(zlib.decompress(base64.a85decode(stream)))
+        except (ValueError, zlib.error):
+            continue
+    return b"".join(partes)
+
+
+def test_detail_lists_the_driver():
+    texto = _texto_pdf(reports.build_monthly_report(_rows(5), "2024-03"))
+    assert b"(Condutor)" in texto
+    assert b"(Fulano de Tal)" in texto
+
+
+def test_long_month_spans_pages():
+    pdf = reports.build_monthly_report(_rows(400), "2024-03")
+
+    assert pdf.startswith(b"%PDF")
+    # 400 linhas de detalhe não cabem em uma página por setor
+    assert len(re.findall(rb"/Type /Page[^s]", pdf)) > 4
+
+
+def test_report_cached_until_data_changes(tmp_path):
+    path = str(tmp_path / "abastecimentos.csv")
+    storage.save_hot(_rows(20), path)
+
+    primeiro = reports.request_monthly_report("2024-03", path)
+    assert reports.request_monthly_report("2024-03", path) is primeiro
+    assert primeiro.result(timeout=30).startswith(b"%PDF")
+    assert reports.report_status("2024-03", path)[0] == "pronto"
+
+    storage.save_hot(_rows(21), path)
+    assert reports.report_status("2024-03", path)[0] == "ausente"
+    assert reports.request_monthly_report("2024-03", path) is not primeiro
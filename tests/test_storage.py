@@ -0,0 +1,184 @@
+import os
+import multiprocessing
+import pandas as pd
+import pytest
+import storage
+
+
+def _make_rows(dates):
+    rows = []
+    for i, d in enumerate(dates, start=1):
+        row = {c: "" for c in storage.COLUMNS}
+        row.update({"id": i, "Placa": f"ABC-{1000 + i}", "data": d, "total_litros": 10.0,
+                    "valor_total": 50.0, "Odometro": 0, "KmUso": 0, "Status": "Enviada"})
+        rows.append(row)
+    return pd.DataFrame(rows, columns=storage.COLUMNS)
+
+
+def test_freeze_closed_periods(tmp_path):
+    path = str(tmp_path / "abastecimentos.csv")
+    df = _make_rows(["2024-01-10", "2024-01-20", "2024-02-05", "2024-05-01", "2024-06-02"])
+    storage.save_hot(df, path)
+
+    created = storage.freeze_closed_periods(path, today="2024-06-15")
+
+    # Janeiro e fevereiro congelados; maio (mês anterior) e junho continuam quentes
+    assert sorted(os.path.basename(p) for p in created) == [
+        "abastecimentos_2024-01.csv.gz", "abastecimentos_2024-02.csv.gz"]
+    assert sorted(storage.load_hot(path)["id"]) == [4, 5]
+    assert not os.stat(created[0]).st_mode & 0o222
+
+
+def test_freeze_adds_segment_for_late_rows(tmp_path):
+    path = str(tmp_path / "abastecimentos.csv")
+    storage.save_hot(_make_rows(["2024-01-10"]), path)
+    storage.freeze_closed_periods(path, today="2024-06-15")
+
+    late = _make_rows(["2024-01-25"])
+    late["id"] = 2
+    storage.save_hot(late, path)
+    storage.freeze_closed_periods(path, today="2024-06-15")
+
+    assert len(storage.list_partitions(path)["2024-01"]) == 2
+    assert sorted(storage.load_range(filename=path)["id"]) == [1, 2]
+
+
+def test_load_range_prunes_partitions(tmp_path):
+    path = str(tmp_path / "abastecimentos.csv")
+    storage.save_hot(_make_rows(["2023-03-01", "2024-01-10", "2024-06-02"]), path)
+    storage.freeze_closed_periods(path, today="2024-06-15")
+
+    df = storage.load_range("2024-01-01", "2024-01-31", filename=path)
+
+    assert list(df["id"]) == [2]
+    assert len(storage.load_range(filename=path)) == 3
+
+
+def _writer(path, worker, count):
+    for i in range(count):
+        row = _make_rows(["2024-06-01"]).iloc[0].to_dict()
+        row["Referente"] = f"{worker}-{i}"
+        storage.append_rows([row], path)
+
+
+def test_parallel_writers_lose_no_rows(tmp_path):
+    path = str(tmp_path / "abastecimentos.csv")
+    writers, per_writer = 6, 25
+    procs = [multiprocessing.Process(target=_writer, args=(path, w, per_writer)) for w in range(writers)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(timeout=120)
+        assert p.exitcode == 0
+
+    df = storage.load_hot(path)
+    # Nenhuma gravação perdida e nenhuma linha duplicada
+    assert len(df) == writers * per_writer
+    assert df["Referente"].is_unique
+    assert sorted(df["id"]) == list(range(1, writers * per_writer + 1))
+
+
+def test_update_rejects_stale_version(tmp_path):
+    path = str(tmp_path / "abastecimentos.csv")
+    storage.append_rows(_make_rows(["2024-06-01"]).to_dict("records"), path)
+
+    storage.update_rows({1: {"Status": "Abastecida"}}, {1: 1}, path)
+
+    # Outra sessão ainda com a versão 1 em memória
+    with pytest.raises(storage.ConflictError):
+        storage.update_rows({1: {"Status": "Cancelada"}}, {1: 1}, path)
+    with pytest.raises(storage.ConflictError):
+        storage.delete_rows([1], {1: 1}, path)
+    assert storage.load_hot(path).loc[0, "Status"] == "Abastecida"
+
+
+def test_sequence_continues_after_archived_ids(tmp_path):
+    path = str(tmp_path / "abastecimentos.csv")
+    df = _make_rows(["2024-01-10", "2024-01-11"])
+    df["id"] = [41, 42]
+    storage.save_hot(df, path)
+    storage.freeze_closed_periods(path, today="2024-06-15")
+
+    _, ids = storage.append_rows(_make_rows(["2024-06-01", "2024-06-02"]).to_dict("records"), path)
+
+    assert ids == [43, 44]
+
+
+def test_idempotent_submission(tmp_path):
+    path = str(tmp_path / "abastecimentos.csv")
+    row = _make_rows(["2024-06-01"]).iloc[0].to_dict()
+    row["ChaveEnvio"] = "chave-1"
+
+    assert storage.claim_submission("chave-1", path) is None
+    # Um duplo clique enquanto o primeiro envio ainda não terminou
+    with pytest.raises(storage.SubmissionInProgress):
+        storage.claim_submission("chave-1", path)
+
+    _, ids = storage.append_rows([row], path)
+
+    # Reenvio depois de gravado devolve a requisição existente
+    assert storage.claim_submission("chave-1", path) == ids[0]
+
+
+def test_release_allows_retry(tmp_path):
+    path = str(tmp_path / "abastecimentos.csv")
+    storage.claim_submission("chave-2", path)
+    storage.release_submission("chave-2", path)
+    assert storage.claim_submission("chave-2", path) is None
+
+
+def test_shards_by_setor(tmp_path):
+    path = str(tmp_path / "abastecimentos.csv")
+    rows = _make_rows(["2024-06-01", "2024-06-02", "2024-06-03"])
+    rows["Setor"] = ["Abatedouro", "Incubatório", "Abatedouro"]
+    storage.append_rows(rows.to_dict("records"), path)
+
+    assert sorted(storage.list_shards(path)) == ["abatedouro", "incubatorio"]
+    sessao = storage.load_hot(path, shards=["Abatedouro"])
+    assert list(sessao["id"]) == [1, 3]
+    assert list(storage.load_hot(path)["id"]) == [1, 2, 3]
+
+    # A sessão do abatedouro não edita linhas de outro setor...
+    with pytest.raises(storage.ConflictError):
+        storage.update_rows({2: {"Status": "Cancelada"}}, {2: 1}, path, shards=["Abatedouro"])
+    # ...e uma linha que muda de setor muda de shard.
+    hot = storage.update_rows({3: {"Setor": "Incubatório"}}, {3: 1}, path, shards=["Abatedouro"])
+    assert list(hot["id"]) == [1]
+    assert list(storage.load_hot(path, shards=["Incubatório"])["id"]) == [2, 3]
+
+
+def test_legacy_single_file_is_split_on_write(tmp_path):
+    path = str(tmp_path / "abastecimentos.csv")
+    legado = _make_rows(["2024-06-01", "2024-06-02"])
+    legado["Setor"] = ["CD Paraíso", ""]
+    legado.to_csv(path, index=False)
+    assert list(storage.load_hot(path, shards=["CD Paraíso"])["id"]) == [1]
+
+    storage.append_rows(_make_rows(["2024-06-03"]).to_dict("records"), path)
+
+    assert sorted(storage.list_shards(path)) == ["cd-paraiso", storage.SEM_SETOR]
+    assert pd.read_csv(path).empty
+    assert sorted(storage.load_hot(path)["id"]) == [1, 2, 3]
+
+
+def test_bulk_update_by_filter(tmp_path):
+    path = str(tmp_path / "abastecimentos.csv")
+    rows = _make_rows(["2024-05-01", "2024-05-20", "2024-06-10", "2024-05-02"])
+    rows["Posto"] = ["Rede K", "Rede K", "Rede K", "Linhares"]
+    storage.append_rows(rows.to_dict("records"), path)
+    hot = storage.load_hot(path)
+
+    ids = storage.match_ids(hot, status=["Enviada"], postos=["Rede K"], antes_de="2024-06-01")
+    assert ids == [1, 2]
+    assert storage.match_ids(hot, ids=[4], faixas=[(2, 2_000_000_000)]) == [2, 3, 4]
+
+    # Uma versão desatualizada recusa o lote inteiro
+    storage.update_rows({2: {"Placa": "ABC-9999"}}, {2: 1}, path)
+    with pytest.raises(storage.ConflictError):
+        storage.update_where(ids, {"Status": "Cancelada"}, {1: 1, 2: 1}, path)
+    assert set(storage.load_hot(path)["Status"]) == {"Enviada"}
+
+    storage.update_where(ids, {"Status": "Cancelada"}, {1: 1, 2: 2}, path)
+    hot = storage.load_hot(path)
+    assert list(hot["Status"]) == ["Cancelada", "Cancelada", "Enviada", "Enviada"]
+    assert list(hot["Versao"]) == [2, 3, 1, 1]
@@ -0,0 +1,149 @@
+import sqlite3
+import pandas as pd
+import pytest
+import storage
+import sync
+
+
+def _db(path):
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE abastecimentos(id INTEGER PRIMARY KEY AUTOINCREMENT, placa TEXT NOT NULL,
+        valor_total REAL NOT NULL, data TEXT NOT NULL, referente TEXT NOT NULL, odometro INTEGER, posto TEXT,
+        combustivel TEXT, condutor TEXT, unidade TEXT, setor TEXT, total_litros REAL, Status TEXT, Subsetor TEXT,
+        Observacoes TEXT, TanqueCheio INTEGER, DataUso TEXT, KmUso INTEGER, EmailPosto TEXT, TipoPosto TEXT,
+        Supervisor TEXT)""")
+    conn.execute("""CREATE TABLE requisicoes(id INTEGER PRIMARY KEY AUTOINCREMENT, condutor TEXT, placa TEXT,
+        setor TEXT, data TEXT, justificativa TEXT, litros TEXT, km_inicial INTEGER, posto TEXT,
+        email_destino TEXT, enviado_em TEXT)""")
+    conn.executemany("INSERT INTO abastecimentos (placa, valor_total, data, referente, total_litros) VALUES (?, ?, ?, ?, ?)",
+                     [("AAA-1111", 100.0, "2026-10-01 00:00:00", "Próprio", 20.0),
+                      ("BBB-2222", 50.0, "2026-10-02 00:00:00", "Terceiro", 10.0)])
+    conn.execute("INSERT INTO requisicoes (condutor, placa, data, litros, km_inicial, email_destino) "
+                 "VALUES ('Ana', 'CCC-3333', '2026-10-03', '30', 1200, 'posto@x.com')")
+    conn.commit()
+    return conn
+
+
+def test_incremental_both_directions(tmp_path):
+    csv_path, db_path = str(tmp_path / "abastecimentos.csv"), str(tmp_path / "abastecimentos.db")
+    storage.save_hot(storage.empty_frame(), csv_path)
+    conn = _db(db_path)
+
+    primeira = sync.sync(csv_path, db_path)
+    assert primeira["db_para_csv"]["inseridos"] == 3
+    hot = storage.load_hot(csv_path)
+    req = hot[hot["Placa"] == "CCC-3333"].iloc[0]
+    assert (req["total_litros"], req["Odometro"], req["EmailPosto"]) == (30.0, 1200, "posto@x.com")
+
+    # Nada mudou: nenhuma linha trafega
+    vazia = sync.sync(csv_path, db_path)
+    assert all(n == 0 for lado in ("db_para_csv", "csv_para_db") for n in vazia[lado].values())
+
+    # Uma alteração de cada lado + uma linha nova no CSV
+    conn.execute("UPDATE abastecimentos SET valor_total = 999 WHERE placa = 'BBB-2222'")
+    conn.commit()
+    aaa = hot.loc[hot["Placa"] == "AAA-1111"].iloc[0]
+    storage.update_rows({int(aaa["id"]): {"Status": "Abastecida"}}, {int(aaa["id"]): int(aaa["Versao"])}, csv_path)
+    nova = {c: "" for c in storage.COLUMNS}
+    nova.update({"Placa": "DDD-4444", "data": "2026-10-05", "total_litros": 5.0, "valor_total": 25.0})
+    storage.append_rows(pd.DataFrame([nova], columns=storage.COLUMNS), csv_path)
+
+    delta = sync.sync(csv_path, db_path)
+    assert delta["db_para_csv"] == {"inseridos": 0, "alterados": 1, "excluidos": 0}
+    assert delta["csv_para_db"] == {"inseridos": 1, "alterados": 1, "excluidos": 0}
+    hot = storage.load_hot(csv_path)
+    assert hot.loc[hot["Placa"] == "BBB-2222", "valor_total"].iloc[0] == 999
+    assert conn.execute("SELECT Status FROM abastecimentos WHERE placa = 'AAA-1111'").fetchone() == ("Abastecida",)
+    assert conn.execute("SELECT valor_total FROM abastecimentos WHERE placa = 'DDD-4444'").fetchone() == (25.0,)
+
+
+def test_conflict_keeps_csv_version(tmp_path):
+    csv_path, db_path = str(tmp_path / "abastecimentos.csv"), str(tmp_path / "abastecimentos.db")
+    storage.save_hot(storage.empty_frame(), csv_path)
+    conn = _db(db_path)
+    sync.sync(csv_path, db_path)
+
+    hot = storage.load_hot(csv_path)
+    aaa = hot.loc[hot["Placa"] == "AAA-1111"].iloc[0]
+    storage.update_rows({int(aaa["id"]): {"valor_total": 1.0}}, {int(aaa["id"]): int(aaa["Versao"])}, csv_path)
+    conn.execute("UPDATE abastecimentos SET valor_total = 2 WHERE placa = 'AAA-1111'")
+    conn.commit()
+
+    resumo = sync.sync(csv_path, db_path)
+
+    assert resumo["conflitos"] == 1
+    assert conn.execute("SELECT valor_total FROM abastecimentos WHERE placa = 'AAA-1111'").fetchone() == (1.0,)
+
+
+def test_csv_delta_comes_from_the_journal(tmp_path, monkeypatch):
+    csv_path, db_path = str(tmp_path / "abastecimentos.csv"), str(tmp_path / "abastecimentos.db")
+    storage.save_hot(storage.empty_frame(), csv_path)
+    conn = _db(db_path)
+    sync.sync(csv_path, db_path)
+
+    leituras = []
+    load_range = storage.load_range
+    monkeypatch.setattr(storage, "load_range", lambda *a, **k: leituras.append(a[:2]) or load_range(*a, **k))
+    hot = storage.load_hot(csv_path)
+    bbb = int(hot.loc[hot["Placa"] == "BBB-2222", "id"].iloc[0])
+    storage.delete_rows([bbb], {}, csv_path)
+    antiga = {c: "" for c in storage.COLUMNS}
+    antiga.update({"Placa": "EEE-5555", "data": "2024-01-10", "total_litros": 8.0, "valor_total": 40.0})
+    storage.append_bulk([antiga], csv_path)  # mês fechado: vai direto para um segmento congelado
+
+    delta = sync.sync(csv_path, db_path)
+
+    assert delta["csv_para_db"] == {"inseridos": 1, "alterados": 0, "excluidos": 1}
+    assert conn.execute("SELECT count(*) FROM abastecimentos WHERE placa = 'BBB-2222'").fetchone() == (0,)
+    assert conn.execute("SELECT valor_total FROM abastecimentos WHERE placa = 'EEE-5555'").fetchone() == (40.0,)
+    # Só o mês da importação foi lido, não o histórico inteiro
+    assert all(inicio is not None for inicio, _ in leituras) and len(leituras) == 1
+
+
+def test_interrupted_sync_creates_no_duplicates(tmp_path, monkeypatch):
+    csv_path, db_path = str(tmp_path / "abastecimentos.csv"), str(tmp_path / "abastecimentos.db")
+    storage.save_hot(storage.empty_frame(), csv_path)
+    conn = _db(db_path)
+    sync.sync(csv_path, db_path)
+
+    # Alguém edita BBB no CSV logo depois do append da sincronização: a alteração
+    # vinda do banco para BBB conflita e é contada, sem abortar o resto.
+    conn.execute("INSERT INTO abastecimentos (placa, valor_total, data, referente) VALUES ('FFF-6666', 1, '2026-10-06', '')")
+    conn.execute("UPDATE abastecimentos SET valor_total = 7 WHERE placa = 'BBB-2222'")
+    conn.commit()
+    append_rows = storage.append_rows
+
+    def append_e_edicao(*args, **kwargs):
+        resultado = append_rows(*args, **kwargs)
+        hot = storage.load_hot(csv_path)
+        bbb = hot.loc[hot["Placa"] == "BBB-2222"].iloc[0]
+        storage.update_rows({int(bbb["id"]): {"valor_total": 123.0}}, {int(bbb["id"]): int(bbb["Versao"])}, csv_path)
+        return resultado
+
+    monkeypatch.setattr(storage, "append_rows", append_e_edicao)
+    resumo = sync.sync(csv_path, db_path)
+    monkeypatch.undo()
+    assert resumo["conflitos"] == 1 and resumo["db_para_csv"]["inseridos"] == 1
+
+    # Falha depois do append: o banco volta atrás, mas a linha já está no CSV.
+    conn.execute("INSERT INTO abastecimentos (placa, valor_total, data, referente) VALUES ('GGG-7777', 1, '2026-10-07', '')")
+    conn.execute("UPDATE abastecimentos SET valor_total = 8 WHERE placa = 'AAA-1111'")
+    conn.commit()
+
+    def falha(*args, **kwargs):
+        raise OSError("disco cheio")
+
+    monkeypatch.setattr(storage, "update_rows", falha)
+    with pytest.raises(OSError):
+        sync.sync(csv_path, db_path)
+    monkeypatch.undo()
+    sync.sync(csv_path, db_path)
+    sync.sync(csv_path, db_path)
+
+    placas_csv = storage.load_hot(csv_path)["Placa"].value_counts()
+    placas_db = pd.read_sql_query("SELECT placa FROM abastecimentos UNION ALL SELECT placa FROM requisicoes",
+                                  conn)["placa"].value_counts()
+    assert placas_csv.max() == 1 and placas_db.max() == 1
+    assert set(placas_csv.index) == set(placas_db.index)
+    assert conn.execute("SELECT valor_total FROM abastecimentos WHERE placa = 'BBB-2222'").fetchone() == (123.0,)
+    assert conn.execute("SELECT valor_total FROM abastecimentos WHERE placa = 'AAA-1111'").fetchone() == (8.0,)
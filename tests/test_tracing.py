@@ -0,0 +1,45 @@
+import pandas as pd
+import pytest
+import tracing
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    path = str(tmp_path / "logs" / "desempenho.jsonl")
+    tracing.configure(path)
+    yield path
+    tracing.configure()
+
+
+def test_traced_records_rows_and_bytes(log_path):
+    @tracing.traced("carregar")
+    def carregar():
+        return pd.DataFrame({"id": [1, 2, 3]})
+
+    @tracing.traced()
+    def gerar_pdf():
+        return b"%PDF-1.4 ..."
+
+    carregar()
+    gerar_pdf()
+
+    events = tracing.read_events(log_path)
+    assert [e["op"] for e in events] == ["carregar", "gerar_pdf"]
+    assert events[0]["linhas"] == 3
+    assert events[1]["bytes"] == 12
+
+
+def test_trace_marks_errors_and_summarizes(log_path):
+    for _ in range(5):
+        with tracing.trace("smtp_handshake"):
+            pass
+    with pytest.raises(ValueError):
+        with tracing.trace("smtp_envio", bytes=10):
+            raise ValueError("falhou")
+
+    events = tracing.read_events(log_path)
+    assert events[-1]["erro"] == "ValueError"
+
+    resumo = tracing.summarize(events).set_index("op")
+    assert resumo.loc["smtp_handshake", "chamadas"] == 5
+    assert resumo.loc["smtp_envio", "bytes_media"] == 10
@@ -0,0 +1,122 @@
+import pandas as pd
+import vehicles
+
+
+def _df():
+    return pd.DataFrame({
+        "Placa": ["ABC-1D23", "ABC-1D23", "ABC-1D23", "XYZ-9876"],
+        "data": ["2024-03-01", "2024-03-10", "2024-03-05", "2024-03-02"],
+        "Odometro": [10000, 10800, 0, 500], "KmUso": [0, 0, 10400, 0],
+        "total_litros": [40.0, 60.0, 50.0, 20.0],
+        "Combustivel": ["Diesel S10", "Diesel S10", "Gasolina", "Etanol"],
+        "Posto": ["Rede K", "Linhares", "Rede K", "Petronorte"],
+        "EmailPosto": ["k@posto.com", "l@posto.com", "k@posto.com", "p@posto.com"],
+        "Condutor": ["Jose", "Maria", "Jose", "Ana"], "Setor": ["Abatedouro"] * 4,
+        "Subsetor": ["Campo"] * 4, "Cidade": ["Araguaína"] * 4, "Status": ["Abastecida"] * 4,
+    })
+
+
+def test_rebuild_summarizes_last_state():
+    indice = vehicles.PlateIndex()
+    indice.rebuild(_df(), versao="v1")
+
+    estado = indice.get("ABC-1D23")
+    assert estado["ultima_data"] == pd.Timestamp("2024-03-10")
+    assert estado["odometro"] == 10800
+    assert estado["litros_tipicos"] == 50.0
+    assert (estado["combustivel"], estado["posto"]) == ("Diesel S10", "Rede K")
+    assert (estado["ultimo_posto"], estado["condutor"]) == ("Linhares", "Maria")
+    assert indice.get("AAA-0000") is None and indice.versao == "v1"
+
+
+def test_incremental_observe_matches_rebuild_and_checks_odometer():
+    df = _df()
+    incremental = vehicles.PlateIndex()
+    incremental.observe_rows(df.to_dict("records"), versao="v2")
+    completo = vehicles.PlateIndex()
+    completo.rebuild(df)
+    assert incremental.get("ABC-1D23") == completo.get("ABC-1D23")
+
+    assert "menor" in incremental.check_odometro("ABC-1D23", 10700, "2024-03-11")
+    assert "acima" in incremental.check_odometro("ABC-1D23", 20000, "2024-03-11")
+    assert incremental.check_odometro("ABC-1D23", 11200, "2024-03-11") is None
+    assert incremental.check_odometro("NOV-0001", 5, "2024-03-11") is None  # placa sem histórico
+
+    incremental.observe({"Placa": "ABC-1D23", "data": "2024-03-12", "Odometro": 11200, "total_litros": 50.0,
+                         "Combustivel": "Diesel S10", "Posto": "Rede K", "Status": "Enviada"})
+    assert incremental.get("ABC-1D23")["odometro"] == 11200
+    assert incremental.get("ABC-1D23")["ultimo_posto"] == "Rede K"
+
+
+def test_timeline_by_plate():
+    linhas = vehicles.PlateTimelines(_df().assign(valor_total=[240.0, 360.0, 300.0, 100.0]), versao="v1")
+
+    linha = linhas.timeline("ABC-1D23")
+    assert list(linha["data"].dt.day) == [1, 5, 10]
+    assert list(linha["km_rodados"].fillna(0)) == [0, 400, 400]
+    assert linha.loc[1, "km_por_litro"] == 8.0
+    assert linhas.timeline("ABC-1D23") is linha  # segunda consulta vem do cache LRU
+
+    resumo = linhas.summary("ABC-1D23")
+    assert (resumo["requisicoes"], resumo["km_rodados"], resumo["km_por_litro"]) == (3, 800, 800 / 110)
+    assert list(linhas.postos("ABC-1D23")["Posto"]) == ["Rede K", "Linhares"]
+    assert linhas.placas() == ["ABC-1D23", "XYZ-9876"] and linhas.summary("AAA-0000") is None
+
+
+def test_edits_replace_the_previous_contribution():
+    df = _df()
+    df["id"] = [1, 2, 3, 4]
+    indice = vehicles.PlateIndex()
+    indice.rebuild(df)
+
+    # Odômetro digitado errado e depois corrigido
+    errada = {**df.iloc[1].to_dict(), "Odometro": 99999}
+    indice.observe(errada)
+    assert indice.get("ABC-1D23")["odometro"] == 99999
+    indice.observe({**errada, "Odometro": 10000})
+    # Placa trocada e uma exclusão
+    indice.observe({**df.iloc[2].to_dict(), "Placa": "XYZ-9876"})
+    indice.forget([4])
+
+    esperado = df.copy()
+    esperado.loc[1, "Odometro"] = 10000
+    esperado.loc[2, "Placa"] = "XYZ-9876"
+    completo = vehicles.PlateIndex()
+    completo.rebuild(esperado[esperado["id"] != 4])
+    for placa in ("ABC-1D23", "XYZ-9876"):
+        assert indice.get(placa) == completo.get(placa)
+    assert indice.check_odometro("ABC-1D23", 10100, "2024-03-11") is None
+
+
+def test_apply_journal_entries():
+    df = _df()
+    df["id"] = [1, 2, 3, 4]
+    indice = vehicles.PlateIndex()
+    indice.rebuild(df.iloc[:3], marca="2024-03-20 00:00:00")
+
+    indice.apply_entries([
+        {"em": "2024-03-21 08:00:00.000000", "op": "inclusao", "linhas": {"4": df.iloc[3].drop("id").to_dict()}},
+        {"em": "2024-03-21 09:00:00.000000", "op": "alteracao", "linhas": {"2": {"Status": ["Abastecida", "Cancelada"]}}},
+    ], versao="v3")
+
+    completo = vehicles.PlateIndex()
+    completo.rebuild(df.assign(Status=["Abastecida", "Cancelada", "Abastecida", "Abastecida"]))
+    assert indice.get("ABC-1D23") == completo.get("ABC-1D23")
+    assert indice.get("XYZ-9876") == completo.get("XYZ-9876")
+    assert (indice.versao, indice.marca) == ("v3", "2024-03-21 09:00:00.000000")
+
+
+def test_get_with_setores_hides_other_sectors():
+    df = _df()
+    df.loc[1, ["Setor", "Condutor", "Cidade"]] = ["Granjas de produção", "Antonio Alfredo", "Palmas"]
+    indice = vehicles.PlateIndex()
+    indice.rebuild(df)
+
+    estado = indice.get("ABC-1D23", ["Abatedouro"])
+    assert (estado["condutor"], estado["cidade"], estado["setor"]) == ("Jose", "Araguaína", "Abatedouro")
+    assert estado["odometro"] == 10400 and estado["ultima_data"] == pd.Timestamp("2024-03-05")
+    assert indice.get("ABC-1D23", ["Granjas de produção"])["condutor"] == "Antonio Alfredo"
+    assert indice.get("XYZ-9876", ["Granjas de produção"]) is None
+    assert indice.get("ABC-1D23", []) is None
+    assert indice.get("ABC-1D23")["condutor"] == "Antonio Alfredo"  # sem setores: todos
+    assert indice.check_odometro("ABC-1D23", 10500, "2024-03-11", ["Abatedouro"]) is None
@@ -0,0 +1,45 @@
+import time
+
+import storage
+import warmer
+
+
+def _wait(cond, timeout=5.0):
+    fim = time.monotonic() + timeout
+    while time.monotonic() < fim:
+        if cond():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_warms_at_start_and_after_debounced_writes(tmp_path):
+    path = str(tmp_path / "abastecimentos.csv")
+    chamadas = []
+    aquecedor = warmer.CacheWarmer([("conta", chamadas.append)], path, debounce=0.3, poll=60).start()
+    assert _wait(lambda: len(chamadas) == 1)
+
+    # Rajada de gravações: um único aquecimento, depois do debounce, na versão final.
+    for i in range(3):
+        row = {c: "" for c in storage.COLUMNS}
+        row.update({"Placa": f"ABC-{i}", "data": "2024-06-01", "Setor": "Abatedouro", "total_litros": 10.0,
+                    "valor_total": 50.0, "Odometro": 0, "KmUso": 0})
+        storage.append_rows([row], path)
+        aquecedor.notify()
+        time.sleep(0.1)
+    assert _wait(lambda: len(chamadas) == 2)
+    time.sleep(0.5)
+    assert len(chamadas) == 2
+    assert chamadas[-1] == storage.data_version(path) == aquecedor.versao
+
+
+def test_failing_task_does_not_block_others(tmp_path):
+    def falha(versao):
+        raise RuntimeError("sem dados")
+
+    chamadas = []
+    aquecedor = warmer.CacheWarmer([("falha", falha), ("ok", chamadas.append)], str(tmp_path / "x.csv"))
+    aquecedor.warm("v1")
+    assert chamadas == ["v1"]
+    status = {s["tarefa"]: s for s in aquecedor.status()}
+    assert status["falha"]["erro"] == "sem dados" and status["ok"]["erro"] is None
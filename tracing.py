@@ -0,0 +1,130 @@
+# =========================================================
+# Instrumentação de desempenho
+# Cada operação medida vira uma linha JSON (operação, duração, linhas, bytes)
+# num log rotativo em logs/desempenho.jsonl. Importar o módulo não abre
+# arquivo nenhum: os pontos de entrada (app, linhas de comando) chamam
+# configure(); sem isso as medições são descartadas.
+# =========================================================
+import os
+import json
+import time
+import logging
+import functools
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+TRACE_LOG_PATH = os.path.join(PROJECT_DIR, "logs", "desempenho.jsonl")
+MAX_BYTES = 2 * 1024 * 1024
+BACKUP_COUNT = 3
+
+_logger = logging.getLogger("abastecimentos.desempenho")
+_logger.setLevel(logging.INFO)
+_logger.propagate = False
+_logger.addHandler(logging.NullHandler())
+
+
+def configure(path=TRACE_LOG_PATH, max_bytes=MAX_BYTES, backup_count=BACKUP_COUNT):
+    """(Re)aponta o log de desempenho para `path`. Chamado uma vez por processo pelo ponto de entrada."""
+    global TRACE_LOG_PATH
+    for handler in list(_logger.handlers):
+        _logger.removeHandler(handler)
+        handler.close()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    _logger.addHandler(handler)
+    TRACE_LOG_PATH = path
+
+
+def _emit(event):
+    try:
+        _logger.info(json.dumps(event, ensure_ascii=False, default=str))
+    except Exception:
+        # Instrumentação nunca pode derrubar a operação medida.
+        pass
+
+
+def _measure(result):
+    """Extrai linhas/bytes do retorno (DataFrame, bytes ou tupla começando por eles)."""
+    if isinstance(result, tuple) and result:
+        result = result[0]
+    if isinstance(result, (bytes, bytearray)):
+        return {"bytes": len(result)}
+    if hasattr(result, "shape") and hasattr(result, "columns"):
+        return {"linhas": int(result.shape[0])}
+    return {}
+
+
+@contextmanager
+def trace(operation, **fields):
+    """Mede o bloco. O dicionário devolvido aceita campos extras (ex.: span['linhas'] = n)."""
+    span = dict(fields)
+    start = time.perf_counter()
+    erro = None
+    try:
+        yield span
+    except Exception as e:
+        erro = type(e).__name__
+        raise
+    finally:
+        event = {"ts": datetime.now().isoformat(timespec="seconds"), "op": operation,
+                 "ms": round((time.perf_counter() - start) * 1000, 3)}
+        event.update(span)
+        if erro:
+            event["erro"] = erro
+        _emit(event)
+
+
+def traced(operation=None):
+    """Decorator: mede cada chamada e registra linhas/bytes do valor retornado."""
+    def decorator(func):
+        name = operation or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with trace(name) as span:
+                result = func(*args, **kwargs)
+                span.update(_measure(result))
+                return result
+        return wrapper
+    return decorator
+
+
+def read_events(path=None):
+    """Lê os eventos do log atual e dos arquivos rotacionados."""
+    path = path or TRACE_LOG_PATH
+    events = []
+    for candidate in [f"{path}.{i}" for i in range(BACKUP_COUNT, 0, -1)] + [path]:
+        if not os.path.exists(candidate):
+            continue
+        with open(candidate, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    continue
+    return events
+
+
+def summarize(events):
+    """Tabela por operação: chamadas, p50/p95 em ms, linhas e bytes médios."""
+    import pandas as pd
+
+    if not events:
+        return pd.DataFrame(columns=["op", "chamadas", "p50_ms", "p95_ms", "linhas_media", "bytes_media"])
+    df = pd.DataFrame(events)
+    for col in ("linhas", "bytes"):
+        if col not in df.columns:
+            df[col] = float("nan")
+    grouped = df.groupby("op")
+    out = pd.DataFrame({
+        "chamadas": grouped["ms"].size(),
+        "p50_ms": grouped["ms"].quantile(0.5),
+        "p95_ms": grouped["ms"].quantile(0.95),
+        "linhas_media": grouped["linhas"].mean(),
+        "bytes_media": grouped["bytes"].mean(),
+    }).reset_index()
+    return out.sort_values("p95_ms", ascending=False).reset_index(drop=True)
+
@@ -0,0 +1,315 @@
+# =========================================================
+# Último estado conhecido de cada veículo
+# Índice por placa com o último abastecimento, o maior odômetro informado,
+# a média de litros e as contagens de combustível/posto. Guarda a
+# contribuição de cada requisição (por id): uma requisição nova soma O(1)
+# ao estado da placa; uma editada, cancelada ou excluída recalcula só a
+# própria placa. Gravações de outros processos chegam pelo diário de
+# alterações, sem reler o histórico.
+# Linhas do tempo por placa (página Veículos): índice placa -> posições das
+# linhas no histórico e cache LRU das linhas do tempo já montadas.
+# O índice é do processo (todos os setores); a consulta com `setores` usa só
+# as requisições dos shards da sessão, para um setor não ver o condutor, o
+# posto ou o odômetro que outro setor registrou para a mesma placa.
+# =========================================================
+import threading
+from collections import Counter, namedtuple
+from functools import lru_cache
+
+import pandas as pd
+
+import storage
+
+MAX_KM_POR_DIA = 1500  # acima disso a leitura do odômetro é considerada impossível
+TIMELINE_CACHE = 256  # placas com a linha do tempo pronta em memória (LRU)
+
+_ULTIMOS = ["Posto", "EmailPosto", "Condutor", "Setor", "Subsetor", "Cidade", "Combustivel"]
+# O que o índice guarda de cada requisição (já normalizado).
+_Linha = namedtuple("_Linha", ["Placa", "data", "Odometro", "KmUso", "total_litros", "Status"] + _ULTIMOS)
+
+
+def _texto(valor):
+    return "" if valor is None or (isinstance(valor, float) and pd.isna(valor)) else str(valor).strip()
+
+
+def _numero(valor):
+    numero = pd.to_numeric(valor, errors="coerce")
+    return 0.0 if pd.isna(numero) else float(numero)
+
+
+def _data(valor):
+    data = pd.to_datetime(valor, errors="coerce")
+    return None if pd.isna(data) else data
+
+
+def _linha(row):
+    return _Linha(_texto(row.get("Placa")), _data(row.get("data")), _numero(row.get("Odometro")),
+                  _numero(row.get("KmUso")), _numero(row.get("total_litros")), _texto(row.get("Status")),
+                  *(_texto(row.get(col)) for col in _ULTIMOS))
+
+
+def _id(row):
+    valor = row.get("id")
+    return None if valor is None or pd.isna(valor) else int(valor)
+
+
+def _vazio():
+    return {"data": None, "odometro": 0.0, "litros_soma": 0.0, "litros_n": 0,
+            "combustiveis": Counter(), "postos": Counter(), **{col: "" for col in _ULTIMOS}}
+
+
+def _somar(estado, linha):
+    """Acrescenta uma requisição ao estado da placa (a mais recente por data define os campos "último")."""
+    estado["odometro"] = max(estado["odometro"], linha.Odometro, linha.KmUso)
+    if linha.total_litros > 0:
+        estado["litros_soma"] += linha.total_litros
+        estado["litros_n"] += 1
+    if linha.Combustivel:
+        estado["combustiveis"][linha.Combustivel] += 1
+    if linha.Posto:
+        estado["postos"][linha.Posto] += 1
+    if estado["data"] is None or (linha.data is not None and linha.data >= estado["data"]):
+        estado["data"] = linha.data
+        for col in _ULTIMOS:
+            estado[col] = getattr(linha, col)
+
+
+def _conta(linha):
+    return bool(linha.Placa) and linha.Status != "Cancelada"
+
+
+def _estado_de(linhas, ids):
+    """Estado de uma placa somando suas requisições válidas em ordem de id, ou None se não houver."""
+    validas = [linhas[i] for i in sorted(ids) if _conta(linhas[i])]
+    if not validas:
+        return None
+    estado = _vazio()
+    for linha in validas:
+        _somar(estado, linha)
+    return estado
+
+
+class PlateIndex:
+    """{placa: estado} com atualização incremental; seguro entre threads."""
+
+    def __init__(self):
+        self._estado = {}
+        self._linhas = {}   # id -> _Linha
+        self._ids = {}      # placa -> ids das requisições dela
+        self._lock = threading.Lock()
+        self.versao = None  # storage.data_version refletida pelo índice
+        self.marca = None   # instante até o qual o diário de alterações já está refletido
+
+    def rebuild(self, df, versao=None, marca=None):
+        """Recalcula o índice inteiro a partir de `df` (histórico completo).
+
+        `marca` é o instante anterior à leitura de `df`: as entradas do diário
+        posteriores a ela são aplicadas depois por apply_entries.
+        """
+        linhas, ids_placa = {}, {}
+        if not df.empty:
+            ids = df["id"] if "id" in df.columns else pd.Series(df.index, index=df.index)
+            datas = pd.to_datetime(df["data"], errors="coerce")
+            colunas = [
+                df["Placa"].map(_texto), datas.astype(object).where(datas.notna(), None),
+                pd.to_numeric(df["Odometro"], errors="coerce").fillna(0).astype(float),
+                pd.to_numeric(df["KmUso"], errors="coerce").fillna(0).astype(float),
+                pd.to_numeric(df["total_litros"], errors="coerce").fillna(0).astype(float),
+                df["Status"].map(_texto), *(df[col].map(_texto) for col in _ULTIMOS),
+            ]
+            for row_id, *valores in zip(ids.astype(int), *colunas):
+                linhas[row_id] = _Linha(*valores)
+                ids_placa.setdefault(valores[0], set()).add(row_id)
+        estado = {}
+        for placa, ids in ids_placa.items():
+            atual = _estado_de(linhas, ids)
+            if atual is not None:
+                estado[placa] = atual
+        with self._lock:
+            self._estado, self._linhas, self._ids = estado, linhas, ids_placa
+            self.versao, self.marca = versao, marca
+
+    def _recalcular(self, placa):
+        """Refaz o estado de uma placa a partir das requisições dela (chamar sob o lock)."""
+        atual = _estado_de(self._linhas, self._ids.get(placa, ()))
+        if atual is None:
+            self._estado.pop(placa, None)
+        else:
+            self._estado[placa] = atual
+
+    def observe(self, row):
+        """Incorpora uma requisição gravada: nova soma O(1); editada (id já visto) recalcula a placa.
+
+        Uma correção (odômetro digitado errado, litros, posto) substitui a
+        contribuição anterior da requisição em vez de somar outra vez.
+        """
+        linha, row_id = _linha(row), _id(row)
+        with self._lock:
+            anterior = self._linhas.get(row_id) if row_id is not None else None
+            if row_id is not None:
+                self._linhas[row_id] = linha
+                self._ids.setdefault(linha.Placa, set()).add(row_id)
+            if anterior is None:
+                if _conta(linha):
+                    _somar(self._estado.setdefault(linha.Placa, _vazio()), linha)
+                return
+            if anterior.Placa != linha.Placa:
+                self._ids[anterior.Placa].discard(row_id)
+                self._recalcular(anterior.Placa)
+            self._recalcular(linha.Placa)
+
+    def observe_rows(self, rows, versao=None):
+        for row in rows:
+            self.observe(row)
+        if versao is not None:
+            with self._lock:
+                self.versao = versao
+
+    def forget(self, ids, versao=None):
+        """Retira requisições excluídas, recalculando só as placas delas."""
+        with self._lock:
+            for row_id in ids:
+                linha = self._linhas.pop(int(row_id), None)
+                if linha is not None:
+                    self._ids[linha.Placa].discard(int(row_id))
+                    self._recalcular(linha.Placa)
+            if versao is not None:
+                self.versao = versao
+
+    def apply_entries(self, entries, versao=None):
+        """Aplica entradas do diário de alterações (journal.entries) posteriores à marca do índice."""
+        for entrada in entries:
+            for row_id, valores in entrada["linhas"].items():
+                row_id = int(row_id)
+                if entrada["op"] == "inclusao":
+                    self.observe({**valores, "id": row_id})
+                elif entrada["op"] == "exclusao":
+                    self.forget([row_id])
+                else:
+                    with self._lock:
+                        atual = self._linhas.get(row_id)
+                    if atual is not None:
+                        row = atual._asdict()
+                        row.update((col, depois) for col, (_, depois) in valores.items() if col in row)
+                        self.observe({**row, "id": row_id})
+            with self._lock:
+                self.marca = entrada["em"]
+        if versao is not None:
+            with self._lock:
+                self.versao = versao
+
+    def _estado_sessao(self, placa, setores):
+        """Estado da placa (None = todos os setores) ou só das requisições dos shards `setores` (chamar sob o lock)."""
+        if setores is None:
+            return self._estado.get(placa)
+        chaves = {storage.shard_key(s) for s in setores}
+        ids = [i for i in self._ids.get(placa, ()) if storage.shard_key(self._linhas[i].Setor) in chaves]
+        return _estado_de(self._linhas, ids)
+
+    def get(self, placa, setores=None):
+        """Resumo da placa para pré-preencher o formulário, ou None se ela nunca abasteceu.
+
+        Com `setores`, considera só as requisições desses setores (os shards da sessão).
+        """
+        with self._lock:
+            atual = self._estado_sessao(placa, setores)
+            if atual is None:
+                return None
+            return {
+                "ultima_data": atual["data"], "odometro": atual["odometro"] or None,
+                "litros_tipicos": round(atual["litros_soma"] / atual["litros_n"], 1) if atual["litros_n"] else None,
+                "combustivel": atual["combustiveis"].most_common(1)[0][0] if atual["combustiveis"] else atual["Combustivel"],
+                "posto": atual["postos"].most_common(1)[0][0] if atual["postos"] else atual["Posto"],
+                "ultimo_posto": atual["Posto"], "email_posto": atual["EmailPosto"], "condutor": atual["Condutor"],
+                "setor": atual["Setor"], "subsetor": atual["Subsetor"], "cidade": atual["Cidade"],
+            }
+
+    def check_odometro(self, placa, km, data=None, setores=None):
+        """Mensagem de erro se `km` for impossível para a placa, ou None se for aceitável."""
+        if not km:
+            return None
+        estado = self.get(placa, setores)
+        if estado is None or not estado["odometro"]:
+            return None
+        if km < estado["odometro"]:
+            return (f"O odômetro informado ({km:,.0f} km) é menor que o último registrado para {placa} "
+                    f"({estado['odometro']:,.0f} km).")
+        if estado["ultima_data"] is not None:
+            data = pd.Timestamp(data) if data is not None else pd.Timestamp.today()
+            dias = max((data.normalize() - estado["ultima_data"].normalize()).days, 1)
+            if km - estado["odometro"] > MAX_KM_POR_DIA * dias:
+                return (f"O odômetro informado ({km:,.0f} km) está {km - estado['odometro']:,.0f} km acima do último "
+                        f"registro de {placa} em {dias} dia(s); confira o valor.")
+        return None
+
+
+class PlateTimelines:
+    """Linha do tempo de abastecimentos de cada placa, para a página de detalhe do veículo.
+
+    O histórico (sem canceladas) é ordenado por data uma única vez e agrupado
+    em {placa: posições}; a linha do tempo de uma placa é só o recorte dessas
+    posições, sem filtrar o histórico inteiro, e as últimas `maxsize` placas
+    consultadas ficam prontas num cache LRU. Os DataFrames devolvidos são
+    compartilhados entre sessões: não devem ser alterados.
+    """
+
+    def __init__(self, df, versao=None, maxsize=TIMELINE_CACHE):
+        self.versao = versao
+        placas = df["Placa"].fillna("").astype(str).str.strip()
+        df = df[(placas != "") & (df["Status"].fillna("") != "Cancelada")]
+        base = pd.DataFrame({
+            "Placa": placas[df.index],
+            "data": pd.to_datetime(df["data"], errors="coerce"),
+            "Posto": df["Posto"].map(_texto),
+            "Combustivel": df["Combustivel"].map(_texto),
+            "Condutor": df["Condutor"].map(_texto),
+            "total_litros": pd.to_numeric(df["total_litros"], errors="coerce").fillna(0),
+            "valor_total": pd.to_numeric(df["valor_total"], errors="coerce").fillna(0),
+            "km": pd.concat([pd.to_numeric(df["Odometro"], errors="coerce"),
+                             pd.to_numeric(df["KmUso"], errors="coerce")], axis=1).max(axis=1).fillna(0),
+        })
+        self._base = base.sort_values("data", kind="stable", na_position="first").reset_index(drop=True)
+        self._posicoes = self._base.groupby("Placa", sort=True).indices
+        self.timeline = lru_cache(maxsize=maxsize)(self._timeline)
+
+    def placas(self):
+        """Placas com ao menos um abastecimento, em ordem alfabética."""
+        return sorted(self._posicoes)
+
+    def _timeline(self, placa):
+        """Abastecimentos da placa em ordem de data, com preço por litro, km rodados e km/L.
+
+        km rodados = leitura do odômetro menos a última leitura anterior; km/L
+        divide essa distância pelos litros do abastecimento que a fechou.
+        """
+        posicoes = self._posicoes.get(placa)
+        linha = self._base.iloc[posicoes if posicoes is not None else []].drop(columns="Placa").reset_index(drop=True)
+        km = linha["km"].where(linha["km"] > 0)
+        rodados = km - km.ffill().shift()
+        linha["preco_litro"] = (linha["valor_total"] / linha["total_litros"]).where(linha["total_litros"] > 0)
+        linha["km_rodados"] = rodados.where(rodados > 0)
+        linha["km_por_litro"] = (linha["km_rodados"] / linha["total_litros"]).where(linha["total_litros"] > 0)
+        return linha
+
+    def summary(self, placa):
+        """Totais da placa (requisições, litros, valor, km rodados, km/L, R$/km), ou None sem abastecimentos."""
+        linha = self.timeline(placa)
+        if linha.empty:
+            return None
+        medidos = linha[linha["km_rodados"].notna()]
+        km = float(medidos["km_rodados"].sum())
+        return {
+            "requisicoes": len(linha), "primeira": linha["data"].min(), "ultima": linha["data"].max(),
+            "litros": float(linha["total_litros"].sum()), "valor": float(linha["valor_total"].sum()),
+            "odometro": float(linha["km"].max()) or None, "km_rodados": km,
+            "km_por_litro": km / medidos["total_litros"].sum() if km and medidos["total_litros"].sum() else None,
+            "custo_km": medidos["valor_total"].sum() / km if km else None,
+        }
+
+    def postos(self, placa):
+        """Postos usados pela placa: vezes, litros, valor e preço médio por litro, do mais usado ao menos."""
+        linha = self.timeline(placa)
+        postos = linha[linha["Posto"] != ""].groupby("Posto").agg(
+            vezes=("Posto", "size"), litros=("total_litros", "sum"), valor=("valor_total", "sum"))
+        postos["preco_medio"] = (postos["valor"] / postos["litros"]).where(postos["litros"] > 0)
+        return postos.sort_values(["vezes", "litros"], ascending=False).reset_index()
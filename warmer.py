@@ -0,0 +1,88 @@
+# =========================================================
+# Aquecimento dos caches em segundo plano
+# Uma thread do processo do app recalcula os agregados caros (cubo, modelos,
+# índices, estatísticas das narrativas) na subida e depois de cada gravação,
+# para que a primeira página aberta já encontre o cache pronto. Gravações em
+# rajada são agrupadas (debounce) e gravações de outros processos são
+# percebidas pela versão dos dados.
+# =========================================================
+import threading
+import time
+
+import storage
+import tracing
+
+DEBOUNCE_SECONDS = 2.0    # espera sem novas gravações antes de recalcular
+POLL_SECONDS = 15.0       # intervalo de checagem da versão (gravações de outros processos)
+
+
+class CacheWarmer:
+    """Chama cada tarefa `(nome, func(versao))` sempre que a versão dos dados muda."""
+
+    def __init__(self, tasks, filename=storage.DATA_FILE_PATH, debounce=DEBOUNCE_SECONDS, poll=POLL_SECONDS):
+        self.tasks = list(tasks)
+        self.filename = filename
+        self.debounce = debounce
+        self.poll = poll
+        self.versao = None            # última versão aquecida
+        self.ultimo = {}              # nome -> {"em", "segundos", "erro"}
+        self._pendente = None         # monotonic em que houve a última gravação ainda não aquecida
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Inicia a thread (uma vez); o primeiro aquecimento acontece logo em seguida."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="aquecimento-caches", daemon=True)
+            self._thread.start()
+        return self
+
+    def notify(self):
+        """Avisa que houve gravação: o aquecimento roda após `debounce` segundos sem novas gravações."""
+        with self._lock:
+            self._pendente = time.monotonic()
+        self._wake.set()
+
+    def warm(self, versao=None):
+        """Executa todas as tarefas para `versao` (atual por padrão). Retorna a versão aquecida."""
+        versao = versao if versao is not None else storage.data_version(self.filename)
+        for nome, func in self.tasks:
+            inicio = time.perf_counter()
+            erro = None
+            try:
+                with tracing.trace(f"aquecimento_{nome}"):
+                    func(versao)
+            except Exception as e:  # uma tarefa com erro não impede as demais
+                erro = str(e)
+            self.ultimo[nome] = {"em": time.time(), "segundos": time.perf_counter() - inicio, "erro": erro}
+        self.versao = versao
+        return versao
+
+    def _due(self):
+        """Segundos até o próximo aquecimento pendente, ou None se não há gravação pendente."""
+        with self._lock:
+            if self._pendente is None:
+                return None
+            return max(self._pendente + self.debounce - time.monotonic(), 0.0)
+
+    def _loop(self):
+        while True:
+            with self._lock:
+                self._pendente = None
+            try:
+                if storage.data_version(self.filename) != self.versao:
+                    self.warm()
+            except Exception:
+                pass
+            # Dorme até a próxima checagem; uma gravação avisada encurta a espera
+            # para o fim do debounce, que recomeça a cada novo aviso.
+            espera = self.poll
+            while espera:
+                self._wake.wait(espera)
+                self._wake.clear()
+                espera = self._due()
+
+    def status(self):
+        """Lista de dicts por tarefa para exibir no painel (nome, em, segundos, erro)."""
+        return [{"tarefa": nome, **info} for nome, info in self.ultimo.items()]